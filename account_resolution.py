@@ -0,0 +1,80 @@
+"""
+Cached account-name resolution (name enquiry).
+
+Apps confirm the holder of a destination account before sending money.
+Answers are cached per (bank_code, account_number) in an in-process LRU:
+resolved names for `RESOLVE_TTL_SECONDS`, and accounts the bank says don't
+exist for the shorter `RESOLVE_NEGATIVE_TTL_SECONDS`. Provider errors are
+never cached. Concurrent lookups of the same account share one gateway call.
+"""
+import asyncio
+import os
+
+from cache import TTLCache
+from utils import resolve_monnify_account
+
+RESOLVE_TTL = int(os.getenv("RESOLVE_TTL_SECONDS", str(24 * 3600)))
+RESOLVE_NEGATIVE_TTL = int(os.getenv("RESOLVE_NEGATIVE_TTL_SECONDS", "600"))
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", "50000"))
+RESOLVE_BATCH_MAX = int(os.getenv("RESOLVE_BATCH_MAX", "200"))
+RESOLVE_CONCURRENCY = int(os.getenv("RESOLVE_CONCURRENCY", "10"))
+
+NOT_FOUND = ""  # cached for accounts that don't exist
+
+names = TTLCache(maxsize=RESOLVE_CACHE_SIZE, ttl=RESOLVE_TTL)
+_inflight = {}
+
+
+class ResolutionError(Exception):
+    """The provider could not answer; the lookup may be retried."""
+
+
+def _is_nuban(account_number: str) -> bool:
+    return len(account_number) == 10 and account_number.isdigit()
+
+
+async def _lookup(bank_code, account_number):
+    name = await resolve_monnify_account(account_number, bank_code)
+    if isinstance(name, dict):
+        raise ResolutionError(name["error"])
+    if name is None:
+        names.set((bank_code, account_number), NOT_FOUND, ttl=RESOLVE_NEGATIVE_TTL)
+        return NOT_FOUND
+    names.set((bank_code, account_number), name)
+    return name
+
+
+async def resolve(bank_code: str, account_number: str) -> dict:
+    """Resolve one account. Raises ResolutionError if the provider is unavailable."""
+    result = {"bank_code": bank_code, "account_number": account_number}
+    if not _is_nuban(account_number):
+        return {**result, "valid": False, "account_name": None}
+
+    key = (bank_code, account_number)
+    name = names.get(key)
+    if name is None:
+        if key not in _inflight:
+            _inflight[key] = asyncio.ensure_future(_lookup(bank_code, account_number))
+            _inflight[key].add_done_callback(lambda _: _inflight.pop(key, None))
+        # Shield so one cancelled caller doesn't cancel the lookup for everyone else.
+        name = await asyncio.shield(_inflight[key])
+    return {**result, "valid": name != NOT_FOUND, "account_name": name or None}
+
+
+async def resolve_many(accounts):
+    """Resolve [(bank_code, account_number)], RESOLVE_CONCURRENCY at a time, in input order."""
+    semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+    async def one(bank_code, account_number):
+        async with semaphore:
+            try:
+                return await resolve(bank_code, account_number)
+            except ResolutionError as e:
+                return {"bank_code": bank_code, "account_number": account_number,
+                        "valid": None, "account_name": None, "error": str(e)}
+
+    return await asyncio.gather(*(one(bank_code, account_number) for bank_code, account_number in accounts))
+
+
+def stats():
+    return {**names.stats(), "inflight": len(_inflight)}
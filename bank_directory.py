@@ -0,0 +1,145 @@
+"""
+Cached Monnify bank directory.
+
+The bank list changes rarely, so it is served from memory and refreshed in
+the background once it is older than `BANKS_TTL_SECONDS` (stale-while-
+revalidate). The last good copy is persisted to `bank_directory`, so a fresh
+worker starts warm and the endpoint keeps answering while Monnify is down.
+The JSON body and its ETag are computed once per refresh, not per request.
+
+After a failed refresh no background refresh is tried for
+`BANKS_REFRESH_BACKOFF_SECONDS`; the stale copy is served meanwhile, so an
+outage doesn't cost an upstream call per request.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from database import get_db
+from utils import get_all_banks
+
+BANKS_TTL = timedelta(seconds=int(os.getenv("BANKS_TTL_SECONDS", str(6 * 3600))))
+BANKS_REFRESH_BACKOFF = timedelta(seconds=int(os.getenv("BANKS_REFRESH_BACKOFF_SECONDS", "60")))
+
+_DOC_ID = "monnify"
+
+
+class BankDirectoryUnavailable(Exception):
+    """No copy of the directory is cached and Monnify could not be reached."""
+
+
+async def fetch_banks():
+    banks = await get_all_banks()
+    if isinstance(banks, dict) and "error" in banks:
+        raise BankDirectoryUnavailable(banks["error"])
+    return banks
+
+
+class BankDirectory:
+    def __init__(self, fetch_banks, ttl=BANKS_TTL, refresh_backoff=BANKS_REFRESH_BACKOFF, clock=datetime.utcnow):
+        self._fetch_banks = fetch_banks
+        self._ttl = ttl
+        self._refresh_backoff = refresh_backoff
+        self._clock = clock
+        self._entry = None
+        self._loaded = False
+        self._refresh_task = None
+        self._last_failed_at = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    async def get(self):
+        """Return `{"banks", "body", "etag", "fetched_at"}`, fetching only if nothing is cached."""
+        if not self._loaded:
+            await self.load()
+        if self._entry is None:
+            return await self._refresh()
+
+        if self._clock() - self._entry["fetched_at"] >= self._ttl:
+            self.stale_hits += 1
+            self._refresh_in_background()
+        else:
+            self.hits += 1
+        return self._entry
+
+    async def load(self):
+        """Warm the in-memory copy from Mongo. Never calls Monnify."""
+        doc = await get_db()["bank_directory"].find_one({"_id": _DOC_ID})
+        if doc and (self._entry is None or doc["fetched_at"] > self._entry["fetched_at"]):
+            self._entry = self._make_entry(doc["banks"], doc["fetched_at"])
+        self._loaded = True
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_failed_at": self._last_failed_at,
+            "age_seconds": (self._clock() - self._entry["fetched_at"]).total_seconds() if self._entry else None,
+        }
+
+    @staticmethod
+    def _make_entry(banks, fetched_at):
+        body = json.dumps(banks, separators=(",", ":"), sort_keys=True).encode()
+        return {
+            "banks": banks,
+            "body": body,
+            "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+            "fetched_at": fetched_at,
+        }
+
+    async def _refresh(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._do_refresh())
+        # Shield so one cancelled caller doesn't cancel the refresh for everyone else.
+        return await asyncio.shield(self._refresh_task)
+
+    def _refresh_in_background(self):
+        if self._refresh_task is not None:
+            return
+        if self._last_failed_at and self._clock() - self._last_failed_at < self._refresh_backoff:
+            return  # Monnify failed recently; keep serving the stale copy until the backoff passes.
+        self._refresh_task = asyncio.ensure_future(self._do_refresh())
+        self._refresh_task.add_done_callback(self._log_background_failure)
+
+    @staticmethod
+    def _log_background_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Background bank directory refresh failed, serving last good copy: %s", task.exception())
+
+    async def _do_refresh(self):
+        try:
+            # Another worker may already have refreshed the shared copy.
+            await self.load()
+            if self._entry and self._clock() - self._entry["fetched_at"] < self._ttl:
+                return self._entry
+
+            try:
+                banks = await self._fetch_banks()
+            except Exception:
+                # The previous entry (if any) stays in place and keeps being served.
+                self.failures += 1
+                self._last_failed_at = self._clock()
+                raise
+            self._last_failed_at = None
+            fetched_at = self._clock()
+            self._entry = self._make_entry(banks, fetched_at)
+            self.refreshes += 1
+            await get_db()["bank_directory"].update_one(
+                {"_id": _DOC_ID},
+                {"$set": {"banks": banks, "etag": self._entry["etag"], "fetched_at": fetched_at}},
+                upsert=True,
+            )
+            return self._entry
+        finally:
+            self._refresh_task = None
+
+
+directory = BankDirectory(fetch_banks)
@@ -0,0 +1,82 @@
+"""
+Cost of account-name resolution.
+
+Against the stub gateway, resolves `--lookups` (bank, account) pairs spread
+over `--accounts` distinct accounts, a tenth of them invalid: straight to
+Monnify per lookup (the cost without a cache), through the resolver from
+cold, and again once warm. Finishes with one batch request of `--batch`
+accounts. Reports per-lookup latency and how many name enquiries reached the
+gateway.
+
+Usage:
+    python benchmarks/bench_account_resolution.py --lookups 2000 --accounts 100 --latency-ms 150
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8906
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import account_resolution  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from gateway import close_gateways  # noqa: E402
+from utils import resolve_monnify_account  # noqa: E402
+
+
+async def timed(label, lookups, resolve, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(bank_code, account_number):
+        async with semaphore:
+            started = time.perf_counter()
+            await resolve(bank_code, account_number)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*lookup) for lookup in lookups))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<24} {elapsed:7.2f}s  ({len(lookups) / elapsed:9.1f} lookups/s, "
+          f"median {statistics.median(latencies) * 1e6:9.1f}us)")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    # The stub treats account numbers starting with 99 as non-existent.
+    accounts = [("058", f"{'99' if i % 10 == 0 else '01'}{i:08d}") for i in range(args.accounts)]
+    lookups = [random.choice(accounts) for _ in range(args.lookups)]
+    with StubGatewayServer(port=PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+        try:
+            uncached = random.sample(lookups, min(len(lookups), 200))
+            await timed("gateway per lookup", uncached,
+                        lambda bank_code, account_number: resolve_monnify_account(account_number, bank_code),
+                        args.concurrency)
+            await timed("resolver, cold", lookups, account_resolution.resolve, args.concurrency)
+            await timed("resolver, warm", lookups, account_resolution.resolve, args.concurrency)
+
+            account_resolution.names.clear()
+            started = time.perf_counter()
+            results = await account_resolution.resolve_many(random.sample(accounts, min(args.batch, len(accounts))))
+            print(f"batch of {len(results)} (cold)     {time.perf_counter() - started:7.2f}s  "
+                  f"({sum(1 for result in results if result['valid'] is False)} invalid)")
+            print(f"cache: {account_resolution.stats()}")
+        finally:
+            await close_gateways()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Hammer one wallet with parallel debits and credits.
+
+Compares the old read-modify-write pattern (`find_one` then `$set`) against the
+atomic engine in `wallet.py`. For each strategy it reports throughput, the
+final balance against the expected balance (lost updates), and whether the
+wallet was ever overdrawn.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_balance_engine.py --operations 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import wallet  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+OPENING_BALANCE = 1_000.0
+
+
+async def read_modify_write(users, user_id, amount):
+    user = await users.find_one({"_id": user_id})
+    new_balance = user["wallet_balance"] + amount
+    if new_balance < 0:
+        return False
+    await users.update_one({"_id": user_id}, {"$set": {"wallet_balance": new_balance}})
+    return True
+
+
+async def atomic(users, user_id, amount):
+    if amount < 0:
+        return await wallet.debit(users, {"_id": user_id}, -amount) is not None
+    return await wallet.credit(users, {"_id": user_id}, amount) is not None
+
+
+async def run(strategy, users, operations, concurrency):
+    user_id = (await users.insert_one({"name": "bench", "wallet_balance": OPENING_BALANCE})).inserted_id
+    amounts = [random.choice((-10.0, -5.0, 5.0, 10.0)) for _ in range(operations)]
+    semaphore = asyncio.Semaphore(concurrency)
+    applied = []
+    lowest = [OPENING_BALANCE]
+
+    async def one(amount):
+        async with semaphore:
+            if await strategy(users, user_id, amount):
+                applied.append(amount)
+                balance = (await users.find_one({"_id": user_id}, {"wallet_balance": 1}))["wallet_balance"]
+                lowest[0] = min(lowest[0], balance)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(amount) for amount in amounts))
+    elapsed = time.perf_counter() - started
+
+    final = (await users.find_one({"_id": user_id}))["wallet_balance"]
+    expected = OPENING_BALANCE + sum(applied)
+    return elapsed, final, expected, lowest[0]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--operations", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    users = database.get_client()[BENCH_DB]["users"]
+    try:
+        for label, strategy in (("read-modify-write", read_modify_write), ("atomic $inc", atomic)):
+            elapsed, final, expected, lowest = await run(strategy, users, args.operations, args.concurrency)
+            print(f"{label:<18} {args.operations / elapsed:9.1f} ops/s  final {final:10.2f}  "
+                  f"expected {expected:10.2f}  lost {expected - final:+10.2f}  lowest seen {lowest:9.2f}")
+    finally:
+        await database.get_client().drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
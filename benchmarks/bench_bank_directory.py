@@ -0,0 +1,90 @@
+"""
+Bank list latency: fetching from Monnify per request vs the cached directory.
+
+Boots the stub gateway (Monnify is pointed at it) and the app on a scratch
+database, then times:
+  * `utils.get_all_banks()` per call (the old request path),
+  * `GET /banking/banks/` served from the directory cache,
+  * the same with `If-None-Match`, which returns a bodyless 304,
+  * the cached endpoint after the stub is shut down, to show the last good
+    copy keeps being served.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_bank_directory.py --requests 500 --latency-ms 80
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8901
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from main import app  # noqa: E402
+from utils import get_all_banks  # noqa: E402
+
+
+def report(label, latencies, sizes=None):
+    latencies = sorted(latencies)
+    line = (f"{label:<30} mean {statistics.mean(latencies) * 1000:8.2f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:8.2f} ms")
+    if sizes is not None:
+        line += f"  {statistics.mean(sizes):8.0f} bytes/response"
+    print(line)
+
+
+async def timed(total, call):
+    latencies, sizes = [], []
+    for _ in range(total):
+        t0 = time.perf_counter()
+        size = await call()
+        latencies.append(time.perf_counter() - t0)
+        sizes.append(size)
+    return latencies, sizes
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+                async def cached(headers=None):
+                    response = await http.get("/banking/banks/", headers=headers)
+                    assert response.status_code in (200, 304), response.status_code
+                    return len(response.content)
+
+                with StubGatewayServer(port=PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+                    async def direct():
+                        banks = await get_all_banks()
+                        assert "error" not in banks
+                        return 0
+
+                    report("get_all_banks() per request", (await timed(args.requests, direct))[0])
+                    etag = (await http.get("/banking/banks/")).headers["etag"]
+                    report("cached /banks/", *await timed(args.requests, cached))
+                    report("cached /banks/ If-None-Match",
+                           *await timed(args.requests, lambda: cached({"If-None-Match": etag})))
+
+                report("cached /banks/, Monnify down", *await timed(args.requests, cached))
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Payroll run: N sequential single transfers vs one batch.
+
+Boots the stub gateway (with per-call latency and a requests-per-second cap
+that answers 429, like the real provider) and the app on a scratch database
+with one funded user. Sends `--transfers` transfers one HTTP call at a time
+to `/banking/monnify/transfer/`, then the same transfers as a single
+`/banking/monnify/transfer/batch/` call, polling until the batch finishes.
+Reports wall time for each and how many calls the stub rate-limited.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 SECRET_KEY=bench \\
+        python benchmarks/bench_batch_transfer.py --transfers 300 --latency-ms 400 --rate-limit 25
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8903
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from main import app  # noqa: E402
+from utils import create_access_token  # noqa: E402
+
+
+def transfer(i):
+    return {"amount": 100.0, "destination_bank_code": "058",
+            "destination_account_number": f"{i:010d}", "narration": f"salary {i}"}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=400)
+    parser.add_argument("--rate-limit", type=int, default=25)
+    args = parser.parse_args()
+
+    settings = StubSettings(latency_ms=args.latency_ms, rate_limit=args.rate_limit)
+    with StubGatewayServer(port=PORT, settings=settings) as stub:
+        async with app.router.lifespan_context(app):
+            db = database.get_db()
+            try:
+                result = await db["users"].insert_one({
+                    "name": "Payroll", "email": "payroll@example.com", "account_number": "9999999999",
+                    "wallet_balance": args.transfers * 200.0, "is_admin": False,
+                })
+                headers = {"Authorization": f"Bearer {create_access_token({'user_id': str(result.inserted_id)})}"}
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers,
+                                             timeout=None) as http:
+                    started = time.perf_counter()
+                    failed = 0
+                    for i in range(args.transfers):
+                        item = transfer(i)
+                        response = await http.post("/banking/monnify/transfer/", params={
+                            "amount": item["amount"], "destination_bank_code": item["destination_bank_code"],
+                            "destination_account_number": item["destination_account_number"],
+                            "narration": item["narration"],
+                        })
+                        failed += response.status_code != 200
+                    sequential = time.perf_counter() - started
+                    print(f"sequential: {args.transfers} transfers in {sequential:.1f}s ({failed} failed)")
+
+                    started = time.perf_counter()
+                    response = await http.post("/banking/monnify/transfer/batch/",
+                                               json={"transfers": [transfer(i) for i in range(args.transfers)]})
+                    response.raise_for_status()
+                    batch_id = response.json()["batch_id"]
+                    while True:
+                        status = (await http.get(f"/banking/monnify/transfer/batch/{batch_id}")).json()
+                        if status["status"] not in ("queued", "running"):
+                            break
+                        await asyncio.sleep(0.1)
+                    batched = time.perf_counter() - started
+                    print(f"batch:      {args.transfers} transfers in {batched:.1f}s, "
+                          f"{status['status']} {status['counts']}  ({sequential / batched:.1f}x faster)")
+                    print(f"stub rate-limited calls: {stub_rate_limited(stub)}")
+            finally:
+                await database.get_client().drop_database(BENCH_DB)
+
+
+def stub_rate_limited(stub):
+    # The stub runs in a child process; ask it over HTTP.
+    return httpx.get(f"{stub.url}/_stats").json().get("rate_limited")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
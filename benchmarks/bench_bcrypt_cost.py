@@ -0,0 +1,62 @@
+"""
+bcrypt cost factor vs hashing time and pool throughput.
+
+For each `--rounds` value, times single hashes/verifications and then the
+verification throughput of a `passwords.PasswordHasher` pool, to pick a
+BCRYPT_ROUNDS that fits the login budget on this hardware.
+
+Usage:
+    python benchmarks/bench_bcrypt_cost.py --rounds 10 11 12 13 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from passlib.context import CryptContext
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher  # noqa: E402
+
+
+def time_calls(fn, samples):
+    timings = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1000
+
+
+async def pool_throughput(hasher, hashed, total):
+    started = time.perf_counter()
+    await asyncio.gather(*(hasher.verify_and_update("correct horse", hashed) for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    for rounds in args.rounds:
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        hashed = context.hash("correct horse")
+        hash_ms = time_calls(lambda: context.hash("correct horse"), args.samples)
+        verify_ms = time_calls(lambda: context.verify("correct horse", hashed), args.samples)
+        hasher = PasswordHasher(context, workers=args.workers, max_pending=args.samples * args.workers)
+        try:
+            rate = await pool_throughput(hasher, hashed, args.samples * args.workers)
+        finally:
+            hasher.shutdown()
+        print(f"rounds={rounds:<3} hash {hash_ms:8.1f} ms  verify {verify_ms:8.1f} ms  "
+              f"pool of {args.workers}: {rate:8.1f} logins/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
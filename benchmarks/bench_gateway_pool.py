@@ -0,0 +1,84 @@
+"""
+Gateway call latency and throughput: per-call `requests` vs the pooled GatewayClient.
+
+Boots the stub gateway locally and issues the same disbursement call three ways:
+  * `requests.post` per call (new TCP connection every time, blocks the loop),
+  * the pooled `gateway.GatewayClient` one call at a time,
+  * the pooled client with `--concurrency` calls in flight.
+
+Usage:
+    python benchmarks/bench_gateway_pool.py --requests 500 --concurrency 50 --latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gateway import GatewayClient  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+
+PATH = "/api/v2/disbursements/single"
+PAYLOAD = {"amount": "100.00", "reference": "BENCH", "destinationBankCode": "001",
+           "destinationAccountNumber": "0123456789", "currency": "NGN", "narration": "bench"}
+
+
+def report(label, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<32} {len(latencies) / elapsed:9.1f} req/s  "
+          f"mean {statistics.mean(latencies) * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms")
+
+
+async def bench_requests(base_url, total):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(total):
+        t0 = time.perf_counter()
+        requests.post(base_url + PATH, json=PAYLOAD).raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+
+async def bench_pooled(client, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await client.post(PATH, json=PAYLOAD)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return latencies, time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=8900)
+    args = parser.parse_args()
+
+    with StubGatewayServer(port=args.port, settings=StubSettings(latency_ms=args.latency_ms)) as stub:
+        client = GatewayClient("bench", stub.url)
+        try:
+            report("requests, new conn per call", *await bench_requests(stub.url, args.requests))
+            report("pooled httpx, sequential", *await bench_pooled(client, args.requests, 1))
+            report(f"pooled httpx, concurrency={args.concurrency}",
+                   *await bench_pooled(client, args.requests, args.concurrency))
+        finally:
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Gateway behaviour while one provider is failing.
+
+Runs a healthy Monnify stub and a Paystack stub that is either down
+(`--paystack-mode errors`: every call 503s) or browned out (`--paystack-mode
+slow`: every call takes `--slow-ms`). Fires `--calls` Paystack verifications
+all at once (a pile-up) alongside the same number of Monnify name enquiries
+at `--concurrency`, and reports per-provider
+latency, how calls ended, and the resilience counters, once with the guards
+effectively disabled and once with the defaults.
+
+Usage:
+    python benchmarks/bench_gateway_resilience.py --paystack-mode errors --calls 500
+    python benchmarks/bench_gateway_resilience.py --paystack-mode slow --slow-ms 5000 --calls 300
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONNIFY_PORT, PAYSTACK_PORT = 8907, 8908
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{MONNIFY_PORT}")
+os.environ.setdefault("PAYSTACK_GATEWAY_URL", f"http://127.0.0.1:{PAYSTACK_PORT}")
+
+import gateway  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from resilience import Bulkhead, CircuitBreaker, RetryPolicy  # noqa: E402
+from utils import resolve_monnify_account, verify_paystack_transfer  # noqa: E402
+
+
+def unguarded(client):
+    client.breaker = CircuitBreaker(client.name, min_calls=10 ** 9)
+    client.bulkhead = Bulkhead(client.name, 10 ** 6)
+    client.retry = RetryPolicy(retries=0)
+
+
+def guarded(client):
+    fresh = gateway.GatewayClient(client.name, client.base_url)
+    client.breaker, client.bulkhead, client.retry = fresh.breaker, fresh.bulkhead, fresh.retry
+
+
+async def timed(call, semaphore=None):
+    if semaphore is not None:
+        async with semaphore:
+            return await timed(call)
+    started = time.perf_counter()
+    result = await call
+    return time.perf_counter() - started, result
+
+
+def report(label, results, ok):
+    latencies = sorted(latency for latency, _ in results)
+    failed = sum(1 for _, result in results if not ok(result))
+    print(f"  {label:<9} p50 {statistics.median(latencies) * 1000:8.1f}ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:8.1f}ms  failed {failed}/{len(results)}")
+
+
+async def run(label, configure, calls, concurrency):
+    for client in (gateway.monnify, gateway.paystack):
+        configure(client)
+    paystack = [timed(verify_paystack_transfer(f"TRF_{i}")) for i in range(calls)]
+    semaphore = asyncio.Semaphore(concurrency)
+    monnify = [timed(resolve_monnify_account(f"01{i:08d}", "058"), semaphore) for i in range(calls)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*paystack, *monnify)
+    print(f"{label} ({time.perf_counter() - started:.2f}s)")
+    report("paystack", results[:calls], lambda result: "error" not in result)
+    report("monnify", results[calls:], lambda result: not isinstance(result, dict))
+    print(f"  stats     {gateway.gateway_stats()['paystack']}")
+    await gateway.close_gateways()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--paystack-mode", choices=["errors", "slow"], default="errors")
+    parser.add_argument("--slow-ms", type=float, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)  # every failed Paystack call logs otherwise
+
+    if args.paystack_mode == "errors":
+        broken = StubSettings(latency_ms=args.latency_ms, error_rate=1.0)
+    else:
+        broken = StubSettings(latency_ms=args.slow_ms)
+    with StubGatewayServer(port=MONNIFY_PORT, settings=StubSettings(latency_ms=args.latency_ms)), \
+            StubGatewayServer(port=PAYSTACK_PORT, settings=broken):
+        await run("no breaker / bulkhead / retries", unguarded, args.calls, args.concurrency)
+        await run("resilience defaults", guarded, args.calls, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Cost of replaying a transfer by Idempotency-Key.
+
+Runs `--keys` distinct "transfers" through `idempotency.run` with a handler
+that sleeps for `--gateway-ms` (standing in for the provider round trip),
+then replays every key `--retries` times: first from the in-process LRU, then
+with the LRU cleared so each replay is a single _id lookup in Mongo. Also
+fires a burst of concurrent duplicates at one key and checks the handler ran
+exactly once.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_idempotency.py --keys 2000 --retries 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import idempotency  # noqa: E402
+import indexes  # noqa: E402
+
+
+async def timed(keys, fingerprint, handler):
+    timings = []
+    for key in keys:
+        t0 = time.perf_counter()
+        await idempotency.run("bench-user", key, fingerprint, handler)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--gateway-ms", type=float, default=50)
+    parser.add_argument("--burst", type=int, default=500)
+    args = parser.parse_args()
+
+    calls = 0
+
+    async def handler():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(args.gateway_ms / 1000)
+        return {"message": "Transfer initiated", "reference": f"TRANSFER_{calls}"}
+
+    db = database.get_db()
+    await indexes.ensure_indexes(db, idempotency.INDEXES)
+    fingerprint = idempotency.fingerprint(amount=100, bank_code="058", account_number="0123456789")
+    keys = [f"key-{i}" for i in range(args.keys)]
+    try:
+        first = await timed(keys, fingerprint, handler)
+        lru = await timed(keys * args.retries, fingerprint, handler)
+        idempotency.responses.clear()
+        stored = await timed(keys, fingerprint, handler)
+        print(f"first request   median {first[0]:8.3f} ms max {first[1]:8.3f} ms")
+        print(f"replay (LRU)    median {lru[0]:8.3f} ms max {lru[1]:8.3f} ms")
+        print(f"replay (Mongo)  median {stored[0]:8.3f} ms max {stored[1]:8.3f} ms")
+        print(f"handler calls {calls} for {args.keys} keys ({'OK' if calls == args.keys else 'DUPLICATED'})")
+
+        calls = 0
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(
+            idempotency.run("bench-user", "burst", fingerprint, handler) for _ in range(args.burst)
+        ))
+        elapsed = time.perf_counter() - t0
+        replayed = sum(1 for _, was_replayed in results if was_replayed)
+        print(f"burst of {args.burst} concurrent duplicates in {elapsed * 1000:.1f} ms: "
+              f"handler calls {calls}, replayed {replayed}")
+    finally:
+        await database.get_client().drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
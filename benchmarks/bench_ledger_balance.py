@@ -0,0 +1,90 @@
+"""
+Balance-at-time query cost against history size.
+
+For each history size, journals that many deposits into a fresh wallet and
+times `ledger.balance_at` at random points in time, once with no snapshots
+(full history aggregation) and once with a snapshot every
+`LEDGER_SNAPSHOT_EVERY` entries.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_ledger_balance.py --sizes 1000 10000 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+import ledger  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+INSERT_BATCH = 5000
+
+
+async def seed(db, account, size, start):
+    entries = []
+    for i in range(size):
+        created_at = start + timedelta(seconds=i)
+        entries += ledger.journal_entries(f"{account}:{i}", "provider:bench", account, 100, "deposit",
+                                          created_at=created_at)
+        if len(entries) >= INSERT_BATCH:
+            await db["ledger_entries"].insert_many(entries)
+            entries = []
+    if entries:
+        await db["ledger_entries"].insert_many(entries)
+
+
+async def take_snapshots(db, account, size, start):
+    """Snapshot the account every SNAPSHOT_EVERY entries, as posting would have."""
+    for i in range(ledger.SNAPSHOT_EVERY - 1, size, ledger.SNAPSHOT_EVERY):
+        as_of = start + timedelta(seconds=i)
+        last = await db["ledger_entries"].find_one({"account": account, "created_at": as_of})
+        await db["ledger_snapshots"].insert_one({
+            "account": account, "as_of": as_of, "last_entry_id": last["_id"],
+            "balance": (i + 1) * 100, "created_at": datetime.utcnow(),
+        })
+
+
+async def time_queries(db, account, size, start, samples):
+    timings = []
+    for _ in range(samples):
+        at = start + timedelta(seconds=random.randint(0, size - 1))
+        t0 = time.perf_counter()
+        await ledger.balance_at(db, account, at)
+        timings.append(time.perf_counter() - t0)
+    return statistics.median(timings) * 1000, max(timings) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+
+    client = database.get_client()
+    db = client[BENCH_DB]
+    await indexes.ensure_indexes(db, ledger.INDEXES)
+    start = datetime(2024, 1, 1)
+    try:
+        for size in args.sizes:
+            account = f"wallet:bench-{size}"
+            await seed(db, account, size, start)
+            full = await time_queries(db, account, size, start, args.samples)
+            await take_snapshots(db, account, size, start)
+            snap = await time_queries(db, account, size, start, args.samples)
+            print(f"{size:>9} entries   no snapshots: median {full[0]:8.2f} ms max {full[1]:8.2f} ms   "
+                  f"snapshots: median {snap[0]:8.2f} ms max {snap[1]:8.2f} ms")
+    finally:
+        await client.drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
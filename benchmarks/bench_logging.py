@@ -0,0 +1,121 @@
+"""
+Request latency with logging off, the old synchronous logging, and the queue logger.
+
+Serves one in-process endpoint that logs like the transfer path does: a
+request line with the user, amount and account, the provider payload and the
+provider response. Three variants:
+
+* off: records below LOG_LEVEL (the payloads are DEBUG, the rest dropped too);
+* sync: the previous style, `basicConfig` to a stream, f-strings,
+  `json.dumps(payload, indent=2)` and full responses at INFO;
+* queue: `logs.configure()` with lazy %-style messages, payloads as sampled
+  DEBUG events, JSON formatting and redaction on the listener thread.
+
+Output goes to a temporary file so the disk write is part of the cost.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import logs  # noqa: E402
+
+PAYLOAD = {
+    "amount": "2500.00", "destinationAccountNumber": "0123456789", "destinationBankCode": "058",
+    "currency": "NGN", "narration": "Salary", "reference": "TRANSFER_6650f0c2b1e4a5d3c2b1a0f9",
+    "sourceAccountNumber": "9876543210",
+}
+RESPONSE = {"requestSuccessful": True, "responseMessage": "success", "responseBody": {
+    **PAYLOAD, "status": "SUCCESS", "transactionReference": "MFDS20240524093012AB12CD34",
+}}
+
+
+def sync_style(user_id):
+    logging.info(f"Transfer request received for user: {user_id}, amount: 2500.0, bank: 058, account: 0123456789")
+    logging.info("Monnify Transfer Request Payload:")
+    logging.info(json.dumps(PAYLOAD, indent=2))
+    logging.info(f"Full Response Text: {json.dumps(RESPONSE)}")
+    logging.info(f"Parsed Response Data: {RESPONSE}")
+
+
+def queue_style(user_id):
+    logging.info("Transfer request received for user: %s, amount: %s, bank: %s, account: %s",
+                 user_id, 2500.0, "058", "0123456789")
+    logging.debug("Monnify transfer request", extra={"event": "monnify.transfer.request", "payload": PAYLOAD})
+    logging.debug("Monnify transfer response", extra={"event": "monnify.transfer.response", "response": RESPONSE})
+
+
+def build_app(log):
+    app = FastAPI()
+
+    @app.post("/transfer")
+    async def transfer():
+        log("6650f0c2b1e4a5d3c2b1a0f8")
+        return {"ok": True}
+
+    return app
+
+
+def reset_root():
+    logs.shutdown()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+
+async def measure(app, requests):
+    latencies = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(200):
+            await client.post("/transfer")
+        for _ in range(requests):
+            started = time.perf_counter()
+            await client.post("/transfer")
+            latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--level", default="INFO", help="level for the queue variant (DEBUG shows sampling cost)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+
+        reset_root()
+        logging.basicConfig(level=logging.CRITICAL, stream=open(os.path.join(tmp, "off.log"), "w"))
+        results["off"] = await measure(build_app(queue_style), args.requests)
+
+        reset_root()
+        logging.basicConfig(level=logging.INFO, stream=open(os.path.join(tmp, "sync.log"), "w"))
+        results["sync"] = await measure(build_app(sync_style), args.requests)
+
+        reset_root()
+        logs.configure(level=args.level, stream=open(os.path.join(tmp, "queue.log"), "w"))
+        results["queue"] = await measure(build_app(queue_style), args.requests)
+        logs.shutdown()
+
+        for name, (p50, p99) in results.items():
+            size = os.path.getsize(os.path.join(tmp, f"{name}.log"))
+            print(f"{name:<6} p50 {p50 * 1e6:8.1f}us  p99 {p99 * 1e6:8.1f}us  log bytes {size:>10}")
+        print(f"records dropped by the queue logger: {logs.dropped}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Latency of unrelated endpoints during a burst of logins.
+
+Boots the app on a scratch database with one seeded user, then keeps a probe
+requesting `GET /banking/transactions/{user_id}` while `--logins` login
+requests arrive `--concurrency` at a time. Runs twice: with bcrypt inline on
+the event loop (the old behaviour) and on the `passwords` pool. Reports the
+probe's p50/p99 and how many logins were shed with 429.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_login_storm.py --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import passwords  # noqa: E402
+from main import app  # noqa: E402
+from utils import pwd_context  # noqa: E402
+
+EMAIL = "storm@example.com"
+PASSWORD = "correct horse battery staple"
+
+
+async def run_storm(http, user_id, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = []
+    probes = []
+    done = asyncio.Event()
+
+    async def login():
+        async with semaphore:
+            response = await http.post("/auth/login/", data={"username": EMAIL, "password": PASSWORD})
+            statuses.append(response.status_code)
+
+    async def probe():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            (await http.get(f"/banking/transactions/{user_id}")).raise_for_status()
+            probes.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.005)
+
+    prober = asyncio.create_task(probe())
+    await asyncio.gather(*(login() for _ in range(logins)))
+    done.set()
+    await prober
+    probes.sort()
+    return probes, statuses
+
+
+def report(label, probes, statuses):
+    print(f"{label:<22} probe p50 {probes[len(probes) // 2] * 1000:8.2f} ms  "
+          f"p99 {probes[int(len(probes) * 0.99)] * 1000:8.2f} ms  "
+          f"logins ok {statuses.count(200)}  shed {statuses.count(429)}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        db = database.get_db()
+        try:
+            result = await db["users"].insert_one({
+                "email": EMAIL, "password": pwd_context.hash(PASSWORD), "wallet_balance": 0.0,
+            })
+            user_id = str(result.inserted_id)
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+                pooled_run = passwords.hasher._run
+
+                async def inline_run(fn, *fn_args):
+                    return fn(*fn_args)
+
+                passwords.hasher._run = inline_run
+                report("bcrypt on event loop", *await run_storm(http, user_id, args.logins, args.concurrency))
+                passwords.hasher._run = pooled_run
+                report("bcrypt on pool", *await run_storm(http, user_id, args.logins, args.concurrency))
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Per-request cost of the Prometheus instrumentation.
+
+Serves a trivial endpoint, registered after the service's real routers,
+through two in-process apps, with and without `MetricsMiddleware`, and
+reports the difference per request. Also times the gateway histogram and the Mongo
+command listener callbacks in isolation, and one full /metrics render.
+
+Usage:
+    python benchmarks/bench_metrics_overhead.py --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+import metrics  # noqa: E402
+from routes.auth_routes import router as auth_router  # noqa: E402
+from routes.banking_routes import router as banking_router  # noqa: E402
+
+
+def build_app(instrumented):
+    app = FastAPI()
+    app.include_router(auth_router, prefix="/auth")
+    app.include_router(banking_router, prefix="/banking")
+
+    # Registered last, so the router walks every other route first (the worst case).
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if instrumented:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+
+async def per_request(app, requests):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(200):
+            await client.get("/ping")
+        started = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/ping")
+        return (time.perf_counter() - started) / requests
+
+
+def per_call(func, calls):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    plain = await per_request(build_app(False), args.requests)
+    instrumented = await per_request(build_app(True), args.requests)
+    print(f"request, no metrics          {plain * 1e6:8.1f}us")
+    print(f"request, with middleware     {instrumented * 1e6:8.1f}us  (+{(instrumented - plain) * 1e6:.1f}us)")
+
+    print(f"gateway observation          {per_call(lambda: metrics.observe_gateway('monnify', '2xx', 0.1), 100000) * 1e6:8.2f}us")
+    started = SimpleNamespace(command_name="find", command={"find": "transactions"}, database_name="bench",
+                              connection_id=("localhost", 27017), request_id=1)
+    succeeded = SimpleNamespace(command_name="find", duration_micros=850,
+                                connection_id=("localhost", 27017), request_id=1)
+
+    def mongo_command():
+        metrics.mongo_listener.started(started)
+        metrics.mongo_listener.succeeded(succeeded)
+    print(f"mongo listener (start+end)   {per_call(mongo_command, 100000) * 1e6:8.2f}us")
+    print(f"/metrics render              {per_call(metrics.render, 200) * 1e3:8.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Concurrent-request throughput: blocking pymongo vs Motor inside async handlers.
+
+Two endpoints perform the same `users.find_one` lookup the auth dependency does,
+one through the old synchronous MongoClient and one through the Motor client
+from `database.py`. Requests are driven concurrently through an in-process ASGI
+transport so the only difference is whether the event loop is blocked.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_motor_concurrency.py --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+
+
+def build_app(sync_users, async_users, user_id):
+    app = FastAPI()
+
+    @app.get("/sync")
+    async def sync_lookup():
+        user = sync_users.find_one({"_id": user_id})
+        return {"ok": user is not None}
+
+    @app.get("/async")
+    async def async_lookup():
+        user = await async_users.find_one({"_id": user_id})
+        return {"ok": user is not None}
+
+    return app
+
+
+async def drive(app, path, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def one():
+            async with semaphore:
+                response = await http.get(path)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    sync_client = MongoClient(database.MONGO_URI)
+    sync_users = sync_client[BENCH_DB]["users"]
+    async_users = database.get_client()[BENCH_DB]["users"]
+
+    user_id = sync_users.insert_one({"name": "bench", "email": "bench@example.com", "wallet_balance": 0.0}).inserted_id
+    app = build_app(sync_users, async_users, user_id)
+
+    try:
+        for label, path in (("pymongo (blocking)", "/sync"), ("motor", "/async")):
+            elapsed = await drive(app, path, args.requests, args.concurrency)
+            print(f"{label:<20} {args.requests / elapsed:10.1f} req/s  ({elapsed:.2f}s for {args.requests} requests)")
+    finally:
+        sync_client.drop_database(BENCH_DB)
+        sync_client.close()
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""
+Authenticated request overhead with and without the principal cache.
+
+Boots the app on a scratch database with one seeded user and times
+`GET /auth/users/me/` (which does nothing but authenticate) with the token
+and principal caches disabled (JWT decode + users lookup per request, the
+old path) and enabled.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 SECRET_KEY=bench python benchmarks/bench_principal_cache.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import principals  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from main import app  # noqa: E402
+from utils import create_access_token  # noqa: E402
+
+
+async def timed(http, token, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await http.get("/auth/users/me/", headers={"Authorization": f"Bearer {token}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return total / elapsed, statistics.mean(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        db = database.get_db()
+        try:
+            result = await db["users"].insert_one({
+                "name": "Bench", "email": "principal@example.com", "password": "x" * 60,
+                "wallet_balance": 0.0, "account_number": "0000000001", "is_admin": False,
+            })
+            token = create_access_token({"user_id": str(result.inserted_id)})
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+                cached_tokens, cached_principals = principals.tokens, principals.principals
+                principals.tokens = principals.principals = TTLCache(ttl=0)
+                print("no cache   %8.0f req/s  mean %6.2f ms  p99 %6.2f ms"
+                      % await timed(http, token, args.requests, args.concurrency))
+                principals.tokens, principals.principals = cached_tokens, cached_principals
+                print("cached     %8.0f req/s  mean %6.2f ms  p99 %6.2f ms"
+                      % await timed(http, token, args.requests, args.concurrency))
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Payout throughput and tail latency with and without provider routing.
+
+Sends `--transfers` transfers through `provider_routing.send` against two
+stub gateways, in two scenarios:
+
+* brownout: Monnify answers in `--slow-ms`, Paystack in `--latency-ms`;
+* outage: nothing is listening on Monnify's port.
+
+Each scenario runs once with a fixed Monnify-then-Paystack order (the old
+behaviour of a client hardcoding one rail, plus fallback) and once with the
+latency-aware ranking, reporting throughput, p50/p99 latency and which
+provider carried the transfers.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_provider_routing.py --transfers 500 --slow-ms 800
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONNIFY_PORT, PAYSTACK_PORT = 8909, 8910
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{MONNIFY_PORT}")
+os.environ.setdefault("PAYSTACK_GATEWAY_URL", f"http://127.0.0.1:{PAYSTACK_PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import gateway  # noqa: E402
+import indexes  # noqa: E402
+import provider_routing  # noqa: E402
+import recipients  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+
+
+def reset():
+    provider_routing.provider_router = provider_routing.ProviderRouter()
+    for client in (gateway.monnify, gateway.paystack):
+        fresh = gateway.GatewayClient(client.name, client.base_url)
+        client.breaker, client.bulkhead, client.retry = fresh.breaker, fresh.bulkhead, fresh.retry
+
+
+async def run(label, transfers, concurrency, routed):
+    reset()
+    if not routed:
+        provider_routing.provider_router.rank = lambda bank_code, providers: list(providers)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, carriers = [], Counter()
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            provider, outcome, _, _ = await provider_routing.send(
+                100.0, f"BENCH_{label}_{routed}_{i}", "bench", "058", f"01{i % 50:08d}", "0000000000")
+            latencies.append(time.perf_counter() - started)
+            carriers[provider if outcome == "success" else outcome] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(transfers)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{label:<9} {'routed' if routed else 'fixed':<7} {transfers / elapsed:7.1f} transfers/s  "
+          f"p50 {statistics.median(latencies) * 1000:7.1f}ms  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f}ms  "
+          f"{dict(carriers)}")
+    await gateway.close_gateways()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transfers", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=60)
+    parser.add_argument("--slow-ms", type=float, default=800)
+    args = parser.parse_args()
+    logging.disable(logging.ERROR)  # every failed call logs otherwise
+
+    await indexes.ensure_indexes(database.get_db(), recipients.INDEXES)
+    try:
+        with StubGatewayServer(port=PAYSTACK_PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+            with StubGatewayServer(port=MONNIFY_PORT, settings=StubSettings(latency_ms=args.slow_ms)):
+                for routed in (False, True):
+                    await run("brownout", args.transfers, args.concurrency, routed)
+            for routed in (False, True):
+                await run("outage", args.transfers, args.concurrency, routed)
+    finally:
+        await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
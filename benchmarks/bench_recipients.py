@@ -0,0 +1,76 @@
+"""
+Cost of resolving the Paystack recipient for a transfer.
+
+Against the stub gateway, resolves `--lookups` transfers spread over
+`--accounts` distinct accounts three ways: `create_transfer_recipient` per
+transfer (the old path), through the registry from cold, and through the
+registry again once warm. Also reports how many recipients Paystack was asked
+to create.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_recipients.py --lookups 1000 --accounts 50 --latency-ms 120
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8905
+os.environ.setdefault("PAYSTACK_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import indexes  # noqa: E402
+import recipients  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from gateway import close_gateways  # noqa: E402
+from utils import create_transfer_recipient  # noqa: E402
+
+
+async def timed(label, lookups, resolve, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(account):
+        async with semaphore:
+            await resolve(account, "058")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(account) for account in lookups))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:7.2f}s  ({len(lookups) / elapsed:8.1f} lookups/s)")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=120)
+    args = parser.parse_args()
+
+    db = database.get_db()
+    await indexes.ensure_indexes(db, recipients.INDEXES)
+    accounts = [f"{i:010d}" for i in range(args.accounts)]
+    lookups = [random.choice(accounts) for _ in range(args.lookups)]
+    with StubGatewayServer(port=PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+        try:
+            await timed("create per transfer", lookups, create_transfer_recipient, args.concurrency)
+            await timed("registry, cold", lookups, recipients.get_recipient_code, args.concurrency)
+            await timed("registry, warm", lookups, recipients.get_recipient_code, args.concurrency)
+            recipients.recipients.clear()
+            await timed("registry, Mongo only", lookups, recipients.get_recipient_code, args.concurrency)
+            print(f"recipients created by the registry: {recipients.created} for {args.accounts} accounts")
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+            await close_gateways()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
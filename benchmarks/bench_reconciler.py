@@ -0,0 +1,66 @@
+"""
+Reconciliation throughput for a backlog of pending Paystack transfers.
+
+Seeds `--backlog` pending Paystack transfer rows on a scratch database,
+points Paystack at the stub gateway, and times one `Reconciler.run_once()`
+pass, then prints the backlog/lag stats before and after.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_reconciler.py --backlog 2000 --latency-ms 150
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8904
+os.environ.setdefault("PAYSTACK_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import indexes  # noqa: E402
+import reconciler  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from gateway import close_gateways  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backlog", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    db = database.get_db()
+    await indexes.ensure_indexes(db)
+    with StubGatewayServer(port=PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+        try:
+            user = await db["users"].insert_one({"email": "recon@example.com", "wallet_balance": 0.0})
+            created = datetime.utcnow() - timedelta(hours=1)
+            await db["transactions"].insert_many([{
+                "user_id": str(user.inserted_id), "type": "transfer", "amount": 100.0,
+                "transfer_code": f"TRF_bench{i}", "status": "pending", "timestamp": created + timedelta(milliseconds=i),
+            } for i in range(args.backlog)])
+
+            worker = reconciler.Reconciler()
+            print("before:", await worker.stats())
+            started = time.perf_counter()
+            run = await worker.run_once()
+            elapsed = time.perf_counter() - started
+            print(f"reconciled {run['checked']} transfers in {elapsed:.1f}s "
+                  f"({run['checked'] / elapsed:.1f}/s, rate limit {reconciler.PAYSTACK_VERIFY_RATE}/s), "
+                  f"updated {run['updated']}")
+            print("after: ", await worker.stats())
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+            await close_gateways()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
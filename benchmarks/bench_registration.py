@@ -0,0 +1,85 @@
+"""
+Registration latency and time-to-active with background provisioning.
+
+Boots the stub gateway (Monnify is pointed at it) and the app on a scratch
+database. Cloudinary is replaced by a sleep of `--upload-ms`, the typical
+upload time. Registers `--users` users `--concurrency` at a time and reports
+the latency of `POST /auth/register/` and how long until every user is
+"active". Compare with the old serial path, which cost roughly
+upload + bcrypt + token fetch + reserved account per request.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_registration.py --users 100 --upload-ms 1500 --latency-ms 800
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8902
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{PORT}")
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import registration  # noqa: E402
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from main import app  # noqa: E402
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--upload-ms", type=float, default=1500)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    args = parser.parse_args()
+
+    async def fake_upload(data):
+        await asyncio.sleep(args.upload_ms / 1000)
+        return "https://res.cloudinary.com/bench/image.png"
+
+    registration.upload_image = fake_upload
+
+    with StubGatewayServer(port=PORT, settings=StubSettings(latency_ms=args.latency_ms)):
+        async with app.router.lifespan_context(app):
+            db = database.get_db()
+            try:
+                semaphore = asyncio.Semaphore(args.concurrency)
+                latencies = []
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                    async def register(i):
+                        async with semaphore:
+                            t0 = time.perf_counter()
+                            response = await http.post("/auth/register/", data={
+                                "name": f"Bench {i}", "email": f"bench{i}@example.com",
+                                "phone": "08000000000", "password": "correct horse battery staple",
+                            }, files={"profile_image": ("avatar.png", b"\x89PNG" + os.urandom(20_000), "image/png")})
+                            assert response.status_code == 202, response.text
+                            latencies.append(time.perf_counter() - t0)
+
+                    started = time.perf_counter()
+                    await asyncio.gather(*(register(i) for i in range(args.users)))
+                while await db["users"].count_documents({"status": "pending"}):
+                    await asyncio.sleep(0.05)
+                provisioned = time.perf_counter() - started
+
+                latencies.sort()
+                active = await db["users"].count_documents({"status": "active"})
+                print(f"register p50 {latencies[len(latencies) // 2] * 1000:8.1f} ms  "
+                      f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:8.1f} ms")
+                print(f"{active}/{args.users} users active after {provisioned:.2f}s")
+            finally:
+                await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Cost of turning a transaction page into a response body, by page size.
+
+Builds pages of `--sizes` transactions shaped like `pagination.transaction_page`
+returns them (ObjectId and datetime values, as read from Mongo) and times
+each way a route can render them:
+
+* stdlib:   stringify ids/timestamps, jsonable_encoder, json.dumps (the old path);
+* encoder:  jsonable_encoder, then orjson (a route returning a plain dict);
+* model:    validate and dump through the TransactionPage response model, then orjson;
+* direct:   BSONJSONResponse on the documents as read (what the history routes do now).
+
+No database needed; reports microseconds per response and the body size.
+
+Usage:
+    python benchmarks/bench_serialization.py --sizes 1,10,50,200 --repeat 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import TransactionPage  # noqa: E402
+from responses import BSONJSONResponse  # noqa: E402
+
+
+def transaction(i):
+    doc = {
+        "_id": ObjectId(),
+        "type": random.choice(["deposit", "transfer"]),
+        "amount": round(random.uniform(100, 50_000), 2),
+        "status": "success",
+        "reference": f"MNFY|{random.randrange(10 ** 12)}|{i}",
+        "narration": "Bank Transfer",
+        "timestamp": datetime.utcnow() - timedelta(minutes=i),
+    }
+    if doc["type"] == "deposit":
+        doc.update(method="account_transfer", source_account=f"{random.randrange(10 ** 10):010d}")
+    else:
+        doc.update(recipient_account_number=f"{random.randrange(10 ** 10):010d}", recipient_bank_code="058")
+    return doc
+
+
+def page(size):
+    return {"transactions": [transaction(i) for i in range(size)], "next_cursor": "eyJ0IjogbnVsbCwgImlkIjogIiJ9"}
+
+
+def stdlib(content):
+    rows = []
+    for doc in content["transactions"]:
+        doc = dict(doc)
+        doc["_id"] = str(doc["_id"])
+        doc["timestamp"] = doc["timestamp"].isoformat()
+        rows.append(doc)
+    return JSONResponse(jsonable_encoder({**content, "transactions": rows})).body
+
+
+def encoder(content):
+    # jsonable_encoder can't handle ObjectId itself, so it needs the ids stringified too.
+    rows = [{**doc, "_id": str(doc["_id"])} for doc in content["transactions"]]
+    return BSONJSONResponse(jsonable_encoder({**content, "transactions": rows})).body
+
+
+def model(content):
+    return BSONJSONResponse(TransactionPage.model_validate(content).model_dump(mode="json", by_alias=True)).body
+
+
+def direct(content):
+    return BSONJSONResponse(content).body
+
+
+def bench(render, content, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = render(content)
+    return (time.perf_counter() - started) / repeat, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,10,50,200")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>5} {'stdlib us':>10} {'encoder us':>11} {'model us':>9} {'direct us':>10} {'bytes':>8}")
+    for size in map(int, args.sizes.split(",")):
+        content = page(size)
+        repeat = max(10, args.repeat // max(1, size // 10))
+        results = [bench(render, content, repeat) for render in (stdlib, encoder, model, direct)]
+        print(f"{size:>5} " + " ".join(f"{seconds * 1e6:>{width}.1f}" for (seconds, _), width
+                                       in zip(results, (10, 11, 9, 10))) + f" {results[-1][1]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Statement export throughput, memory ceiling and event-loop impact.
+
+Seeds `--rows` transactions for one account, then runs an export job while a
+probe task measures event-loop lag (how late a 10 ms sleep wakes up), which is
+what API requests on the same worker would feel. Peak Python memory is taken
+with tracemalloc.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_statement_export.py --rows 1000000 --format parquet
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import exports  # noqa: E402
+import indexes  # noqa: E402
+
+INSERT_BATCH = 10_000
+
+
+async def seed(transactions, rows, start):
+    for offset in range(0, rows, INSERT_BATCH):
+        await transactions.insert_many([
+            {"user_id": "bench", "type": "deposit", "amount": 100.0, "status": "success",
+             "reference": f"bench-{i}", "timestamp": start + timedelta(seconds=i)}
+            for i in range(offset, min(offset + INSERT_BATCH, rows))
+        ])
+
+
+async def probe_loop_lag(stop, lags):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - t0 - 0.01)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--format", choices=exports.FORMATS, default="csv")
+    args = parser.parse_args()
+
+    db = database.get_db()
+    exports.EXPORT_DIR = tempfile.mkdtemp()
+    await indexes.ensure_indexes(db, {"transactions": indexes.INDEXES["transactions"]})
+    start = datetime(2020, 1, 1)
+    try:
+        await seed(db["transactions"], args.rows, start)
+        job = {"_id": "bench", "user_ids": ["bench"], "format": args.format,
+               "start": start, "end": start + timedelta(seconds=args.rows)}
+
+        stop, lags = asyncio.Event(), []
+        probe = asyncio.create_task(probe_loop_lag(stop, lags))
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        path, rows = await exports.run_job(job)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop.set()
+        await probe
+
+        lags.sort()
+        print(f"{rows} rows -> {args.format} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), "
+              f"file {os.path.getsize(path) / 1024 / 1024:.1f} MiB, peak memory {peak / 1024 / 1024:.1f} MiB")
+        print(f"event-loop lag p50 {lags[len(lags) // 2] * 1000:.2f} ms  "
+              f"p99 {lags[int(len(lags) * 0.99)] * 1000:.2f} ms  max {lags[-1] * 1000:.2f} ms")
+    finally:
+        await database.get_client().drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""
+Transaction history cost against wallet size.
+
+Seeds histories of increasing size and reports, for each size: latency of the
+first and a deep page via keyset pagination, and peak Python memory
+(tracemalloc) while streaming the whole history as NDJSON.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_transaction_history.py --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+import pagination  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+INSERT_BATCH = 10_000
+
+
+async def seed(transactions, user_id, size):
+    start = datetime(2020, 1, 1)
+    for offset in range(0, size, INSERT_BATCH):
+        await transactions.insert_many([
+            {"user_id": user_id, "type": "deposit", "amount": 100.0, "status": "success",
+             "reference": f"{user_id}-{i}", "timestamp": start + timedelta(seconds=i),
+             "raw_webhook_data": {"blob": "x" * 1024}}
+            for i in range(offset, min(offset + INSERT_BATCH, size))
+        ])
+
+
+async def timed_page(transactions, user_id, cursor):
+    t0 = time.perf_counter()
+    page = await pagination.transaction_page(transactions, user_id, cursor, pagination.MAX_PAGE_SIZE)
+    return page, (time.perf_counter() - t0) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--deep-pages", type=int, default=50)
+    args = parser.parse_args()
+
+    client = database.get_client()
+    db = client[BENCH_DB]
+    await indexes.ensure_indexes(db, {"transactions": indexes.INDEXES["transactions"]})
+    transactions = db["transactions"]
+    try:
+        for size in args.sizes:
+            user_id = f"bench-{size}"
+            await seed(transactions, user_id, size)
+
+            page, first_ms = await timed_page(transactions, user_id, None)
+            deep_ms = 0.0
+            for _ in range(args.deep_pages):
+                if not page["next_cursor"]:
+                    break
+                page, deep_ms = await timed_page(transactions, user_id, page["next_cursor"])
+
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            rows = 0
+            async for _ in pagination.stream_transactions(transactions, user_id):
+                rows += 1
+            stream_s = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            print(f"{size:>9} rows   first page {first_ms:7.2f} ms   page {args.deep_pages} {deep_ms:7.2f} ms   "
+                  f"stream {rows / stream_s:9.0f} rows/s peak {peak / 1024 / 1024:6.2f} MiB")
+    finally:
+        await client.drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""
+Working set of `transactions` with raw webhook payloads inline vs archived.
+
+Seeds `--deposits` deposit rows on a scratch database the way the webhook
+processor used to write them, each with a realistic Monnify `eventData` as
+`raw_webhook_data`, and measures the collection's data size, average row size
+and history-page latency. Then runs `webhook_archive.migrate` and measures
+again, along with the archive's compression ratio and the latency of loading
+one payload back on demand.
+
+Needs a real mongod (collStats); mongomock can't report sizes.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_webhook_archive.py --deposits 200000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import indexes  # noqa: E402
+import pagination  # noqa: E402
+import webhook_archive  # noqa: E402
+
+
+def event_data(reference, account_number, amount, paid_on):
+    return {
+        "product": {"reference": f"RSV-{account_number}", "type": "RESERVED_ACCOUNT"},
+        "transactionReference": reference,
+        "paymentReference": f"MNFY|{random.randrange(10 ** 14)}|{random.randrange(10 ** 6):06d}",
+        "paidOn": paid_on.strftime("%d/%m/%Y %I:%M:%S %p"),
+        "paymentDescription": "Wallet funding",
+        "metaData": {},
+        "paymentSourceInformation": [{
+            "bankCode": "058",
+            "amountPaid": amount,
+            "accountName": "ADEBAYO OLUWASEUN CHUKWUEMEKA",
+            "sessionId": f"{random.randrange(10 ** 29):030d}",
+            "accountNumber": f"{random.randrange(10 ** 10):010d}",
+        }],
+        "destinationAccountInformation": {
+            "bankCode": "035",
+            "bankName": "Wema bank",
+            "accountNumber": account_number,
+        },
+        "amountPaid": amount,
+        "totalPayable": amount,
+        "cardDetails": {},
+        "paymentMethod": "ACCOUNT_TRANSFER",
+        "currency": "NGN",
+        "settlementAmount": f"{amount - 50:.2f}",
+        "paymentStatus": "PAID",
+        "customer": {"name": "Adebayo Oluwaseun", "email": "adebayo@example.com"},
+    }
+
+
+async def seed(db, deposits, users):
+    user_ids = [f"{i:024x}" for i in range(users)]
+    now = datetime.utcnow()
+    batch = []
+    for i in range(deposits):
+        amount = float(random.randrange(1_000, 500_000))
+        timestamp = now - timedelta(seconds=i)
+        reference = f"MNFY-ARCHIVE-{i}"
+        batch.append({
+            "user_id": random.choice(user_ids),
+            "type": "deposit",
+            "amount": amount,
+            "reference": reference,
+            "method": "account_transfer",
+            "status": "success",
+            "timestamp": timestamp,
+            "source_account": f"{random.randrange(10 ** 10):010d}",
+            "raw_webhook_data": event_data(reference, f"{i % users:010d}", amount, timestamp),
+            "balance_applied": True,
+        })
+        if len(batch) == 5000:
+            await db["transactions"].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db["transactions"].insert_many(batch, ordered=False)
+    return user_ids
+
+
+async def measure(db, label, user_ids, pages):
+    stats = await db.command("collStats", "transactions")
+    latencies = []
+    for _ in range(pages):
+        started = time.perf_counter()
+        await pagination.transaction_page(db["transactions"], random.choice(user_ids), limit=50)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(f"{label:<9} data {stats['size'] / 2 ** 20:8.1f} MiB  avg row {stats['avgObjSize']:6.0f} B  "
+          f"storage {stats['storageSize'] / 2 ** 20:8.1f} MiB  "
+          f"page p50 {statistics.median(latencies) * 1000:6.2f} ms  p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:6.2f} ms")
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--deposits", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--pages", type=int, default=500, help="history pages fetched per measurement")
+    parser.add_argument("--batch-size", type=int, default=webhook_archive.WEBHOOK_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = database.get_db()
+    try:
+        await indexes.ensure_indexes(db, {"transactions": indexes.INDEXES["transactions"], **webhook_archive.INDEXES})
+        user_ids = await seed(db, args.deposits, args.users)
+        before = await measure(db, "inline", user_ids, args.pages)
+
+        started = time.perf_counter()
+        moved = await webhook_archive.migrate(db, args.batch_size)
+        elapsed = time.perf_counter() - started
+        after = await measure(db, "archived", user_ids, args.pages)
+
+        archive = await db.command("collStats", "webhook_archive")
+        print(f"migrated {moved} payloads in {elapsed:.1f}s ({moved / elapsed:.0f}/s)")
+        print(f"transactions data {1 - after['size'] / before['size']:.1%} smaller; "
+              f"archive holds {archive['size'] / 2 ** 20:.1f} MiB ({webhook_archive.CODEC}, "
+              f"{webhook_archive.raw_bytes / webhook_archive.stored_bytes:.1f}x compression)")
+
+        loads = []
+        for _ in range(200):
+            reference = f"MNFY-ARCHIVE-{random.randrange(args.deposits)}"
+            started = time.perf_counter()
+            archived = await webhook_archive.load("monnify", reference)
+            loads.append(time.perf_counter() - started)
+            assert archived["payload"]["transactionReference"] == reference
+        print(f"on-demand load p50 {statistics.median(loads) * 1000:.2f} ms")
+    finally:
+        await database.get_client().drop_database(BENCH_DB)
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
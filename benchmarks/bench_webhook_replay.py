@@ -0,0 +1,100 @@
+"""
+Replay thousands of Monnify webhooks against the ingestion pipeline.
+
+Boots the real app (lifespan included, so the inbox workers run) on a scratch
+database and posts `--events` deposit webhooks, a fraction of them duplicated
+to mimic provider retries, through an in-process ASGI transport. Reports the
+acknowledgement rate and latency, how long the workers take to drain the
+inbox, and checks that every wallet was credited exactly once per reference.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_webhook_replay.py --events 20000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+import webhook_inbox  # noqa: E402
+from main import app  # noqa: E402
+
+
+def monnify_event(reference, account_number, amount):
+    return {
+        "eventType": "SUCCESSFUL_TRANSACTION",
+        "eventData": {
+            "transactionReference": reference,
+            "paymentStatus": "PAID",
+            "amountPaid": amount,
+            "paymentMethod": "ACCOUNT_TRANSFER",
+            "destinationAccountInformation": {"accountNumber": account_number},
+            "paymentSourceInformation": [{"amountPaid": amount, "accountNumber": "0123456789"}],
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraction of events sent twice")
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        db = database.get_db()
+        try:
+            accounts = [f"{i:010d}" for i in range(args.users)]
+            await db["users"].insert_many([
+                {"email": f"bench{i}@example.com", "account_number": account, "wallet_balance": 0.0}
+                for i, account in enumerate(accounts)
+            ])
+
+            events = [monnify_event(f"MNFY-BENCH-{i}", random.choice(accounts), 100.0) for i in range(args.events)]
+            replay = events + random.sample(events, int(len(events) * args.duplicates))
+            random.shuffle(replay)
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies = []
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                async def send(event):
+                    async with semaphore:
+                        t0 = time.perf_counter()
+                        response = await http.post("/banking/monnify/webhook/", json=event)
+                        response.raise_for_status()
+                        latencies.append(time.perf_counter() - t0)
+
+                started = time.perf_counter()
+                await asyncio.gather(*(send(event) for event in replay))
+                acked = time.perf_counter() - started
+
+            while (await webhook_inbox.stats())["depth"]:
+                await asyncio.sleep(0.05)
+            drained = time.perf_counter() - started
+
+            latencies.sort()
+            total = sum(user["wallet_balance"] async for user in db["users"].find({}, {"wallet_balance": 1}))
+            print(f"acked {len(replay)} webhooks in {acked:.2f}s ({len(replay) / acked:,.0f}/s), "
+                  f"ack p50 {latencies[len(latencies) // 2] * 1000:.1f} ms p99 "
+                  f"{latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+            print(f"inbox drained after {drained:.2f}s ({len(replay) / drained:,.0f} events/s end to end)")
+            print(f"credited {total:,.2f}, expected {args.events * 100.0:,.2f} "
+                  f"({'OK' if total == args.events * 100.0 else 'MISMATCH'})")
+        finally:
+            await database.get_client().drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,369 @@
+"""
+End-to-end load test of the API.
+
+Boots the real app (lifespan included, so the background workers run) on a
+scratch database, points both payment gateways at one stub server with
+`--latency-ms` / `--jitter-ms` / `--error-rate`, seeds `--users` users with
+wallet balances and transaction history, and then keeps `--concurrency`
+virtual users sending a weighted mix of:
+
+    login         POST /auth/login/
+    balance       GET  /banking/balance/
+    transactions  GET  /banking/transactions/
+    transfer      POST /banking/monnify/transfer/
+    webhook       POST /banking/monnify/webhook/
+
+for `--duration` seconds (or `--requests` requests). Reports throughput,
+p50/p95/p99 latency and status codes per route, and with `--output` writes
+them as JSON together with the commit and settings. `--compare` checks the run
+against an earlier results file and exits non-zero if any route's p95 grew, or
+its throughput fell, by more than `--tolerance`.
+
+Requests go through an in-process ASGI transport, so the numbers are the
+app's own cost without HTTP parsing or a real network hop. `--fake-mongo`
+runs against mongomock-motor instead of `MONGO_URI`; use it to smoke-test
+the harness, not for numbers.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/load_test.py --duration 30 --concurrency 50 \\
+        --mix login=1,balance=5,transactions=3,transfer=1,webhook=2 --latency-ms 80 --output results.json
+    python benchmarks/load_test.py ... --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STUB_PORT = 8911
+os.environ.setdefault("MONNIFY_GATEWAY_URL", f"http://127.0.0.1:{STUB_PORT}")
+os.environ.setdefault("PAYSTACK_GATEWAY_URL", f"http://127.0.0.1:{STUB_PORT}")
+os.environ.setdefault("LOG_LEVEL", "WARNING")  # failed transfers under error injection log otherwise
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+import passwords  # noqa: E402
+
+BENCH_DB = "banking_system_bench"
+database.MONGO_DB_NAME = BENCH_DB
+
+from benchmarks.stub_gateway import StubGatewayServer, StubSettings  # noqa: E402
+from main import app  # noqa: E402
+from utils import pwd_context  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "correct horse battery staple"
+DEFAULT_MIX = "login=1,balance=5,transactions=3,transfer=1,webhook=2"
+ROUTES = {
+    "login": "POST /auth/login/",
+    "balance": "GET /banking/balance/",
+    "transactions": "GET /banking/transactions/",
+    "transfer": "POST /banking/monnify/transfer/",
+    "webhook": "POST /banking/monnify/webhook/",
+}
+
+
+def parse_mix(text):
+    mix = {name: float(weight) for name, weight in (pair.split("=") for pair in text.split(",") if pair)}
+    unknown = set(mix) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"Unknown routes in --mix: {', '.join(sorted(unknown))} (choose from {', '.join(ROUTES)})")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def percentile(latencies, q):
+    """Nearest-rank percentile of sorted `latencies`."""
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, max(0, math.ceil(q * len(latencies)) - 1))]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+class VirtualUser:
+    def __init__(self, email, account_number):
+        self.email = email
+        self.account_number = account_number
+        self.token = None
+
+    @property
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadTest:
+    def __init__(self, http, users, mix, duplicates=0.05):
+        self.http = http
+        self.users = users
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.duplicates = duplicates
+        self.latencies = {name: [] for name in ROUTES}
+        self.statuses = {name: Counter() for name in ROUTES}
+        self._webhooks = 0
+        self._sent_references = []
+
+    async def login(self, user):
+        response = await self.http.post("/auth/login/", data={"username": user.email, "password": PASSWORD})
+        if response.status_code == 200:
+            user.token = response.json()["access_token"]
+        return response
+
+    async def balance(self, user):
+        return await self.http.get("/banking/balance/", headers=user.headers)
+
+    async def transactions(self, user):
+        return await self.http.get("/banking/transactions/", params={"limit": 20}, headers=user.headers)
+
+    async def transfer(self, user):
+        return await self.http.post("/banking/monnify/transfer/", headers=user.headers, params={
+            "amount": 100.0,
+            "destination_bank_code": "058",
+            "destination_account_number": f"01{random.randrange(10 ** 8):08d}",
+            "narration": "Load test",
+        })
+
+    async def webhook(self, user):
+        # Some deliveries repeat an earlier reference, like provider retries do.
+        if self._sent_references and random.random() < self.duplicates:
+            reference = random.choice(self._sent_references)
+        else:
+            self._webhooks += 1
+            reference = f"MNFY-LOAD-{self._webhooks}-{random.randrange(10 ** 9)}"
+            self._sent_references.append(reference)
+        return await self.http.post("/banking/monnify/webhook/", json={
+            "eventType": "SUCCESSFUL_TRANSACTION",
+            "eventData": {
+                "transactionReference": reference,
+                "paymentStatus": "PAID",
+                "amountPaid": 100.0,
+                "paymentMethod": "ACCOUNT_TRANSFER",
+                "destinationAccountInformation": {"accountNumber": user.account_number},
+                "paymentSourceInformation": [{"amountPaid": 100.0, "accountNumber": "0123456789"}],
+            },
+        })
+
+    async def call(self, name, user):
+        started = time.perf_counter()
+        try:
+            response = await getattr(self, name)(user)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.latencies[name].append(time.perf_counter() - started)
+        self.statuses[name][status] += 1
+
+    async def run(self, concurrency, deadline=None, requests=None):
+        remaining = requests
+
+        async def virtual_user():
+            nonlocal remaining
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                name = random.choices(self.names, self.weights)[0]
+                await self.call(name, random.choice(self.users))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def results(self, elapsed):
+        routes = {}
+        for name, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            latencies.sort()
+            routes[name] = {
+                "route": ROUTES[name],
+                "requests": len(latencies),
+                "throughput_rps": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": latencies[-1] * 1000,
+                "statuses": dict(self.statuses[name]),
+            }
+        every = sorted(latency for latencies in self.latencies.values() for latency in latencies)
+        total = {
+            "requests": len(every),
+            "throughput_rps": len(every) / elapsed,
+            "p50_ms": (percentile(every, 0.50) or 0) * 1000,
+            "p95_ms": (percentile(every, 0.95) or 0) * 1000,
+            "p99_ms": (percentile(every, 0.99) or 0) * 1000,
+        }
+        return routes, total
+
+
+async def seed(db, users, history):
+    password = pwd_context.hash(PASSWORD)
+    accounts = [f"{9 * 10 ** 8 + i:010d}" for i in range(users)]
+    result = await db["users"].insert_many([
+        {
+            "email": f"load{i}@example.com",
+            "password": password,
+            "account_number": account,
+            "bank_name": "Wema Bank",
+            "wallet_balance": 10_000_000.0,
+        }
+        for i, account in enumerate(accounts)
+    ])
+    now = datetime.utcnow()
+    transactions = [
+        {
+            "user_id": str(user_id),
+            "type": "deposit",
+            "amount": 100.0,
+            "reference": f"LOAD-SEED-{user_id}-{n}",
+            "status": "success",
+            "timestamp": now - timedelta(minutes=n),
+        }
+        for user_id in result.inserted_ids
+        for n in range(history)
+    ]
+    if transactions:
+        await db["transactions"].insert_many(transactions)
+    return [VirtualUser(f"load{i}@example.com", account) for i, account in enumerate(accounts)]
+
+
+def print_results(routes, total, elapsed):
+    print(f"{'route':<32} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  statuses")
+    for result in routes.values():
+        print(f"{result['route']:<32} {result['requests']:>7} {result['throughput_rps']:>8.1f} "
+              f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}  {result['statuses']}")
+    print(f"{'total':<32} {total['requests']:>7} {total['throughput_rps']:>8.1f} "
+          f"{total['p50_ms']:>8.2f} {total['p95_ms']:>8.2f} {total['p99_ms']:>8.2f}  in {elapsed:.1f}s")
+
+
+def compare(routes, config, baseline_path, tolerance):
+    """Print the change against a previous results file; return the routes that regressed."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst {baseline_path} (commit {(baseline.get('commit') or 'unknown')[:12]}):")
+    changed = sorted(key for key in config if key not in ("seed", "tolerance")
+                     and config[key] != baseline.get("config", {}).get(key))
+    if changed:
+        print(f"warning: settings differ from the baseline ({', '.join(changed)}); the numbers are not comparable")
+    regressions = []
+    for name, result in routes.items():
+        before = baseline["routes"].get(name)
+        if not before:
+            print(f"{result['route']:<32} not in baseline")
+            continue
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = result["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{result['route']:<32} p95 {p95_change:+7.1%}  req/s {rps_change:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--history", type=int, default=50, help="seeded transactions per user")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--duplicates", type=float, default=0.05, help="fraction of webhooks that repeat a reference")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, help="random seed, for repeatable request sequences")
+    parser.add_argument("--fake-mongo", action="store_true", help="use mongomock-motor instead of MONGO_URI")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p95/throughput change for --compare")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.fake_mongo:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--fake-mongo needs mongomock-motor: pip install mongomock-motor") from None
+        database.client = AsyncMongoMockClient()
+
+        async def skip_indexes(db, *_):
+            pass  # mongomock ignores partialFilterExpression, so the partial unique indexes reject every seed row
+
+        indexes.ensure_indexes = skip_indexes
+
+    stub = StubSettings(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    with StubGatewayServer(port=STUB_PORT, settings=stub):
+        async with app.router.lifespan_context(app):
+            db = database.get_db()
+            try:
+                users = await seed(db, args.users, args.history)
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                             timeout=60.0) as http:
+                    test = LoadTest(http, users, mix, args.duplicates)
+                    # Every virtual user needs a token before the mix starts; stay under the bcrypt shedding limit.
+                    semaphore = asyncio.Semaphore(min(args.concurrency, passwords.PASSWORD_HASH_MAX_PENDING))
+
+                    async def sign_in(user):
+                        async with semaphore:
+                            (await test.login(user)).raise_for_status()
+
+                    await asyncio.gather(*(sign_in(user) for user in users))
+
+                    deadline = None if args.requests else time.perf_counter() + args.duration
+                    elapsed = await test.run(args.concurrency, deadline=deadline, requests=args.requests)
+            finally:
+                await database.get_client().drop_database(BENCH_DB)
+
+    routes, total = test.results(elapsed)
+    print_results(routes, total, elapsed)
+
+    commit, dirty = git_commit()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "mongo": "mongomock" if args.fake_mongo else "mongod",
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "elapsed_seconds": elapsed,
+        "routes": routes,
+        "total": total,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(routes, results["config"], args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""
+Local stand-in for the Monnify and Paystack APIs.
+
+Implements just enough of each provider for the helpers in `utils.py`, with
+configurable latency and error injection so gateway behaviour can be
+benchmarked offline. Point the service at it with:
+
+    MONNIFY_GATEWAY_URL=http://127.0.0.1:8900 PAYSTACK_GATEWAY_URL=http://127.0.0.1:8900
+
+Run standalone:
+    python benchmarks/stub_gateway.py --port 8900 --latency-ms 40 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BANKS = [{"name": f"Bank {i:03d}", "code": f"{i:03d}", "ussdTemplate": None} for i in range(1, 121)]
+
+
+class StubSettings:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, token_ttl=3600, rate_limit=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token_ttl = token_ttl
+        # Requests per second before the stub answers 429, like the real providers (0 = unlimited).
+        self.rate_limit = rate_limit
+
+
+def create_app(settings=None):
+    settings = settings or StubSettings()
+    app = FastAPI()
+    app.state.settings = settings
+    app.state.calls = {}
+    app.state.rate_limited = 0
+    window = {"second": 0, "count": 0}
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        path = request.url.path
+        app.state.calls[path] = app.state.calls.get(path, 0) + 1
+        if settings.rate_limit:
+            second = int(time.monotonic())
+            if window["second"] != second:
+                window["second"], window["count"] = second, 0
+            window["count"] += 1
+            if window["count"] > settings.rate_limit:
+                app.state.rate_limited += 1
+                return JSONResponse({"requestSuccessful": False, "status": False, "message": "Too many requests"},
+                                    status_code=429)
+        delay = settings.latency_ms + random.uniform(0, settings.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if settings.error_rate and random.random() < settings.error_rate:
+            return JSONResponse({"requestSuccessful": False, "status": False, "message": "Injected failure"},
+                                status_code=503)
+        return await call_next(request)
+
+    @app.get("/_stats")
+    async def stats():
+        return {"calls": app.state.calls, "rate_limited": app.state.rate_limited}
+
+    # Monnify
+
+    @app.post("/api/v1/auth/login")
+    async def monnify_login():
+        return {"requestSuccessful": True,
+                "responseBody": {"accessToken": uuid.uuid4().hex, "expiresIn": settings.token_ttl}}
+
+    @app.get("/api/v1/banks")
+    async def monnify_banks():
+        return {"requestSuccessful": True, "responseBody": BANKS}
+
+    reserved_accounts = {}
+
+    @app.post("/api/v2/bank-transfer/reserved-accounts")
+    async def monnify_reserved_account(request: Request):
+        body = await request.json()
+        account_number = f"{random.randint(0, 9_999_999_999):010d}"
+        reserved_accounts[body.get("accountReference")] = {
+            "accountReference": body.get("accountReference"),
+            "accounts": [{"accountNumber": account_number, "bankName": "Stub Bank", "bankCode": "001"}],
+        }
+        return {"requestSuccessful": True, "responseBody": reserved_accounts[body.get("accountReference")]}
+
+    @app.get("/api/v2/bank-transfer/reserved-accounts/{reference}")
+    async def monnify_get_reserved_account(reference: str):
+        if reference not in reserved_accounts:
+            return JSONResponse({"requestSuccessful": False, "responseMessage": "Not found"}, status_code=404)
+        return {"requestSuccessful": True, "responseBody": reserved_accounts[reference]}
+
+    disbursements = set()
+
+    @app.post("/api/v2/disbursements/single")
+    async def monnify_disbursement(request: Request):
+        body = await request.json()
+        disbursements.add(body.get("reference"))
+        return {"requestSuccessful": True, "responseMessage": "success", "responseBody": {
+            "amount": float(body.get("amount", 0)),
+            "reference": body.get("reference"),
+            "status": "SUCCESS",
+            "transactionReference": f"MFDS{uuid.uuid4().hex[:16].upper()}",
+        }}
+
+    @app.get("/api/v2/disbursements/single/summary")
+    async def monnify_disbursement_summary(reference: str):
+        if reference not in disbursements:
+            return JSONResponse({"requestSuccessful": False, "responseMessage": "Not found"}, status_code=404)
+        return {"requestSuccessful": True, "responseBody": {"reference": reference, "status": "SUCCESS"}}
+
+    @app.get("/api/v1/disbursements/account/validate")
+    async def monnify_validate_account(accountNumber: str, bankCode: str):
+        # Account numbers starting with 99 don't exist, to exercise negative caching.
+        if accountNumber.startswith("99"):
+            return JSONResponse({"requestSuccessful": False, "responseMessage": "Invalid account"},
+                                status_code=400)
+        return {"requestSuccessful": True, "responseBody": {
+            "accountNumber": accountNumber, "accountName": f"STUB HOLDER {accountNumber[-4:]}", "bankCode": bankCode,
+        }}
+
+    @app.get("/api/v1/transactions/{reference}")
+    async def monnify_transaction(reference: str):
+        return {"requestSuccessful": True, "responseBody": {
+            "transactionReference": reference, "paymentStatus": "PAID", "amountPaid": "1000.00",
+            "accountNumber": "0000000000",
+        }}
+
+    # Paystack
+
+    @app.post("/transaction/initialize")
+    async def paystack_initialize():
+        reference = uuid.uuid4().hex
+        return {"status": True, "data": {"authorization_url": f"https://checkout.stub/{reference}",
+                                         "reference": reference}}
+
+    @app.post("/transferrecipient")
+    async def paystack_recipient(request: Request):
+        body = await request.json()
+        return {"status": True, "data": {"recipient_code": f"RCP_{uuid.uuid4().hex[:12]}",
+                                         "details": {"account_number": body.get("account_number"),
+                                                     "bank_code": body.get("bank_code")}}}
+
+    @app.post("/transfer")
+    async def paystack_transfer(request: Request):
+        body = await request.json()
+        return {"status": True, "data": {"transfer_code": f"TRF_{uuid.uuid4().hex[:12]}",
+                                         "amount": body.get("amount"), "status": "pending"}}
+
+    @app.get("/transfer/verify/{transfer_code}")
+    async def paystack_verify(transfer_code: str):
+        return {"status": True, "data": {"transfer_code": transfer_code, "amount": 100000, "status": "success"}}
+
+    return app
+
+
+def _serve(host, port, settings):
+    uvicorn.run(create_app(settings), host=host, port=port, log_level="warning")
+
+
+class StubGatewayServer:
+    """Run the stub app with uvicorn in a child process (for benchmarks)."""
+
+    def __init__(self, host="127.0.0.1", port=8900, settings=None):
+        self.host = host
+        self.port = port
+        self.process = multiprocessing.Process(target=_serve, args=(host, port, settings or StubSettings()),
+                                               daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def __enter__(self):
+        self.process.start()
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection((self.host, self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.process.terminate()
+                    raise RuntimeError("Stub gateway did not start")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    args = parser.parse_args()
+
+    stub_settings = StubSettings(args.latency_ms, args.jitter_ms, args.error_rate, rate_limit=args.rate_limit)
+    uvicorn.run(create_app(stub_settings), host=args.host, port=args.port)
@@ -1,11 +1,48 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 
+import metrics
+
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client["banking_system"]
+MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "banking_system")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+
+client = None
+
+
+def get_client():
+    """Return the shared Motor client, creating it on first use."""
+    global client
+    if client is None:
+        client = AsyncIOMotorClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE,
+                                    event_listeners=[metrics.mongo_listener])
+    return client
+
+
+def get_db():
+    return get_client()[MONGO_DB_NAME]
+
+
+async def connect():
+    """Open the Motor client and make sure the server is reachable."""
+    await get_client().admin.command("ping")
+
+
+def close():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+
+# FastAPI dependencies
+
+def get_users_collection():
+    return get_db()["users"]
+
 
-users = db["users"]
-transactions = db["transactions"]
+def get_transactions_collection():
+    return get_db()["transactions"]
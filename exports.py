@@ -0,0 +1,257 @@
+"""
+Background statement exports (CSV / Parquet).
+
+Export requests are persisted in `export_jobs` and processed by a single
+in-process worker, one job at a time. Rows are read from `transactions` in
+`EXPORT_CHUNK_SIZE` batches and each batch is formatted and written on a
+worker thread, so memory is bounded by one chunk and API requests keep
+being served while a large export runs.
+
+Finished files are written to `EXPORT_DIR` and served from there by the
+download route, so `EXPORT_DIR` must be a volume every API host mounts. With
+a host-local directory, run a single API host; other hosts answer 410 for
+files they can't see. Files are deleted `EXPORT_RETENTION_SECONDS` after the
+export finishes, and the job is marked "expired".
+
+Running jobs heartbeat after every chunk. Every
+`EXPORT_MAINTENANCE_INTERVAL_SECONDS` the worker re-queues jobs whose
+heartbeat is older than `EXPORT_STALE_AFTER` (their worker died) and
+deletes expired files.
+"""
+import asyncio
+import csv
+import importlib.util
+import logging
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from database import get_db
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+# A running job whose last heartbeat is older than this belonged to a worker that died.
+EXPORT_STALE_AFTER = timedelta(seconds=int(os.getenv("EXPORT_STALE_AFTER_SECONDS", "600")))
+EXPORT_RETENTION = timedelta(seconds=int(os.getenv("EXPORT_RETENTION_SECONDS", str(24 * 3600))))
+EXPORT_MAINTENANCE_INTERVAL = int(os.getenv("EXPORT_MAINTENANCE_INTERVAL_SECONDS", "60"))
+FORMATS = ("csv", "parquet")
+
+COLUMNS = [
+    "user_id", "timestamp", "type", "amount", "status", "reference", "transfer_code",
+    "narration", "method", "recipient_account_number", "recipient_bank_code", "source_account",
+]
+PROJECTION = {column: 1 for column in COLUMNS}
+
+INDEXES = {
+    "export_jobs": [IndexModel([("status", ASCENDING), ("created_at", ASCENDING)])],
+}
+
+
+def parquet_available():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+async def create_job(requested_by, user_ids, start, end, fmt):
+    job = {
+        "requested_by": str(requested_by),
+        "user_ids": user_ids,
+        "start": start,
+        "end": end,
+        "format": fmt,
+        "status": "queued",
+        "rows": 0,
+        "created_at": datetime.utcnow(),
+    }
+    await get_db()["export_jobs"].insert_one(job)
+    worker.enqueue(job["_id"])
+    return job
+
+
+async def get_job(job_id):
+    try:
+        return await get_db()["export_jobs"].find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        return None
+
+
+def job_status(job):
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "format": job["format"],
+        "rows": job.get("rows", 0),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+    }
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes one row group per chunk so only one chunk is ever held in memory."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            (column, pa.timestamp("ms") if column == "timestamp" else
+             pa.float64() if column == "amount" else pa.string())
+            for column in COLUMNS
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        columns = {column: [row.get(column) for row in rows] for column in COLUMNS}
+        for column in COLUMNS:
+            if column not in ("timestamp", "amount"):
+                columns[column] = [None if value is None else str(value) for value in columns[column]]
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+async def run_job(job):
+    db = get_db()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, f"{job['_id']}.{job['format']}")
+    writer_class = ParquetWriter if job["format"] == "parquet" else CsvWriter
+    writer = await asyncio.to_thread(writer_class, path)
+
+    query = {"user_id": {"$in": job["user_ids"]}, "timestamp": {"$gte": job["start"], "$lt": job["end"]}}
+    # Same order as the (user_id, timestamp desc, _id desc) index, so no in-memory sort.
+    cursor = db["transactions"].find(query, PROJECTION) \
+        .sort([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]) \
+        .batch_size(EXPORT_CHUNK_SIZE)
+
+    rows = 0
+    chunk = []
+    try:
+        async for doc in cursor:
+            doc.pop("_id", None)
+            chunk.append(doc)
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                await asyncio.to_thread(writer.write, chunk)
+                rows += len(chunk)
+                chunk = []
+                await db["export_jobs"].update_one({"_id": job["_id"]}, {"$set": {
+                    "rows": rows, "heartbeat_at": datetime.utcnow()}})
+        if chunk:
+            await asyncio.to_thread(writer.write, chunk)
+            rows += len(chunk)
+    except BaseException:
+        await asyncio.to_thread(writer.close)
+        await asyncio.to_thread(_remove, path)
+        raise
+    await asyncio.to_thread(writer.close)
+    return path, rows
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def expire_files(jobs):
+    """Delete the files of exports finished more than EXPORT_RETENTION ago. Returns how many expired."""
+    expired = 0
+    async for job in jobs.find(
+            {"status": "done", "finished_at": {"$lt": datetime.utcnow() - EXPORT_RETENTION}}, {"path": 1}):
+        await asyncio.to_thread(_remove, job["path"])
+        await jobs.update_one({"_id": job["_id"], "status": "done"}, {
+            "$set": {"status": "expired"}, "$unset": {"path": ""}})
+        expired += 1
+    return expired
+
+
+class ExportWorker:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def enqueue(self, job_id):
+        self._queue.put_nowait(job_id)
+
+    async def start(self):
+        # Jobs that were queued or interrupted by a restart are picked up again.
+        jobs = get_db()["export_jobs"]
+        await self._recover(jobs)
+        async for job in jobs.find({"status": "queued"}, {"_id": 1}).sort("created_at", ASCENDING):
+            self.enqueue(job["_id"])
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._maintain())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        # Let the running export clean up its partial file before the client is closed.
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _recover(self, jobs):
+        """Re-queue running jobs whose heartbeat went stale. Returns their ids."""
+        cutoff = datetime.utcnow() - EXPORT_STALE_AFTER
+        stale = {"status": "running", "$or": [
+            {"heartbeat_at": {"$lt": cutoff}},
+            {"heartbeat_at": {"$exists": False}, "started_at": {"$lt": cutoff}},  # claimed before heartbeats
+        ]}
+        recovered = []
+        async for job in jobs.find(stale, {"_id": 1}):
+            if await jobs.find_one_and_update({**stale, "_id": job["_id"]}, {"$set": {"status": "queued"}}):
+                recovered.append(job["_id"])
+        return recovered
+
+    async def _maintain(self):
+        jobs = get_db()["export_jobs"]
+        while True:
+            await asyncio.sleep(EXPORT_MAINTENANCE_INTERVAL)
+            try:
+                for job_id in await self._recover(jobs):
+                    logging.warning("Re-queued stalled export job %s", job_id)
+                    self.enqueue(job_id)
+                await expire_files(jobs)
+            except Exception as e:
+                logging.error("Export maintenance failed: %s", e)
+
+    async def _run(self):
+        jobs = get_db()["export_jobs"]
+        while True:
+            job_id = await self._queue.get()
+            now = datetime.utcnow()
+            job = await jobs.find_one_and_update(
+                {"_id": job_id, "status": "queued"},
+                {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}},
+            )
+            if job is None:
+                continue
+            try:
+                path, rows = await run_job(job)
+                await jobs.update_one({"_id": job_id}, {"$set": {
+                    "status": "done", "path": path, "rows": rows, "finished_at": datetime.utcnow()}})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Export job %s failed: %s", job_id, e)
+                await jobs.update_one({"_id": job_id}, {"$set": {
+                    "status": "failed", "error": str(e), "finished_at": datetime.utcnow()}})
+
+
+worker = ExportWorker()
@@ -0,0 +1,171 @@
+import importlib.util
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+import metrics
+from resilience import IDEMPOTENT_METHODS, Bulkhead, CircuitBreaker, ResilienceError, RetryPolicy
+
+load_dotenv()
+
+# HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _setting(provider, name, default):
+    """Read `<PROVIDER>_<NAME>`, then `GATEWAY_<NAME>`, then the default."""
+    value = os.getenv(f"{provider.upper()}_{name}", os.getenv(f"GATEWAY_{name}"))
+    return default if value is None else type(default)(value)
+
+
+# Read timeouts (seconds) for lookups that should answer quickly, by path prefix.
+# Anything not listed, notably the calls that move money, gets `<PROVIDER>_READ_TIMEOUT`.
+MONNIFY_TIMEOUTS = {
+    "/api/v1/auth/login": 10.0,
+    "/api/v1/banks": 10.0,
+    "/api/v1/transactions/": 10.0,
+    "/api/v1/disbursements/account/validate": 10.0,
+    "/api/v2/disbursements/single/summary": 10.0,
+    "/api/v2/bank-transfer/reserved-accounts": 20.0,
+}
+PAYSTACK_TIMEOUTS = {
+    "/transaction/initialize": 15.0,
+    "/transferrecipient": 15.0,
+    "/transfer/verify/": 10.0,
+}
+
+
+class GatewayClient:
+    """
+    Shared, pooled async HTTP client for one payment provider.
+
+    The underlying `httpx.AsyncClient` is created lazily on first use and kept
+    for the lifetime of the process so connections (and TLS sessions) are
+    reused across requests instead of being opened per call.
+    """
+
+    def __init__(self, name, base_url, timeouts=None):
+        self.name = name
+        self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=_setting(name, "MAX_CONNECTIONS", 100),
+            max_keepalive_connections=_setting(name, "MAX_KEEPALIVE_CONNECTIONS", 20),
+            keepalive_expiry=_setting(name, "KEEPALIVE_EXPIRY", 30.0),
+        )
+        self.timeout = httpx.Timeout(
+            _setting(name, "READ_TIMEOUT", 30.0),
+            connect=_setting(name, "CONNECT_TIMEOUT", 5.0),
+            pool=_setting(name, "POOL_TIMEOUT", 5.0),
+        )
+        self.http2 = HTTP2_AVAILABLE and _setting(name, "HTTP2", "true").lower() == "true"
+        # Longest prefix first, so e.g. ".../single/summary" wins over ".../single".
+        self.timeouts = sorted((timeouts or {}).items(), key=lambda item: -len(item[0]))
+        self.breaker = CircuitBreaker(
+            name,
+            failure_rate=_setting(name, "BREAKER_FAILURE_RATE", 0.5),
+            min_calls=_setting(name, "BREAKER_MIN_CALLS", 20),
+            window=_setting(name, "BREAKER_WINDOW", 30.0),
+            reset_timeout=_setting(name, "BREAKER_RESET_TIMEOUT", 15.0),
+        )
+        # Below max_connections, so one provider's backlog is shed instead of queueing on the pool.
+        self.bulkhead = Bulkhead(name, _setting(name, "BULKHEAD", 50), _setting(name, "BULKHEAD_WAIT", 1.0))
+        self.retry = RetryPolicy(
+            retries=_setting(name, "MAX_RETRIES", 2),
+            base=_setting(name, "RETRY_BASE", 0.2),
+            cap=_setting(name, "RETRY_CAP", 2.0),
+        )
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+            )
+        return self._client
+
+    def timeout_for(self, path):
+        for prefix, read_timeout in self.timeouts:
+            if path.startswith(prefix):
+                return httpx.Timeout(read_timeout, connect=self.timeout.connect, pool=self.timeout.pool)
+        return self.timeout
+
+    async def request(self, method, path, idempotent=None, **kwargs):
+        """
+        Send through the bulkhead and circuit breaker, retrying transient failures.
+
+        Only idempotent calls (by method, or `idempotent=True`) are retried after
+        the request may have reached the provider.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout_for(path))
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if not self.retry.should_retry(attempt, idempotent, error=e):
+                    raise
+            else:
+                if not self.retry.should_retry(attempt, idempotent, response=response):
+                    return response
+            await self.retry.backoff(attempt)
+            attempt += 1
+
+    async def _send(self, method, path, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self.bulkhead:
+                self.breaker.allow()
+                ok = False
+                try:
+                    response = await self.client.request(method, path, **kwargs)
+                    # 4xx is the provider working as intended; only 5xx and network errors count against it.
+                    ok = response.status_code < 500
+                    outcome = f"{response.status_code // 100}xx"
+                    return response
+                finally:
+                    self.breaker.record(ok)
+        except ResilienceError:
+            outcome = "rejected"
+            raise
+        finally:
+            metrics.observe_gateway(self.name, outcome, time.perf_counter() - started)
+
+    async def get(self, path, **kwargs):
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request("POST", path, **kwargs)
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.stats(),
+            "bulkhead": self.bulkhead.stats(),
+            "retry": self.retry.stats(),
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+paystack = GatewayClient("paystack", os.getenv("PAYSTACK_GATEWAY_URL", "https://api.paystack.co"), PAYSTACK_TIMEOUTS)
+monnify = GatewayClient("monnify", os.getenv("MONNIFY_GATEWAY_URL", "https://api.monnify.com"), MONNIFY_TIMEOUTS)
+
+
+def gateway_stats():
+    return {"monnify": monnify.stats(), "paystack": paystack.stats()}
+
+
+async def close_gateways():
+    await paystack.aclose()
+    await monnify.aclose()
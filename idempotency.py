@@ -0,0 +1,151 @@
+"""
+Idempotency-Key support for money-moving endpoints.
+
+The first request with a given key reserves a slot in `idempotency_keys`
+(keyed by `<user_id>:<key>`, so a lookup is a single _id hit) and runs the
+handler; its response, errors included, is stored on the slot. Later requests
+with the same key get the stored response without running the handler, so a
+client retry after a timeout never reaches the gateways twice.
+
+Completed responses are also kept in an in-process LRU, and requests racing
+the first one in this process await its result instead of polling Mongo.
+Slots expire via a TTL index after `IDEMPOTENCY_TTL_SECONDS`.
+
+A request that stops without a response (cancelled, an unexpected error, or
+a process that died and left its slot "pending" for longer than
+`IDEMPOTENCY_PENDING_LEASE_SECONDS`) may already have reached a gateway, so
+its slot is not freed for a re-run: it becomes a terminal "unknown" record,
+and retries are told to check the outcome rather than sending money again.
+If the original request does finish later, its response replaces that record.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from database import get_db
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a duplicate waits on a request that is still running in another process.
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+# A slot still "pending" after this long belonged to a request that never finished.
+IDEMPOTENCY_PENDING_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_PENDING_LEASE_SECONDS", "120"))
+
+UNKNOWN_OUTCOME = {
+    "status_code": 409,
+    "body": {"detail": "The original request with this Idempotency-Key did not finish and its outcome is unknown; "
+                       "check your transactions before retrying with a new key"},
+}
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+INDEXES = {
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+}
+
+responses = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+_inflight = {}
+
+
+def fingerprint(**params) -> str:
+    """Stable hash of the request parameters, to reject a key reused for a different request."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _replay(record, request_fingerprint, replayed=True):
+    if record["fingerprint"] != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with different parameters")
+    if record["status_code"] >= 400:
+        raise HTTPException(status_code=record["status_code"], detail=record["body"]["detail"],
+                            headers={REPLAYED_HEADER: "true"} if replayed else None)
+    return record["body"]
+
+
+async def _mark_unknown(keys, query):
+    await keys.update_one(query, {"$set": {**UNKNOWN_OUTCOME, "status": "unknown", "completed_at": datetime.utcnow()}})
+
+
+async def _wait_for_record(keys, slot):
+    """Poll a slot held by another process. Returns None if it was released without a response."""
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        doc = await keys.find_one({"_id": slot})
+        if doc is None:
+            return None
+        if doc["status"] in ("done", "unknown"):
+            return doc
+        if doc["created_at"] < datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_PENDING_LEASE_SECONDS):
+            # The request holding the slot died; guarded so it can't overwrite a response that just landed.
+            await _mark_unknown(keys, {"_id": slot, "status": "pending"})
+            continue
+        if asyncio.get_running_loop().time() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+
+async def _execute(keys, slot, request_fingerprint, handler):
+    """Reserve the slot and run `handler`. Returns (record, replayed), or (None, True) if the slot was released."""
+    try:
+        await keys.insert_one({
+            "_id": slot,
+            "fingerprint": request_fingerprint,
+            "status": "pending",
+            "created_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return await _wait_for_record(keys, slot), True
+
+    try:
+        body = await handler()
+        record = {"fingerprint": request_fingerprint, "status_code": 200, "body": body}
+    except HTTPException as e:
+        record = {"fingerprint": request_fingerprint, "status_code": e.status_code, "body": {"detail": e.detail}}
+    except BaseException:
+        # The handler may have got as far as a gateway call, so a retry must not run it again.
+        await asyncio.shield(_mark_unknown(keys, {"_id": slot}))
+        raise
+
+    await keys.update_one({"_id": slot}, {"$set": {**record, "status": "done", "completed_at": datetime.utcnow()}})
+    return record, False
+
+
+async def run(user_id, key, request_fingerprint, handler):
+    """
+    Run `handler` (a coroutine function returning the response body) at most once per (user, key).
+
+    Returns `(body, replayed)`. A stored error response is re-raised as the
+    same HTTPException.
+    """
+    slot = f"{user_id}:{key}"
+    while True:
+        record = responses.get(slot)
+        if record is None and slot in _inflight:
+            record = await asyncio.shield(_inflight[slot])
+            if record is None:
+                continue
+        if record is not None:
+            return _replay(record, request_fingerprint), True
+
+        # Waiters get None if this attempt fails, and then try the key themselves.
+        future = asyncio.get_running_loop().create_future()
+        _inflight[slot] = future
+        record = None
+        try:
+            record, replayed = await _execute(get_db()["idempotency_keys"], slot, request_fingerprint, handler)
+        finally:
+            del _inflight[slot]
+            future.set_result(record)
+        if record is None:
+            continue
+        responses.set(slot, record)
+        return _replay(record, request_fingerprint, replayed), replayed
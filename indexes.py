@@ -0,0 +1,140 @@
+"""
+Index bootstrap and the catalogue of query shapes the service relies on.
+
+`ensure_indexes` runs from the app lifespan and is idempotent: creating an
+index that already exists with the same spec is a no-op in MongoDB.
+`QUERY_SHAPES` lists every filter/sort the routes issue so
+`scripts/audit_query_plans.py` can check none of them plans as a COLLSCAN.
+"""
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import exports
+import idempotency
+import ledger
+import reconciler
+import recipients
+import registration
+import transfers
+import webhook_archive
+import webhook_inbox
+
+# Only index real values: users awaiting a reserved account have
+# account_number None, and Paystack rows have no reference.
+NON_EMPTY_STRING = {"$gt": ""}
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("account_number", ASCENDING)], unique=True, name="account_number_unique",
+                   partialFilterExpression={"account_number": NON_EMPTY_STRING}),
+    ],
+    "transactions": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+                   name="user_id_timestamp"),
+        IndexModel([("reference", ASCENDING)], unique=True, name="reference_unique",
+                   partialFilterExpression={"reference": NON_EMPTY_STRING}),
+        IndexModel([("transfer_code", ASCENDING)], unique=True, name="transfer_code_unique",
+                   partialFilterExpression={"transfer_code": NON_EMPTY_STRING}),
+        IndexModel([("status", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="pending_transfers", partialFilterExpression={"transfer_code": NON_EMPTY_STRING}),
+        IndexModel([("refund_pending", ASCENDING)], name="refund_pending", sparse=True),
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="unresolved_transfers",
+                   partialFilterExpression={"unresolved": True}),
+    ],
+    **ledger.INDEXES,
+    **exports.INDEXES,
+    **idempotency.INDEXES,
+    **registration.INDEXES,
+    **transfers.INDEXES,
+    **recipients.INDEXES,
+    **webhook_inbox.INDEXES,
+    **webhook_archive.INDEXES,
+}
+
+
+def query_shapes():
+    """(collection, filter, sort) for every query the routes and workers issue."""
+    sample_id = ObjectId()
+    now = datetime.utcnow()
+    return [
+        ("users", {"_id": sample_id}, None),
+        ("users", {"email": "audit@example.com"}, None),
+        ("users", {"account_number": "0000000000"}, None),
+        ("transactions", {"user_id": str(sample_id)}, [("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("transactions", {"reference": "AUDIT_REFERENCE"}, None),
+        ("transactions", {"transfer_code": "TRF_audit"}, None),
+        ("transactions", reconciler.pending_filter(now), [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+        ("transactions", {"refund_pending": True}, None),
+        ("transactions", reconciler.unresolved_filter(now), [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+        ("transactions", {"user_id": {"$in": [str(sample_id)]}, "timestamp": {"$gte": now, "$lt": now}},
+         [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        ("idempotency_keys", {"_id": "audit:key"}, None),
+        ("registration_jobs", {"status": "queued"}, [("next_attempt_at", ASCENDING)]),
+        ("registration_jobs", {"status": "running", "started_at": {"$lt": now}}, None),
+        ("registration_jobs", {"status": "queued", "next_attempt_at": {"$lt": now}}, None),
+        ("transfer_batches", {"status": "queued"}, [("created_at", ASCENDING)]),
+        ("transfer_batches", {"status": "needs_review"}, None),
+        ("transfer_batches", {"status": "running", "started_at": {"$lt": now}}, None),
+        ("paystack_recipients", {"account_number": "0000000000", "bank_code": "000"}, None),
+        ("locks", {"_id": "audit", "expires_at": {"$lt": now}}, None),
+        ("export_jobs", {"status": "queued"}, [("created_at", ASCENDING)]),
+        ("export_jobs", {"status": "running", "heartbeat_at": {"$lt": now}}, None),
+        ("export_jobs", {"status": "done", "finished_at": {"$lt": now}}, None),
+        ("webhook_inbox", {"status": "pending"}, [("received_at", ASCENDING)]),
+        ("webhook_inbox", {"claimed_by": "audit", "status": "processing"}, None),
+        ("webhook_inbox", {"status": "processing", "claimed_at": {"$lt": now}}, None),
+        ("webhook_archive", {"_id": "monnify:AUDIT_REFERENCE"}, None),
+        ("ledger_entries", {"account": "wallet:audit", "created_at": {"$lte": now}}, None),
+        ("ledger_entries", ledger.unapplied_filter(now), None),
+        ("ledger_entries", {"account": "wallet:audit", "created_at": {"$lte": now}},
+         [("created_at", DESCENDING), ("_id", DESCENDING)]),
+        ("ledger_snapshots", {"account": "wallet:audit", "as_of": {"$lte": now}},
+         [("as_of", DESCENDING), ("last_entry_id", DESCENDING)]),
+    ]
+
+
+async def ensure_indexes(db, indexes=None):
+    """
+    Create every index in `indexes` (default: all of them).
+
+    A failure on one index (typically a unique index over legacy duplicates)
+    is logged and skipped so the service still starts; the audit script will
+    then flag the affected query shape.
+    """
+    for collection, models in (indexes or INDEXES).items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                logging.error("Could not create index %s on %s: %s", model.document["name"], collection, e)
+
+
+def plan_stages(plan):
+    """Yield every `stage` name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+async def audit_query_shapes(db):
+    """Return [(collection, filter, sort, stages)] for every shape whose winning plan is a COLLSCAN."""
+    failures = []
+    for collection, query, sort in query_shapes():
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            failures.append((collection, query, sort, stages))
+    return failures
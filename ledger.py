@@ -0,0 +1,214 @@
+"""
+Append-only double-entry ledger.
+
+Every money movement is journalled as two entries in `ledger_entries` that sum
+to zero, with amounts stored as integer kobo. Entries are never deleted, and
+corrections are posted as new journal transactions; the one field ever updated
+is `applied`, which a wallet credit's entry carries until the matching
+`wallet_balance` credit has been made (see `wallet.apply_pending_credits`).
+
+Each account gets a row in `ledger_snapshots` every `LEDGER_SNAPSHOT_EVERY`
+entries, so a balance is the last snapshot plus a bounded tail of entries
+rather than a scan of the account's whole history.
+
+Outgoing transfers are reserved into `IN_FLIGHT_ACCOUNT` when the wallet is
+debited, and leave it either to the provider (settled) or back to the wallet
+(refunded), so a wallet's ledger balance moves with `wallet_balance` while a
+transfer's outcome is still unknown.
+
+A wallet's history is only complete once it is "open": from registration for
+new users, or once `scripts/backfill_ledger.py` has given an existing wallet
+its opening balance. Until then, balances come from `wallet_balance`.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+KOBO_PER_NAIRA = 100
+SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "500"))
+# Entries newer than this are left out of snapshots so a late write from a
+# worker with a slightly skewed clock still lands in the tail.
+SNAPSHOT_SETTLE = timedelta(seconds=int(os.getenv("LEDGER_SNAPSHOT_SETTLE_SECONDS", "5")))
+
+DUPLICATE_KEY = 11000
+
+IN_FLIGHT_ACCOUNT = "clearing:transfers_in_flight"
+
+INDEXES = {
+    "ledger_entries": [
+        IndexModel([("txn_id", ASCENDING), ("account", ASCENDING)], unique=True),
+        IndexModel([("account", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("created_at", ASCENDING)], name="unapplied_credits",
+                   partialFilterExpression={"applied": False}),
+    ],
+    "ledger_snapshots": [
+        IndexModel([("account", ASCENDING), ("as_of", DESCENDING), ("last_entry_id", DESCENDING)]),
+    ],
+}
+
+
+def to_kobo(amount) -> int:
+    """Convert a naira amount (float, str or Decimal) to integer kobo without float drift."""
+    return int((Decimal(str(amount)) * KOBO_PER_NAIRA).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def to_naira(kobo: int) -> float:
+    return kobo / KOBO_PER_NAIRA
+
+
+def wallet_account(user_id) -> str:
+    return f"wallet:{user_id}"
+
+
+def provider_account(provider: str) -> str:
+    """Clearing account for money held at / sent through a payment provider."""
+    return f"provider:{provider}"
+
+
+def journal_entries(txn_id, from_account, to_account, amount_kobo, entry_type, reference=None, created_at=None):
+    """Build the two balancing entries that move `amount_kobo` from one account to another."""
+    created_at = created_at or datetime.utcnow()
+    common = {"txn_id": txn_id, "type": entry_type, "reference": reference, "created_at": created_at}
+    return [
+        {**common, "account": from_account, "amount": -amount_kobo},
+        {**common, "account": to_account, "amount": amount_kobo},
+    ]
+
+
+async def insert_entries(db, entries):
+    """
+    Append entries, skipping any (txn_id, account) pair that is already journalled.
+
+    Returns the entries that were actually inserted. The unique index makes
+    this the dedup point for money movements: of any number of concurrent or
+    repeated posts of one transaction, exactly one inserts each entry.
+    """
+    if not entries:
+        return []
+    try:
+        await db["ledger_entries"].insert_many(entries, ordered=False)
+        return list(entries)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+        skipped = {error["index"] for error in errors}
+        return [entry for i, entry in enumerate(entries) if i not in skipped]
+
+
+async def post(db, txn_id, from_account, to_account, amount_kobo, entry_type, reference=None, created_at=None):
+    """
+    Journal one transfer between two accounts. Re-posting the same `txn_id` is a no-op.
+
+    Returns True only for the call that journalled the `to_account` side, so
+    callers can apply a matching wallet credit exactly when this returns True.
+    """
+    entries = journal_entries(txn_id, from_account, to_account, amount_kobo, entry_type, reference, created_at)
+    inserted = await post_entries(db, entries)
+    return any(entry["account"] == to_account for entry in inserted)
+
+
+async def post_entries(db, entries):
+    """
+    Journal a batch of prebuilt entries (see `journal_entries`) and snapshot any account that is due.
+    Returns the entries that were new.
+    """
+    inserted = await insert_entries(db, entries)
+    counts = {}
+    for entry in inserted:
+        counts[entry["account"]] = counts.get(entry["account"], 0) + 1
+    await asyncio.gather(*(_count_entry(db, account, count) for account, count in counts.items()))
+    return inserted
+
+
+def unapplied_filter(before=None) -> dict:
+    """Wallet credit entries not yet applied to `wallet_balance`; matches the partial `unapplied_credits` index."""
+    query = {"applied": False}
+    if before is not None:
+        query["created_at"] = {"$lt": before}
+    return query
+
+
+async def mark_applied(db, entries):
+    await db["ledger_entries"].update_many(
+        {"_id": {"$in": [entry["_id"] for entry in entries]}}, {"$set": {"applied": True}}
+    )
+
+
+async def is_posted(db, txn_id, account) -> bool:
+    """Whether `txn_id` has already been journalled against `account`."""
+    return await db["ledger_entries"].find_one({"txn_id": txn_id, "account": account}, {"_id": 1}) is not None
+
+
+async def open_account(db, account):
+    """Mark `account`'s ledger history as complete from now on (idempotent; keeps the earliest time)."""
+    await db["ledger_accounts"].update_one(
+        {"_id": account}, {"$min": {"opened_at": datetime.utcnow()}}, upsert=True
+    )
+
+
+async def is_open(db, account) -> bool:
+    return await db["ledger_accounts"].find_one({"_id": account, "opened_at": {"$exists": True}}, {"_id": 1}) \
+        is not None
+
+
+async def _count_entry(db, account, count=1):
+    counter = await db["ledger_accounts"].find_one_and_update(
+        {"_id": account},
+        {"$inc": {"entries_since_snapshot": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if counter["entries_since_snapshot"] >= SNAPSHOT_EVERY:
+        await db["ledger_accounts"].update_one(
+            {"_id": account}, {"$inc": {"entries_since_snapshot": -counter["entries_since_snapshot"]}}
+        )
+        await snapshot(db, account)
+
+
+async def snapshot(db, account):
+    """Record the balance of `account` up to its latest settled entry."""
+    last = await db["ledger_entries"].find_one(
+        {"account": account, "created_at": {"$lte": datetime.utcnow() - SNAPSHOT_SETTLE}},
+        sort=[("created_at", DESCENDING), ("_id", DESCENDING)],
+    )
+    if last is None:
+        return None
+
+    doc = {
+        "account": account,
+        "as_of": last["created_at"],
+        "last_entry_id": last["_id"],
+        "balance": await balance_at(db, account, last["created_at"]),
+        "created_at": datetime.utcnow(),
+    }
+    await db["ledger_snapshots"].insert_one(doc)
+    return doc
+
+
+async def balance_at(db, account, at=None) -> int:
+    """Balance of `account` in kobo as of `at` (default: now)."""
+    at = at or datetime.utcnow()
+    match = {"account": account, "created_at": {"$lte": at}}
+    balance = 0
+
+    snap = await db["ledger_snapshots"].find_one(
+        {"account": account, "as_of": {"$lte": at}},
+        sort=[("as_of", DESCENDING), ("last_entry_id", DESCENDING)],
+    )
+    if snap:
+        balance = snap["balance"]
+        match["$or"] = [
+            {"created_at": {"$gt": snap["as_of"]}},
+            {"created_at": snap["as_of"], "_id": {"$gt": snap["last_entry_id"]}},
+        ]
+
+    tail = await db["ledger_entries"].aggregate([
+        {"$match": match},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}},
+    ]).to_list(1)
+    return balance + (tail[0]["total"] if tail else 0)
@@ -0,0 +1,179 @@
+"""
+Structured, non-blocking logging.
+
+`configure()` routes every record through a `QueueHandler`: the calling
+coroutine only appends the record to a queue, and a `QueueListener` thread
+formats it as one JSON object per line and writes it out. Messages use
+%-style arguments (`logging.info("Batch %s queued", batch_id)`), so records
+below `LOG_LEVEL` are dropped before any formatting happens.
+
+Before anything is written:
+
+* keys that hold secrets (tokens, passwords, BVNs, ...) are replaced with
+  "[REDACTED]" and keys that hold PII (account numbers, emails, phones) are
+  masked to their last four characters, at any depth in `extra` fields and
+  dict/list arguments;
+* bearer tokens and 10-11 digit numbers (NUBANs, BVNs, phones) in the
+  message text are masked too;
+* records tagged `extra={"event": name}` are kept only at the event's
+  sampling rate (`LOG_SAMPLE_RATES`), for verbose payload logging.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Per-event sampling, e.g. "monnify.transfer.response=0.05,webhook.payload=0.01".
+DEFAULT_SAMPLE_RATES = {
+    "monnify.auth.response": 0.01,
+    "monnify.reserved_account.request": 0.1,
+    "monnify.transfer.request": 0.01,
+    "monnify.transfer.response": 0.01,
+    "paystack.error.response": 0.1,
+    "webhook.payload": 0.01,
+}
+LOG_SAMPLE_RATES = {
+    **DEFAULT_SAMPLE_RATES,
+    **{
+        event: float(rate)
+        for event, rate in (pair.split("=") for pair in os.getenv("LOG_SAMPLE_RATES", "").split(",") if pair)
+    },
+}
+
+REDACTED = "[REDACTED]"
+SECRET_KEYS = {
+    "authorization", "password", "token", "accesstoken", "access_token", "refresh_token", "secret",
+    "api_key", "apikey", "secret_key", "bvn", "nin", "pin", "otp", "cvv",
+}
+PII_KEYS = {
+    "account_number", "accountnumber", "destinationaccountnumber", "sourceaccountnumber",
+    "recipient_account", "recipient_account_number", "email", "customeremail", "phone", "phone_number",
+}
+_BEARER = re.compile(r"(Bearer|Basic)\s+[A-Za-z0-9._~+/=-]+")
+_LONG_NUMBER = re.compile(r"\b\d{6,7}(\d{4})\b")
+
+# Attributes every LogRecord has; anything else came from `extra`.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+dropped = 0
+_listener = None
+
+
+def _mask(value):
+    value = str(value)
+    return "*" * max(len(value) - 4, 0) + value[-4:]
+
+
+def redact(value, key=None):
+    """Copy `value` with secret fields removed, PII fields masked and free text scrubbed, recursively."""
+    if key is not None:
+        normalized = key.lower()
+        if normalized in SECRET_KEYS:
+            return REDACTED
+        if normalized in PII_KEYS and isinstance(value, (str, int)):
+            return _mask(value)
+    if isinstance(value, dict):
+        return {k: redact(v, k if isinstance(k, str) else None) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return scrub(value)
+    return value
+
+
+def scrub(text):
+    """Mask credentials and account-like numbers in free text."""
+    return _LONG_NUMBER.sub(lambda m: "*" * (len(m.group(0)) - 4) + m.group(1), _BEARER.sub(r"\1 " + REDACTED, text))
+
+
+class SamplingFilter(logging.Filter):
+    """Keep records tagged with an `event` only at that event's sampling rate."""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = LOG_SAMPLE_RATES if rates is None else rates
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if event is None:
+            return True
+        return random.random() < self.rates.get(event, 1.0)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        args = record.args
+        if args:
+            record.args = redact(args) if isinstance(args, dict) else tuple(redact(arg) for arg in args)
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": scrub(record.getMessage()),
+        }
+        record.args = args
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = redact(value, key)
+        if record.exc_info:
+            entry["exception"] = scrub(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable variant for local development; still redacted."""
+
+    def format(self, record):
+        message = super().format(record)
+        extras = {key: redact(value, key) for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        return scrub(f"{message} {extras}" if extras else message)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # The stock handler formats here, on the caller's thread; leave that to the listener.
+        return record
+
+    def enqueue(self, record):
+        global dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1  # Never block a request on logging.
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Install the queue handler on the root logger and start the writer thread. Safe to call again."""
+    global _listener
+    shutdown()
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # httpx logs every request at INFO; the gateway metrics already cover that.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,9 +1,50 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Response
 from routes.auth_routes import router as auth_router
 from fastapi.middleware.cors import CORSMiddleware
 from routes.banking_routes import router as banking_router
+import bank_directory
+import database
+import gateway
+import indexes
+import logs
+import metrics
+import passwords
+import reconciler
+import registration
+import responses
+import transfers
+import exports
+import webhook_inbox
 
-app = FastAPI()
+
+logs.configure()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await database.connect()
+    await indexes.ensure_indexes(database.get_db())
+    await bank_directory.directory.load()
+    await exports.worker.start()
+    await webhook_inbox.worker.start()
+    await registration.worker.start()
+    await transfers.runner.start()
+    reconciler.reconciler.start()
+    yield
+    reconciler.reconciler.stop()
+    await transfers.runner.stop()
+    await registration.worker.stop()
+    await webhook_inbox.worker.stop()
+    await exports.worker.stop()
+    await gateway.close_gateways()
+    passwords.hasher.shutdown()
+    database.close()
+    logs.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=responses.BSONJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -11,6 +52,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(banking_router, prefix="/banking", tags=["Banking"])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
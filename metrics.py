@@ -0,0 +1,198 @@
+"""
+Prometheus metrics.
+
+* `MetricsMiddleware` times every request by route template (not raw path,
+  so IDs don't explode the label set), counts responses by status code and
+  tracks requests in flight.
+* `GatewayClient` times every provider call by provider, operation and
+  outcome; helpers in `utils.py` name the operation with `@gateway_operation`.
+* `mongo_listener` is a pymongo `CommandListener` that times every command
+  by collection and command name.
+* A custom collector reads gateway breaker/bulkhead state and cache counters
+  at scrape time, so they cost nothing between scrapes.
+
+Everything is exposed at `GET /metrics`.
+"""
+import contextvars
+import functools
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+
+# Bearer token required to scrape /metrics; unset leaves the endpoint open (restrict it at the ingress instead).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+http_requests = Counter("http_requests_total", "HTTP responses by route and status code.",
+                        ["method", "route", "status"])
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route.",
+                         ["method", "route"], buckets=LATENCY_BUCKETS)
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served.", ["method"])
+
+gateway_latency = Histogram("gateway_request_duration_seconds", "Payment provider call latency.",
+                            ["provider", "operation", "outcome"], buckets=LATENCY_BUCKETS)
+
+mongo_latency = Histogram("mongo_command_duration_seconds", "MongoDB command latency.",
+                          ["collection", "command"], buckets=MONGO_BUCKETS)
+mongo_failures = Counter("mongo_command_failures_total", "MongoDB commands that failed.", ["collection", "command"])
+
+_operation = contextvars.ContextVar("gateway_operation", default="other")
+
+
+# HTTP
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no per-request Request/Response objects, unlike BaseHTTPMiddleware).
+
+    The route label is read from `scope["route"]`, which the router fills in
+    while dispatching, so no extra route matching is done. The in-flight gauge
+    has to be set before that, so it is per method only.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+        in_flight = http_in_flight.labels(method)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope["route"].path if "route" in scope else "unmatched"  # 404s share one label
+            http_latency.labels(method, route).observe(time.perf_counter() - started)
+            http_requests.labels(method, route, str(status)).inc()
+            in_flight.dec()
+
+
+# Gateways
+
+def gateway_operation(name):
+    """Label provider calls made inside the decorated helper with operation `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _operation.set(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _operation.reset(token)
+        return wrapper
+    return decorator
+
+
+def observe_gateway(provider, outcome, seconds):
+    gateway_latency.labels(provider, _operation.get(), outcome).observe(seconds)
+
+
+# Mongo
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = \
+            collection if isinstance(collection, str) else event.database_name
+
+    def _finish(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "unknown")
+        return collection, event.command_name
+
+    def succeeded(self, event):
+        collection, command = self._finish(event)
+        mongo_latency.labels(collection, command).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection, command = self._finish(event)
+        mongo_latency.labels(collection, command).observe(event.duration_micros / 1e6)
+        mongo_failures.labels(collection, command).inc()
+
+
+mongo_listener = MongoCommandListener()
+
+
+# Scrape-time state
+
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class StateCollector:
+    """Reads in-memory stats from the modules that keep them, only when Prometheus scrapes."""
+
+    def describe(self):
+        # Keeps the registry from calling collect() at import time, before those modules exist.
+        return []
+
+    def collect(self):
+        import account_resolution
+        import gateway
+        import idempotency
+        import logs
+        import passwords
+        import principals
+        import recipients
+
+        breaker = GaugeMetricFamily("gateway_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+                                    labels=["provider"])
+        rejected = CounterMetricFamily("gateway_rejected", "Calls refused locally, by guard.",
+                                       labels=["provider", "guard"])
+        in_flight = GaugeMetricFamily("gateway_in_flight", "Provider calls in flight.", labels=["provider"])
+        retried = CounterMetricFamily("gateway_retries", "Provider calls retried.", labels=["provider"])
+        for name, stats in gateway.gateway_stats().items():
+            breaker.add_metric([name], _BREAKER_STATES[stats["breaker"]["state"]])
+            rejected.add_metric([name, "breaker"], stats["breaker"]["rejected"])
+            rejected.add_metric([name, "bulkhead"], stats["bulkhead"]["rejected"])
+            in_flight.add_metric([name], stats["bulkhead"]["in_flight"])
+            retried.add_metric([name], stats["retry"]["retried"])
+        yield from (breaker, rejected, in_flight, retried)
+
+        hits = CounterMetricFamily("cache_hits", "In-process cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "In-process cache misses.", labels=["cache"])
+        size = GaugeMetricFamily("cache_entries", "In-process cache entries.", labels=["cache"])
+        caches = {
+            "principals": principals.principals.stats(),
+            "tokens": principals.tokens.stats(),
+            "idempotency": idempotency.responses.stats(),
+            "paystack_recipients": recipients.recipients.stats(),
+            "account_names": account_resolution.names.stats(),
+        }
+        for name, stats in caches.items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield from (hits, misses, size)
+
+        hasher = passwords.hasher.stats()
+        yield GaugeMetricFamily("password_hash_pending", "bcrypt jobs queued or running.", value=hasher["pending"])
+        yield CounterMetricFamily("password_hash_rejected", "bcrypt jobs shed with a 429.", value=hasher["rejected"])
+        yield CounterMetricFamily("log_records_dropped", "Log records dropped because the log queue was full.",
+                                  value=logs.dropped)
+
+
+REGISTRY.register(StateCollector())
+
+
+def render():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
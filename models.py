@@ -1,7 +1,10 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, BeforeValidator, EmailStr, Field
+from typing import Annotated, List, Optional
 from datetime import datetime
 
+# Mongo ObjectIds, returned as their hex string.
+ObjectIdStr = Annotated[str, BeforeValidator(str)]
+
 
 class UserRegister(BaseModel):
     name: str
@@ -29,8 +32,76 @@ class TransferRequest(BaseModel):
     recipient_account: str
     bank_code: str
     amount: float
+    narration: str = "Bank Transfer"
+
+
+class BatchTransferItem(BaseModel):
+    amount: float
+    destination_bank_code: str
+    destination_account_number: str
+    narration: str
+
+
+class BatchTransferRequest(BaseModel):
+    transfers: List[BatchTransferItem]
+
+
+class AccountLookup(BaseModel):
+    account_number: str
+    bank_code: str
+
+
+class AccountResolutionRequest(BaseModel):
+    accounts: List[AccountLookup]
 
 
 class DepositWebhook(BaseModel):
     event: str
     data: dict
+
+
+class ExportRequest(BaseModel):
+    start: datetime
+    end: datetime
+    format: str = "csv"  # "csv" or "parquet"
+    account_numbers: Optional[List[str]] = None  # admins only; defaults to the caller's own account
+
+
+# Response models. Routes fetch exactly these fields (see `responses.projection`).
+
+class UserOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    profile_image: Optional[str] = None
+    account_number: Optional[str] = None
+    bank_name: Optional[str] = None
+    wallet_balance: Optional[float] = None
+    is_admin: bool = False
+    status: Optional[str] = None
+
+
+class BalanceOut(BaseModel):
+    balance: float
+
+
+class TransactionOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    type: Optional[str] = None
+    amount: Optional[float] = None
+    status: Optional[str] = None
+    reference: Optional[str] = None
+    transfer_code: Optional[str] = None
+    narration: Optional[str] = None
+    method: Optional[str] = None
+    recipient_account_number: Optional[str] = None
+    recipient_account: Optional[str] = None
+    recipient_bank_code: Optional[str] = None
+    source_account: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+
+class TransactionPage(BaseModel):
+    transactions: List[TransactionOut]
+    next_cursor: Optional[str] = None
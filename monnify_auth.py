@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+
+class MonnifyTokenManager:
+    """
+    Cache the Monnify access token until shortly before it expires.
+
+    `fetch_token` is a coroutine returning `(access_token, expires_in_seconds)`.
+    Concurrent callers share a single in-flight refresh, and a token that is
+    still valid but close to expiry is refreshed in the background so the
+    request path never waits on `/auth/login`.
+    """
+
+    def __init__(self, fetch_token, expiry_margin=60, refresh_ahead=300, clock=time.monotonic):
+        self._fetch_token = fetch_token
+        self._expiry_margin = expiry_margin
+        self._refresh_ahead = refresh_ahead
+        self._clock = clock
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    async def get_token(self):
+        now = self._clock()
+        if self._token and now < self._expires_at - self._expiry_margin:
+            self.hits += 1
+            if now >= self._expires_at - self._refresh_ahead:
+                self._refresh_in_background()
+            return self._token
+
+        self.misses += 1
+        return await self._refresh()
+
+    async def force_refresh(self, rejected_token):
+        """
+        Refresh after the gateway rejected `rejected_token` with a 401.
+
+        Only the first caller holding the rejected token triggers a refresh;
+        everyone else gets the replacement (or joins the in-flight refresh).
+        """
+        if self._token == rejected_token:
+            self._token = None
+            self._expires_at = 0.0
+        if self._token:
+            return self._token
+        return await self._refresh()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "expires_in": max(0.0, self._expires_at - self._clock()) if self._token else 0.0,
+        }
+
+    async def _refresh(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.ensure_future(self._do_refresh())
+        # Shield so one cancelled caller doesn't cancel the refresh for everyone else.
+        return await asyncio.shield(self._refresh_task)
+
+    def _refresh_in_background(self):
+        if self._refresh_task is not None:
+            return
+        self._refresh_task = asyncio.ensure_future(self._do_refresh())
+        self._refresh_task.add_done_callback(self._log_background_failure)
+
+    @staticmethod
+    def _log_background_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Background Monnify token refresh failed: %s", task.exception())
+
+    async def _do_refresh(self):
+        try:
+            token, expires_in = await self._fetch_token()
+            self._token = token
+            self._expires_at = self._clock() + float(expires_in)
+            self.refreshes += 1
+            return token
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._refresh_task = None
@@ -0,0 +1,77 @@
+"""
+Keyset pagination and NDJSON streaming for transaction history.
+
+Pages are ordered by (timestamp desc, _id desc) and served straight off the
+(user_id, timestamp, _id) index. The cursor is an opaque token encoding the
+sort key of the last row returned, so fetching page N costs the same as
+fetching page 1 no matter how long the history is.
+"""
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+from models import TransactionOut
+from responses import dumps, projection
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 500
+
+SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+# Only what the apps display; never the raw provider payload.
+TRANSACTION_PROJECTION = projection(TransactionOut)
+
+
+def encode_cursor(doc) -> str:
+    key = {"t": doc["timestamp"].isoformat() if doc.get("timestamp") else None, "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(key["t"]) if key["t"] else None
+        return timestamp, ObjectId(key["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def history_filter(user_id: str, cursor: str = None) -> dict:
+    query = {"user_id": user_id}
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        # Rows without a timestamp sort after every dated row (newest first), and `$lt` never matches them.
+        query["$or"] = [{"timestamp": timestamp, "_id": {"$lt": last_id}}]
+        if timestamp is not None:
+            query["$or"] += [{"timestamp": {"$lt": timestamp}}, {"timestamp": None}]
+    return query
+
+
+async def transaction_page(transactions, user_id: str, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    One page of history plus the cursor for the next page (None on the last page).
+    Documents are returned as read (ObjectId, datetime); render them with `BSONJSONResponse`.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    docs = await transactions.find(history_filter(user_id, cursor), TRANSACTION_PROJECTION) \
+        .sort(SORT).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return {
+        "transactions": docs[:limit],
+        "next_cursor": next_cursor,
+    }
+
+
+async def stream_transactions(transactions, user_id: str, cursor: str = None):
+    """Yield history as NDJSON lines straight from the Mongo cursor, one batch in memory at a time."""
+    docs = transactions.find(history_filter(user_id, cursor), TRANSACTION_PROJECTION) \
+        .sort(SORT).batch_size(STREAM_BATCH_SIZE)
+    async for doc in docs:
+        yield dumps(doc) + b"\n"
@@ -0,0 +1,74 @@
+"""
+Password hashing off the event loop.
+
+bcrypt costs tens of milliseconds of CPU per call, which would stall every
+other request on the worker if run inline in an `async def` handler. Hashes
+and verifications run on a dedicated, fixed-size thread pool instead (the
+bcrypt backend releases the GIL), and once `PASSWORD_HASH_MAX_PENDING`
+operations are queued or running, new ones are refused with a 429 rather
+than queueing without bound.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from utils import pwd_context
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
+
+class PasswordHasher:
+    def __init__(self, context, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING):
+        self._context = context
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._pending >= self._max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Too many sign-in and sign-up requests in progress, retry shortly",
+                                headers={"Retry-After": "1"})
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """Returns `(valid, new_hash)`; `new_hash` is set when the stored hash uses an outdated cost factor."""
+        return await self._run(self._context.verify_and_update, password, hashed_password)
+
+    def stats(self):
+        return {
+            "workers": self._workers,
+            "max_pending": self._max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hasher = PasswordHasher(pwd_context)
@@ -0,0 +1,67 @@
+"""
+Per-worker cache of authenticated principals.
+
+`get_current_user` runs on every authenticated request. Decoded tokens and
+slim user records (every profile field except the password hash) are kept
+in short-TTL LRUs, so the hot path usually costs neither a JWT decode nor a
+Mongo round trip. Writers that change a user's balance or profile call
+`invalidate`; other workers converge within `PRINCIPAL_TTL_SECONDS`. Money
+decisions never rely on the cached balance, which is for display only.
+"""
+import os
+import time
+
+from bson import ObjectId
+
+from cache import TTLCache
+
+PRINCIPAL_TTL_SECONDS = float(os.getenv("PRINCIPAL_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+PRINCIPAL_PROJECTION = {
+    "name": 1,
+    "email": 1,
+    "phone": 1,
+    "profile_image": 1,
+    "wallet_balance": 1,
+    "account_number": 1,
+    "bank_name": 1,
+    "is_admin": 1,
+    "status": 1,
+}
+
+tokens = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_TTL_SECONDS)
+principals = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_TTL_SECONDS)
+
+
+def decode(token: str, decode_token) -> dict:
+    """Decode `token` with `decode_token`, caching the payload until it (or the TTL) expires."""
+    payload = tokens.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        ttl = PRINCIPAL_TTL_SECONDS
+        if payload.get("exp"):
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            tokens.set(token, payload, ttl)
+    return payload
+
+
+async def load(users, user_id: str):
+    """Return a copy of the cached principal for `user_id`, or None if the user does not exist."""
+    principal = principals.get(user_id)
+    if principal is None:
+        principal = await users.find_one({"_id": ObjectId(user_id)}, PRINCIPAL_PROJECTION)
+        if principal is None:
+            return None
+        principals.set(user_id, principal)
+    # Routes may mutate what they get back (e.g. stringifying _id).
+    return dict(principal)
+
+
+def invalidate(user_id):
+    principals.pop(str(user_id))
+
+
+def stats():
+    return {"tokens": tokens.stats(), "principals": principals.stats()}
@@ -0,0 +1,204 @@
+"""
+Latency-aware routing of single transfers between Monnify and Paystack.
+
+Every transfer attempt is recorded against its provider, both overall and for
+the destination bank, in a rolling `ROUTING_WINDOW_SECONDS` window. A
+transfer goes to the provider with the best score for its bank:
+
+    score = weight * success_rate - ROUTING_LATENCY_WEIGHT * p95_latency_seconds
+
+using the per-bank figures once there are `ROUTING_MIN_SAMPLES` of them and
+the provider-wide figures until then. A provider with no recent samples scores
+as perfect, so it gets tried, and `ROUTING_EXPLORE_RATE` of transfers go to
+the runner-up so its figures stay current. Providers whose circuit breaker is
+open are tried last. Per-bank figures are kept for the `ROUTING_MAX_BANKS`
+most recently used (provider, bank) pairs; bank codes come from clients, so
+the least recently used are dropped rather than letting the table grow.
+
+A transfer only falls back to the next provider when the first one certainly
+did not move money: it rejected the transfer, or the call never left this
+process. When the outcome is unknown (timeout, 5xx) the transfer stops there
+rather than risk paying twice.
+"""
+import math
+import os
+import random
+import time
+from collections import OrderedDict, deque
+
+import gateway
+import recipients
+from utils import get_monnify_transfer_status, initiate_monnify_transfer, initiate_paystack_transfer
+
+ROUTING_WINDOW_SECONDS = float(os.getenv("ROUTING_WINDOW_SECONDS", "300"))
+ROUTING_MAX_SAMPLES = int(os.getenv("ROUTING_MAX_SAMPLES", "500"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "20"))
+ROUTING_LATENCY_WEIGHT = float(os.getenv("ROUTING_LATENCY_WEIGHT", "0.1"))
+ROUTING_EXPLORE_RATE = float(os.getenv("ROUTING_EXPLORE_RATE", "0.05"))
+ROUTING_MAX_BANKS = int(os.getenv("ROUTING_MAX_BANKS", "2000"))
+# Static preference per provider, e.g. "monnify=1.0,paystack=0.8".
+ROUTING_WEIGHTS = {
+    name: float(weight)
+    for name, weight in (pair.split("=") for pair in os.getenv("ROUTING_WEIGHTS", "monnify=1.0,paystack=1.0").split(","))
+}
+
+PROVIDERS = ("monnify", "paystack")
+
+
+class RollingStats:
+    """Outcomes and latencies of the last `max_samples` attempts within `window` seconds."""
+
+    def __init__(self, window=ROUTING_WINDOW_SECONDS, max_samples=ROUTING_MAX_SAMPLES, clock=time.monotonic):
+        self._window = window
+        self._clock = clock
+        self._samples = deque(maxlen=max_samples)  # (timestamp, ok, latency)
+
+    def record(self, ok, latency):
+        self._samples.append((self._clock(), ok, latency))
+
+    def _trim(self):
+        now = self._clock()
+        while self._samples and now - self._samples[0][0] > self._window:
+            self._samples.popleft()
+
+    def __len__(self):
+        self._trim()
+        return len(self._samples)
+
+    def success_rate(self):
+        # One imaginary success: 1.0 with no samples, and a single failure can't zero it.
+        self._trim()
+        return (sum(1 for _, ok, _ in self._samples if ok) + 1) / (len(self._samples) + 1)
+
+    def percentile(self, q):
+        self._trim()
+        latencies = sorted(latency for _, _, latency in self._samples if latency is not None)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, math.ceil(q * len(latencies)) - 1)]
+
+    def stats(self):
+        return {
+            "samples": len(self),
+            "success_rate": self.success_rate(),
+            "p50_seconds": self.percentile(0.5),
+            "p95_seconds": self.percentile(0.95),
+        }
+
+
+class ProviderRouter:
+    def __init__(self, weights=None, explore_rate=ROUTING_EXPLORE_RATE, max_banks=ROUTING_MAX_BANKS,
+                 clock=time.monotonic):
+        self._weights = weights or ROUTING_WEIGHTS
+        self._explore_rate = explore_rate
+        self._max_banks = max_banks
+        self._clock = clock
+        self._providers = {name: RollingStats(clock=clock) for name in PROVIDERS}
+        self._banks = OrderedDict()
+        self.fallbacks = 0
+
+    def record(self, provider, bank_code, ok, latency=None):
+        self._providers[provider].record(ok, latency)
+        key = (provider, bank_code)
+        stats = self._banks.get(key)
+        if stats is None:
+            stats = self._banks[key] = RollingStats(clock=self._clock)
+            if len(self._banks) > self._max_banks:
+                self._banks.popitem(last=False)
+        else:
+            self._banks.move_to_end(key)
+        stats.record(ok, latency)
+
+    def score(self, provider, bank_code):
+        # Read-only: scoring a bank never seen before must not add an entry for it.
+        stats = self._banks.get((provider, bank_code))
+        if stats is None or len(stats) < ROUTING_MIN_SAMPLES:
+            stats = self._providers[provider]
+        return self._weights.get(provider, 1.0) * stats.success_rate() - ROUTING_LATENCY_WEIGHT * stats.percentile(0.95)
+
+    def rank(self, bank_code, providers=PROVIDERS):
+        """Providers best first; any whose circuit is open go to the back."""
+        ranked = sorted(providers, key=lambda provider: (
+            getattr(gateway, provider).breaker.state == "open",
+            -self.score(provider, bank_code),
+        ))
+        if len(ranked) > 1 and getattr(gateway, ranked[1]).breaker.state != "open" \
+                and random.random() < self._explore_rate:
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return ranked
+
+    def stats(self):
+        return {
+            "providers": {
+                name: {**stats.stats(), "weight": self._weights.get(name, 1.0),
+                       "breaker": getattr(gateway, name).breaker.state}
+                for name, stats in self._providers.items()
+            },
+            "banks": {
+                f"{provider}:{bank_code}": stats.stats()
+                for (provider, bank_code), stats in self._banks.items() if len(stats)
+            },
+            "fallbacks": self.fallbacks,
+        }
+
+
+async def _send_monnify(amount, reference, narration, bank_code, account_number, source_account_number):
+    response = await initiate_monnify_transfer(amount, reference, narration, bank_code, account_number,
+                                               source_account_number)
+    if response.get("status"):
+        return "success", response
+    if (response.get("error_code") or 500) < 500 or response.get("sent") is False:
+        return "rejected", response.get("message") or response.get("error")
+    # No usable answer; Monnify can tell us by reference whether the transfer exists. It may not
+    # list a transfer straight away, so "not found" is left to the reconciler rather than failed over.
+    status = await get_monnify_transfer_status(reference)
+    if status == "SUCCESS":
+        return "success", response
+    if status == "FAILED":
+        return "rejected", "Transfer failed"
+    return "unknown", response.get("error") or response.get("message")
+
+
+async def _send_paystack(amount, reference, narration, bank_code, account_number, source_account_number):
+    try:
+        recipient_code = await recipients.get_recipient_code(account_number, bank_code)
+    except recipients.RecipientError as e:
+        return "rejected", str(e)
+    response = await initiate_paystack_transfer(amount, recipient_code, narration, reference=reference)
+    if response.get("status"):
+        return "success", response
+    if (response.get("error_code") or 500) < 500 or response.get("sent") is False:
+        return "rejected", response.get("message") or response.get("error")
+    return "unknown", response.get("error")
+
+
+RAILS = {"monnify": _send_monnify, "paystack": _send_paystack}
+
+
+async def send(amount, reference, narration, bank_code, account_number, source_account_number=None,
+               providers=None):
+    """
+    Try `providers` (default: all that can make the transfer) best first until one takes it.
+
+    Returns (provider, outcome, details, attempts) where outcome is "success",
+    "rejected" (every provider refused; no money moved) or "unknown".
+    """
+    providers = providers or PROVIDERS
+    if not source_account_number:
+        providers = tuple(p for p in providers if p != "monnify")
+    attempts = []
+    details = "No provider can make this transfer"
+    for provider in provider_router.rank(bank_code, providers):
+        if attempts:
+            provider_router.fallbacks += 1
+        started = time.perf_counter()
+        outcome, details = await RAILS[provider](amount, reference, narration, bank_code, account_number,
+                                                 source_account_number)
+        provider_router.record(provider, bank_code, outcome == "success", time.perf_counter() - started)
+        attempts.append({"provider": provider, "outcome": outcome})
+        if outcome != "rejected":
+            return provider, outcome, details, attempts
+    return None, "rejected", details, attempts
+
+
+provider_router = ProviderRouter()
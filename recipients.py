@@ -0,0 +1,83 @@
+"""
+Registry of Paystack transfer recipients.
+
+A recipient is created on Paystack once per (account_number, bank_code) and
+its `recipient_code` stored in `paystack_recipients` under a unique index, so
+repeat transfers to the same account skip `/transferrecipient` entirely.
+Lookups go through an in-process LRU first, and concurrent first-time
+lookups for the same account share one Mongo read / Paystack call.
+"""
+import asyncio
+import os
+from datetime import datetime
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from database import get_db
+from utils import create_transfer_recipient
+
+RECIPIENT_CACHE_SIZE = int(os.getenv("RECIPIENT_CACHE_SIZE", "10000"))
+RECIPIENT_CACHE_TTL = int(os.getenv("RECIPIENT_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+INDEXES = {
+    "paystack_recipients": [
+        IndexModel([("account_number", ASCENDING), ("bank_code", ASCENDING)], unique=True),
+    ],
+}
+
+recipients = TTLCache(maxsize=RECIPIENT_CACHE_SIZE, ttl=RECIPIENT_CACHE_TTL)
+_inflight = {}
+
+created = 0
+
+
+class RecipientError(Exception):
+    """Paystack refused (or could not be reached to) create the recipient."""
+
+
+async def _load_or_create(account_number, bank_code):
+    global created
+    registry = get_db()["paystack_recipients"]
+    key = {"account_number": account_number, "bank_code": bank_code}
+    doc = await registry.find_one(key, {"recipient_code": 1})
+    if doc:
+        return doc["recipient_code"]
+
+    response = await create_transfer_recipient(account_number, bank_code)
+    if "error" in response or not response.get("status"):
+        raise RecipientError(response.get("error") or response.get("message") or "Recipient creation failed")
+    recipient_code = response["data"]["recipient_code"]
+    created += 1
+    try:
+        await registry.insert_one({
+            **key,
+            "recipient_code": recipient_code,
+            "name": response["data"].get("name"),
+            "created_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        # Another worker registered the same account first; use theirs so there is one recipient per account.
+        recipient_code = (await registry.find_one(key, {"recipient_code": 1}))["recipient_code"]
+    return recipient_code
+
+
+async def get_recipient_code(account_number: str, bank_code: str) -> str:
+    """Return the Paystack recipient code for an account, creating the recipient only the first time."""
+    key = (account_number, bank_code)
+    recipient_code = recipients.get(key)
+    if recipient_code:
+        return recipient_code
+
+    if key not in _inflight:
+        _inflight[key] = asyncio.ensure_future(_load_or_create(account_number, bank_code))
+        _inflight[key].add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shield so one cancelled caller doesn't cancel the lookup for everyone else.
+    recipient_code = await asyncio.shield(_inflight[key])
+    recipients.set(key, recipient_code)
+    return recipient_code
+
+
+def stats():
+    return {**recipients.stats(), "inflight": len(_inflight), "created": created}
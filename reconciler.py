@@ -0,0 +1,326 @@
+"""
+Scheduled reconciliation of transfers.
+
+Transfer rows are created with whatever status Paystack returned at
+initiation (usually "pending" or "otp") and used to change only when a client
+called the verify endpoint. An APScheduler job now pages through every
+non-final Paystack row by keyset on the `pending_transfers` index, verifies
+them `RECONCILE_CONCURRENCY` at a time under a `PAYSTACK_VERIFY_RATE` rate
+limit, and writes the new statuses back with one `bulk_write` per page.
+
+Failed transfers are refunded exactly once: the status update also sets
+`refund_pending`, and the refund's ledger entry decides whether the wallet is
+credited (see `wallet.refund`). The flag is cleared afterwards, so rows still
+flagged after a crash are retried on the next run. Transfers reserved through
+the in-flight account are settled to Paystack when they succeed; older rows
+were journalled to Paystack at initiation and are refunded from there, as are
+reserved transfers reversed after they were settled.
+
+Each run also resolves transfer rows flagged `unresolved`: ones still
+"submitting" (the request died mid-call) or "unknown" (the gateway gave no
+usable answer). Once they are `RECONCILE_UNRESOLVED_MIN_AGE` old they are
+looked up by our reference at the provider they went to (at every provider
+when that isn't known). A transfer found paid is settled; one that failed,
+or that no provider has heard of, is refunded; a Paystack transfer still in
+progress gets its transfer code and joins the pending scan above.
+
+Batch transfers left in "needs_review" are finalized again each run too
+(see `transfers.review_batches`), and wallet credits that were journalled but
+never applied are retried (see `wallet.apply_pending_credits`).
+
+A Mongo lease keeps only one worker reconciling at a time.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+import ledger
+import transfers
+import wallet
+from database import get_db
+from transfers import RECONCILE_UNRESOLVED_MIN_AGE, RateLimiter, monnify_limiter
+from utils import find_paystack_transfer, get_monnify_transfer_status, verify_paystack_transfer
+
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RECONCILE_INTERVAL_SECONDS", "60"))
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "200"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "10"))
+PAYSTACK_VERIFY_RATE = float(os.getenv("PAYSTACK_VERIFY_RATE", "20"))
+# Leave brand-new rows to the request that created them.
+RECONCILE_MIN_AGE = timedelta(seconds=int(os.getenv("RECONCILE_MIN_AGE_SECONDS", "30")))
+RECONCILE_LEASE = timedelta(seconds=int(os.getenv("RECONCILE_LEASE_SECONDS", "300")))
+
+# Listed explicitly (rather than "not final") so the scan is an index merge on status.
+PENDING_STATUSES = ["pending", "otp", "received", "queued", "processing"]
+FAILED_STATUSES = {"failed", "reversed", "abandoned", "blocked", "rejected"}
+MONNIFY_FAILED_STATUSES = {"FAILED", "REVERSED"}
+# Transfers whose outcome the request that made them could not establish.
+UNRESOLVED_STATUSES = ("submitting", "unknown")
+UNRESOLVED_PROVIDERS = ("monnify", "paystack")
+
+_LEASE_ID = "paystack_reconciler"
+
+TRANSFER_PROJECTION = {
+    "status": 1, "transfer_code": 1, "reference": 1, "reserved": 1, "timestamp": 1, "user_id": 1, "amount": 1,
+    "provider": 1,
+}
+
+
+def pending_filter(before=None) -> dict:
+    """Non-final Paystack transfer rows; matches the partial `pending_transfers` index."""
+    query = {"transfer_code": {"$gt": ""}, "status": {"$in": PENDING_STATUSES}}
+    if before is not None:
+        query["timestamp"] = {"$lt": before}
+    return query
+
+
+def unresolved_filter(before=None) -> dict:
+    """Transfer rows whose outcome is not known yet; matches the partial `unresolved_transfers` index."""
+    query = {"unresolved": True}
+    if before is not None:
+        query["timestamp"] = {"$lt": before}
+    return query
+
+
+def status_update(doc, new_status, now):
+    """The guarded update that moves `doc` to `new_status`, or None if nothing changes."""
+    if new_status == doc["status"]:
+        return None
+    update = {"status": new_status, "reconciled_at": now}
+    if new_status in FAILED_STATUSES:
+        update["refund_pending"] = True
+    # Guard on the old status so two reconcilers (or the verify route) can't both flag a refund.
+    return UpdateOne({"_id": doc["_id"], "status": doc["status"]}, {"$set": update})
+
+
+async def apply_statuses(db, results):
+    """Write `[(doc, new_status)]` back in one bulk_write and settle any refunds. Returns (updated, refunded)."""
+    now = datetime.utcnow()
+    updates = [update for update in (status_update(doc, status, now) for doc, status in results) if update]
+    if not updates:
+        return 0, 0
+    result = await db["transactions"].bulk_write(updates, ordered=False)
+    for doc, status in results:
+        if status == "success" and doc.get("reserved"):
+            await wallet.settle(db, doc["amount"], doc["reference"], "paystack")
+    refunded = await settle_refunds(db, [doc["_id"] for doc, status in results if status in FAILED_STATUSES])
+    return result.modified_count, refunded
+
+
+async def settle_refunds(db, ids=None):
+    """Refund every failed transfer still flagged `refund_pending` (optionally only `ids`). Returns the count."""
+    query = {"refund_pending": True}
+    if ids is not None:
+        query["_id"] = {"$in": ids}
+    refunded = 0
+    async for doc in db["transactions"].find(query, TRANSFER_PROJECTION):
+        if doc.get("reserved"):
+            # A transfer reversed after it succeeded was already settled out of the in-flight account.
+            provider = ledger.provider_account(doc.get("provider") or "paystack")
+            source = provider if await ledger.is_posted(db, doc["reference"], provider) else ledger.IN_FLIGHT_ACCOUNT
+            credited = await wallet.refund(db, doc["user_id"], doc["amount"], doc["reference"],
+                                           from_account=source)
+        else:
+            credited = await wallet.refund(db, doc["user_id"], doc["amount"], doc["transfer_code"],
+                                           from_account=ledger.provider_account("paystack"))
+        await db["transactions"].update_one(
+            {"_id": doc["_id"]}, {"$set": {"refund_pending": False, "refunded_at": datetime.utcnow()}}
+        )
+        if credited is not None:
+            refunded += 1
+    return refunded
+
+
+async def _verify(doc, semaphore, limiter):
+    async with semaphore:
+        await limiter.acquire()
+        verification = await verify_paystack_transfer(doc["transfer_code"])
+    if "error" in verification or not verification.get("status"):
+        return None  # Try again next run.
+    return doc, verification["data"]["status"]
+
+
+async def _lookup(provider, reference, paystack_limiter):
+    """
+    What `provider` knows of transfer `reference`: ("success" | "failed" | "pending" | "missing", data),
+    or None when it couldn't say.
+    """
+    if provider == "monnify":
+        await monnify_limiter.acquire()
+        status = await get_monnify_transfer_status(reference)
+        if isinstance(status, dict):
+            return None
+        if status is None:
+            return "missing", None
+        if status == "SUCCESS":
+            return "success", None
+        return ("failed" if status in MONNIFY_FAILED_STATUSES else "pending"), None
+
+    await paystack_limiter.acquire()
+    data = await find_paystack_transfer(reference)
+    if data is None:
+        return "missing", None
+    if "error" in data:
+        return None
+    if data["status"] == "success":
+        return "success", data
+    return ("failed" if data["status"] in FAILED_STATUSES else "pending"), data
+
+
+async def resolve_transfer(db, doc, paystack_limiter):
+    """Settle, refund or hand over one unresolved transfer row. Returns its new status, or None to retry later."""
+    providers = [doc["provider"]] if doc.get("provider") else UNRESOLVED_PROVIDERS
+    found = {}
+    for provider in providers:
+        result = await _lookup(provider, doc["reference"], paystack_limiter)
+        if result is None:
+            return None
+        found[provider] = result
+    # The router only falls back after a definite rejection, so at most one provider can hold the transfer.
+    live = [(provider, outcome, data) for provider, (outcome, data) in found.items()
+            if outcome in ("success", "pending")]
+    provider, outcome, data = live[0] if live else (doc.get("provider"), "failed", None)
+
+    update = {"provider": provider, "reconciled_at": datetime.utcnow()}
+    if outcome == "success":
+        await wallet.settle(db, doc["amount"], doc["reference"], provider)
+        update["status"] = "success"
+    elif outcome == "failed":
+        await wallet.refund(db, doc["user_id"], doc["amount"], doc["reference"])
+        update["status"] = "failed"
+    elif provider == "paystack":
+        update.update(status=data["status"], transfer_code=data["transfer_code"])
+    else:
+        # Still in progress at Monnify; look again next run.
+        await db["transactions"].update_one({"_id": doc["_id"]}, {"$set": update})
+        return None
+    await db["transactions"].update_one({"_id": doc["_id"], "unresolved": True},
+                                        {"$set": update, "$unset": {"unresolved": ""}})
+    return update["status"]
+
+
+async def _pages(transactions, query):
+    """Pages of matching transfer rows, oldest first, by keyset on (timestamp, _id)."""
+    last = None
+    while True:
+        page_query = dict(query)
+        if last:
+            page_query["$or"] = [
+                {"timestamp": {"$gt": last["timestamp"]}},
+                {"timestamp": last["timestamp"], "_id": {"$gt": last["_id"]}},
+            ]
+        page = await transactions.find(page_query, TRANSFER_PROJECTION) \
+            .sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(RECONCILE_PAGE_SIZE) \
+            .to_list(RECONCILE_PAGE_SIZE)
+        if not page:
+            return
+        yield page
+        if len(page) < RECONCILE_PAGE_SIZE:
+            return
+        last = page[-1]
+
+
+class Reconciler:
+    def __init__(self, interval=RECONCILE_INTERVAL_SECONDS):
+        self._interval = interval
+        self._scheduler = None
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._limiter = RateLimiter(PAYSTACK_VERIFY_RATE)
+        self.last_run = {}
+
+    def start(self):
+        self._scheduler = AsyncIOScheduler()
+        self._scheduler.add_job(self.run_once, "interval", seconds=self._interval,
+                                max_instances=1, coalesce=True, next_run_time=datetime.now())
+        self._scheduler.start()
+
+    def stop(self):
+        if self._scheduler:
+            self._scheduler.shutdown(wait=False)
+            self._scheduler = None
+
+    async def _acquire_lease(self, db):
+        now = datetime.utcnow()
+        try:
+            await db["locks"].update_one(
+                {"_id": _LEASE_ID, "$or": [{"expires_at": {"$lt": now}}, {"owner": self._owner}]},
+                {"$set": {"owner": self._owner, "expires_at": now + RECONCILE_LEASE}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # Another worker holds the lease.
+
+    async def _release_lease(self, db):
+        await db["locks"].update_one({"_id": _LEASE_ID, "owner": self._owner},
+                                     {"$set": {"expires_at": datetime.utcnow()}})
+
+    async def run_once(self):
+        db = get_db()
+        if not await self._acquire_lease(db):
+            return None
+        started = time.perf_counter()
+        checked = updated = resolved = batches = credits = 0
+        try:
+            credits = await wallet.apply_pending_credits(db)
+            refunded = await settle_refunds(db)
+            batches = await transfers.review_batches(db)
+            semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+            async def resolve(doc):
+                async with semaphore:
+                    return await resolve_transfer(db, doc, self._limiter)
+
+            # Resolved first, so Paystack transfers it finds still in progress are verified in this run too.
+            async for page in _pages(db["transactions"],
+                                     unresolved_filter(datetime.utcnow() - RECONCILE_UNRESOLVED_MIN_AGE)):
+                resolved += sum(1 for status in await asyncio.gather(*map(resolve, page)) if status)
+
+            async for page in _pages(db["transactions"], pending_filter(datetime.utcnow() - RECONCILE_MIN_AGE)):
+                results = await asyncio.gather(*(_verify(doc, semaphore, self._limiter) for doc in page))
+                results = [result for result in results if result]
+                checked += len(page)
+                page_updated, page_refunded = await apply_statuses(db, results)
+                updated += page_updated
+                refunded += page_refunded
+        except Exception as e:
+            logging.error("Reconciliation failed: %s", e)
+            raise
+        finally:
+            await self._release_lease(db)
+
+        self.last_run = {
+            "finished_at": datetime.utcnow(),
+            "duration_seconds": time.perf_counter() - started,
+            "checked": checked,
+            "updated": updated,
+            "refunded": refunded,
+            "resolved": resolved,
+            "batches_completed": batches,
+            "credits_applied": credits,
+        }
+        logging.info("Reconciliation: resolved %d, checked %d, updated %d, refunded %d",
+                     resolved, checked, updated, refunded)
+        return self.last_run
+
+    async def stats(self):
+        """
+        Backlog (non-final Paystack transfers) and lag (age of the oldest one), the number of
+        transfers with an unresolved outcome, and the last run's counters.
+        """
+        transactions = get_db()["transactions"]
+        backlog = await transactions.count_documents(pending_filter())
+        oldest = await transactions.find_one(pending_filter(), {"timestamp": 1},
+                                             sort=[("timestamp", ASCENDING), ("_id", ASCENDING)])
+        lag = (datetime.utcnow() - oldest["timestamp"]).total_seconds() if oldest else 0.0
+        unresolved = await transactions.count_documents(unresolved_filter())
+        return {"backlog": backlog, "lag_seconds": lag, "unresolved": unresolved, "last_run": self.last_run}
+
+
+reconciler = Reconciler()
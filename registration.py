@@ -0,0 +1,276 @@
+"""
+Background provisioning for new users.
+
+`POST /auth/register/` only validates, hashes the password and inserts the
+user with status "pending"; the profile image and the request to provision a
+Monnify reserved account are persisted in `registration_jobs`. A pool of
+in-process workers runs the Cloudinary upload and reserved-account creation
+concurrently, keeps whichever step succeeded, and retries the rest with
+exponential backoff. After `REGISTRATION_MAX_ATTEMPTS` the user is marked
+"failed" and can be re-queued from `POST /auth/registration/retry`; a retry
+resets `attempts` but not `total_attempts`, which decides whether an earlier
+attempt may already have created the reserved account.
+
+Every `REGISTRATION_RECOVER_INTERVAL_SECONDS` each process re-queues jobs
+left "running" by a worker that died and picks up queued jobs whose retry
+timer was lost with the process that scheduled it.
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from bson import Binary, ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+import principals
+from database import get_db
+from utils import create_reserved_account, get_reserved_account, upload_image
+
+REGISTRATION_WORKERS = int(os.getenv("REGISTRATION_WORKERS", "4"))
+REGISTRATION_MAX_ATTEMPTS = int(os.getenv("REGISTRATION_MAX_ATTEMPTS", "5"))
+REGISTRATION_RETRY_BASE = float(os.getenv("REGISTRATION_RETRY_BASE_SECONDS", "2"))
+REGISTRATION_MAX_IMAGE_BYTES = int(os.getenv("REGISTRATION_MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+# A job still "running" after this long belonged to a worker that died.
+REGISTRATION_STALE_AFTER = timedelta(seconds=int(os.getenv("REGISTRATION_STALE_AFTER_SECONDS", "300")))
+REGISTRATION_RECOVER_INTERVAL = int(os.getenv("REGISTRATION_RECOVER_INTERVAL_SECONDS", "60"))
+
+BVN = "22539059076"  # Replace with a valid bvn or nin.
+
+INDEXES = {
+    "registration_jobs": [IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)])],
+}
+
+
+async def create_job(user, image: bytes, content_type=None):
+    job = {
+        "_id": user["_id"],
+        "status": "queued",
+        "image": Binary(image),
+        "content_type": content_type,
+        "profile_image": None,
+        "account_number": None,
+        "bank_name": None,
+        "attempts": 0,
+        "total_attempts": 0,
+        "errors": [],
+        "created_at": datetime.utcnow(),
+        "next_attempt_at": datetime.utcnow(),
+    }
+    await get_db()["registration_jobs"].insert_one(job)
+    worker.enqueue(job["_id"])
+    return job
+
+
+async def get_job(user_id):
+    return await get_db()["registration_jobs"].find_one({"_id": ObjectId(user_id)}, {"image": 0})
+
+
+def job_status(user, job):
+    status = {
+        "user_id": str(user["_id"]),
+        "status": user.get("status", "active"),
+        "account_number": user.get("account_number"),
+        "bank_name": user.get("bank_name"),
+        "profile_image": user.get("profile_image"),
+    }
+    if job:
+        status.update({
+            "attempts": job["attempts"],
+            "steps": {
+                "profile_image": "done" if job.get("profile_image") else "pending",
+                "reserved_account": "done" if job.get("account_number") else "pending",
+            },
+            "error": job["errors"][-1] if job["errors"] and job["status"] != "done" else None,
+        })
+    return status
+
+
+async def retry_job(user_id):
+    """Re-queue a failed job. Returns False if there is no failed job for the user."""
+    db = get_db()
+    job = await db["registration_jobs"].find_one_and_update(
+        {"_id": ObjectId(user_id), "status": "failed"},
+        {"$set": {"status": "queued", "attempts": 0, "next_attempt_at": datetime.utcnow()}},
+    )
+    if job is None:
+        return False
+    await db["users"].update_one({"_id": job["_id"]}, {"$set": {"status": "pending"}})
+    principals.invalidate(job["_id"])
+    worker.enqueue(job["_id"])
+    return True
+
+
+async def _upload_profile_image(job):
+    url = await upload_image(bytes(job["image"]))
+    if not url:
+        raise RuntimeError("Cloudinary returned no URL")
+    return url
+
+
+async def _provision_account(user, job):
+    reference = str(user["_id"])
+    response = None
+    if job.get("total_attempts", job["attempts"]) > 1:
+        # An earlier attempt may have created the account before timing out.
+        response = await get_reserved_account(reference)
+        if response and "error" in response:
+            raise RuntimeError(response["error"])
+    if not response:
+        response = await create_reserved_account(
+            account_reference=reference,
+            account_name=user["name"],
+            customer_email=user["email"],
+            bvn=BVN,
+            customer_name=user["name"],
+        )
+        if "error" in response:
+            raise RuntimeError(response["error"])
+    account = response["responseBody"]["accounts"][0]
+    return account["accountNumber"], account["bankName"]
+
+
+async def run_job(job):
+    """Run the outstanding steps concurrently. Returns the job fields that changed."""
+    db = get_db()
+    user = await db["users"].find_one({"_id": job["_id"]}, {"name": 1, "email": 1})
+    if user is None:
+        raise LookupError("User no longer exists")
+
+    steps = {}
+    if not job.get("profile_image"):
+        steps["profile_image"] = _upload_profile_image(job)
+    if not job.get("account_number"):
+        steps["account"] = _provision_account(user, job)
+    results = dict(zip(steps, await asyncio.gather(*steps.values(), return_exceptions=True)))
+
+    changes, errors = {}, []
+    for step, result in results.items():
+        if isinstance(result, Exception):
+            errors.append(f"{step}: {result}")
+        elif step == "profile_image":
+            changes["profile_image"] = result
+        else:
+            changes["account_number"], changes["bank_name"] = result
+    return changes, errors
+
+
+class RegistrationWorker:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def enqueue(self, user_id):
+        self._queue.put_nowait(user_id)
+
+    def _enqueue_later(self, user_id, delay):
+        asyncio.get_running_loop().call_later(delay, self.enqueue, user_id)
+
+    async def start(self, workers=REGISTRATION_WORKERS):
+        # Jobs that were queued, backing off or interrupted by a restart are picked up again.
+        jobs = get_db()["registration_jobs"]
+        await jobs.update_many(
+            {"status": "running", "started_at": {"$lt": datetime.utcnow() - REGISTRATION_STALE_AFTER}},
+            {"$set": {"status": "queued"}},
+        )
+        now = datetime.utcnow()
+        async for job in jobs.find({"status": "queued"}, {"next_attempt_at": 1}).sort("next_attempt_at", ASCENDING):
+            self._enqueue_later(job["_id"], max(0.0, (job["next_attempt_at"] - now).total_seconds()))
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(workers)]
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+
+    async def _recover(self, jobs):
+        """Re-queue stale running jobs and enqueue overdue queued ones. Returns how many were picked up."""
+        now = datetime.utcnow()
+        stale = {"status": "running", "started_at": {"$lt": now - REGISTRATION_STALE_AFTER}}
+        overdue = {"status": "queued", "next_attempt_at": {"$lt": now - REGISTRATION_STALE_AFTER}}
+        recovered = 0
+        async for job in jobs.find(stale, {"_id": 1}):
+            # Guarded, so a job that just finished (or another process's recovery) isn't re-queued.
+            if await jobs.find_one_and_update({**stale, "_id": job["_id"]}, {"$set": {"status": "queued"}}):
+                self.enqueue(job["_id"])
+                recovered += 1
+        async for job in jobs.find(overdue, {"_id": 1}):
+            self.enqueue(job["_id"])
+            recovered += 1
+        return recovered
+
+    async def _recover_periodically(self):
+        jobs = get_db()["registration_jobs"]
+        while True:
+            await asyncio.sleep(REGISTRATION_RECOVER_INTERVAL)
+            try:
+                recovered = await self._recover(jobs)
+            except Exception as e:
+                logging.error("Registration job recovery failed: %s", e)
+                continue
+            if recovered:
+                logging.warning("Recovered %d stalled registration jobs", recovered)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _run(self):
+        db = get_db()
+        jobs = db["registration_jobs"]
+        while True:
+            user_id = await self._queue.get()
+            job = await jobs.find_one_and_update(
+                {"_id": user_id, "status": "queued"},
+                {"$set": {"status": "running", "started_at": datetime.utcnow()},
+                 "$inc": {"attempts": 1, "total_attempts": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                continue
+            try:
+                changes, errors = await run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                changes, errors = {}, [str(e)]
+            try:
+                await self._finish(db, job, changes, errors)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Registration job %s could not be saved: %s", user_id, e)
+
+    async def _finish(self, db, job, changes, errors):
+        user_id = job["_id"]
+        if not errors:
+            await db["users"].update_one({"_id": user_id}, {"$set": {
+                "profile_image": changes.get("profile_image", job.get("profile_image")),
+                "account_number": changes.get("account_number", job.get("account_number")),
+                "bank_name": changes.get("bank_name", job.get("bank_name")),
+                "status": "active",
+            }})
+            await db["registration_jobs"].update_one({"_id": user_id}, {
+                "$set": {**changes, "status": "done", "finished_at": datetime.utcnow()},
+                "$unset": {"image": ""},
+            })
+            principals.invalidate(user_id)
+            return
+
+        logging.error("Registration for user %s failed (attempt %d): %s", user_id, job["attempts"], "; ".join(errors))
+        if job["attempts"] >= REGISTRATION_MAX_ATTEMPTS:
+            await db["registration_jobs"].update_one({"_id": user_id}, {
+                "$set": {**changes, "status": "failed", "finished_at": datetime.utcnow()},
+                "$push": {"errors": {"$each": errors, "$slice": -10}},
+            })
+            await db["users"].update_one({"_id": user_id}, {"$set": {"status": "failed"}})
+            principals.invalidate(user_id)
+            return
+
+        delay = REGISTRATION_RETRY_BASE * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.5)
+        await db["registration_jobs"].update_one({"_id": user_id}, {
+            "$set": {**changes, "status": "queued", "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)},
+            "$push": {"errors": {"$each": errors, "$slice": -10}},
+        })
+        self._enqueue_later(user_id, delay)
+
+
+worker = RegistrationWorker()
@@ -0,0 +1,172 @@
+"""
+Failure isolation for payment-provider calls.
+
+`GatewayClient` runs every request through three guards, one set per
+provider:
+
+* a bulkhead that caps in-flight calls and sheds the excess after a short
+  wait, so a slow provider can't tie up every worker;
+* a circuit breaker that opens when the provider's recent error rate spikes
+  and fails calls immediately until a probe succeeds;
+* a retry policy with jittered exponential backoff, applied only to calls
+  that are safe to repeat.
+
+Calls refused by a guard raise a subclass of `httpx.TransportError`, so the
+helpers in `utils.py` report them the same way as any other network error.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+
+# Methods that may be repeated without changing the outcome.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Gateway answers worth retrying an idempotent call for.
+RETRY_STATUSES = {502, 503, 504}
+# Errors raised before the request left this process; retrying these is always safe.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class ResilienceError(httpx.TransportError):
+    """The call was refused locally and never reached the provider."""
+
+
+class CircuitOpenError(ResilienceError):
+    pass
+
+
+class BulkheadFullError(ResilienceError):
+    pass
+
+
+def was_sent(error):
+    """False if `error` means the request certainly never reached the provider."""
+    return not isinstance(error, NOT_SENT_ERRORS + (ResilienceError,))
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `min_calls` calls in the last `window` seconds failed
+    at `failure_rate` or worse. After `reset_timeout` one probe call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=20, window=30.0, reset_timeout=15.0,
+                 clock=time.monotonic):
+        self.name = name
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        self._window = window
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._calls = deque()  # (timestamp, ok)
+        self._failures = 0
+        self.state = "closed"
+        self._opened_at = None
+        self._probing = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self._window:
+            if not self._calls.popleft()[1]:
+                self._failures -= 1
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go ahead now."""
+        if self.state == "open" and self._clock() - self._opened_at >= self._reset_timeout:
+            self.state = "half_open"
+        if self.state == "closed" or (self.state == "half_open" and not self._probing):
+            self._probing = self.state == "half_open"
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record(self, ok):
+        now = self._clock()
+        if self.state == "half_open":
+            self._probing = False
+            if ok:
+                self.state = "closed"
+                self._calls.clear()
+                self._failures = 0
+            else:
+                self._open(now)
+            return
+
+        self._calls.append((now, ok))
+        if not ok:
+            self._failures += 1
+        self._trim(now)
+        if (self.state == "closed" and len(self._calls) >= self._min_calls
+                and self._failures / len(self._calls) >= self._failure_rate):
+            self._open(now)
+
+    def _open(self, now):
+        self.state = "open"
+        self._opened_at = now
+        self.opened += 1
+
+    def stats(self):
+        self._trim(self._clock())
+        return {
+            "state": self.state,
+            "calls": len(self._calls),
+            "failure_rate": self._failures / len(self._calls) if self._calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class Bulkhead:
+    """At most `limit` calls in flight; a caller waits up to `max_wait` seconds for a slot, then is shed."""
+
+    def __init__(self, name, limit, max_wait=1.0):
+        self.name = name
+        self.limit = limit
+        self._max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def __aenter__(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self._max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BulkheadFullError(f"{self.name} has {self.limit} calls in flight") from None
+        self.in_flight += 1
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+class RetryPolicy:
+    """Up to `retries` extra attempts, sleeping a random 0..min(cap, base * 2**attempt) seconds between them."""
+
+    def __init__(self, retries=2, base=0.2, cap=2.0):
+        self.retries = retries
+        self._base = base
+        self._cap = cap
+        self.retried = 0
+
+    def should_retry(self, attempt, idempotent, error=None, response=None):
+        if attempt >= self.retries or isinstance(error, ResilienceError):
+            return False
+        if error is not None:
+            return idempotent or isinstance(error, NOT_SENT_ERRORS)
+        return idempotent and response.status_code in RETRY_STATUSES
+
+    async def backoff(self, attempt):
+        self.retried += 1
+        await asyncio.sleep(random.uniform(0, min(self._cap, self._base * 2 ** attempt)))
+
+    def stats(self):
+        return {"retries": self.retries, "retried": self.retried}
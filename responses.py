@@ -0,0 +1,41 @@
+"""
+JSON responses rendered with orjson.
+
+`BSONJSONResponse` is the app's default response class. It serializes
+`ObjectId` (as its hex string) and `datetime` (ISO 8601, the same text
+`datetime.isoformat()` gives) natively, so endpoints can hand it Mongo
+documents as they come off the cursor.
+
+FastAPI runs `jsonable_encoder` over anything an endpoint returns before the
+response class sees it, walking every value in Python. Hot list endpoints
+skip that by returning a `BSONJSONResponse` themselves, and declare
+`response_model` only for the OpenAPI schema; `projection()` builds their Mongo
+projection from that model so the documents never carry more than it lists.
+"""
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class BSONJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def projection(model) -> dict:
+    """Mongo projection fetching exactly the fields of pydantic `model` (by alias, so `_id` included)."""
+    return {field.alias or name: 1 for name, field in model.model_fields.items()}
@@ -1,23 +1,23 @@
 from fastapi import APIRouter, HTTPException, Depends, Form, UploadFile, File
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from utils import (
-    create_access_token, decode_access_token, hash_password, verify_password,
-    upload_image, pwd_context
-)
-from database import users
-from models import UserRegister, UserLogin
+from utils import create_access_token, decode_access_token
+from database import get_db, get_users_collection
+from models import UserRegister, UserLogin, UserOut
 from bson import ObjectId
-import requests
-from utils import create_reserved_account, get_monnify_token
+from pymongo.errors import DuplicateKeyError
+from passwords import hasher
+import ledger
+import principals
+import registration
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    payload = decode_access_token(token)
+async def get_current_user(token: str = Depends(oauth2_scheme), users=Depends(get_users_collection)):
+    payload = principals.decode(token, decode_access_token)
     user_id = payload.get("user_id")
-    user = users.find_one({"_id": ObjectId(user_id)})
+    user = await principals.load(users, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
@@ -136,81 +136,91 @@ async def get_admin_user(current_user=Depends(get_current_user)):
 #     }
 
 
-@router.post("/register/")
+@router.post("/register/", status_code=202)
 async def register(
         name: str = Form(...),
         email: str = Form(...),
         phone: str = Form(...),
         password: str = Form(...),
-        profile_image: UploadFile = File(...)
+        profile_image: UploadFile = File(...),
+        users=Depends(get_users_collection)
 ):
-    if users.find_one({"email": email}):
+    """
+    Create the user and queue provisioning of the profile image and reserved account.
+    Log in and poll GET /auth/registration/ until the status is "active".
+    """
+    if await users.find_one({"email": email}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Email already exists")
 
-    image_url = upload_image(profile_image)
-    hashed_password = pwd_context.hash(password)
+    image = await profile_image.read()
+    if len(image) > registration.REGISTRATION_MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail="Profile image is too large")
+    hashed_password = await hasher.hash(password)
 
     new_user = {
         "name": name,
         "email": email,
         "phone": phone,
         "password": hashed_password,
-        "profile_image": image_url,
+        "profile_image": None,  # set by the registration worker after upload
         "wallet_balance": 0.0,
         "account_number": None,
         "is_admin": False,
-        "bank_name": None # add bank name to user profile
+        "bank_name": None, # add bank name to user profile
+        "status": "pending",
     }
 
-    result = users.insert_one(new_user)
-    user_id = str(result.inserted_id)
-
     try:
-        user_data = users.find_one({"_id": ObjectId(user_id)})
-        bvn_value = "22539059076"  # Replace with a valid bvn or nin.
-        monnify_response = create_reserved_account(
-            account_reference=str(user_data["_id"]),
-            account_name=user_data["name"],
-            customer_email=user_data["email"],
-            bvn=bvn_value,
-            customer_name=user_data["name"]
-        )
-
-        if "error" in monnify_response:
-            raise HTTPException(status_code=500, detail=f"Monnify account creation failed: {monnify_response['error']}")
-
-        reserved_account = monnify_response["responseBody"]["accounts"][0]["accountNumber"]
-        bank_name = monnify_response["responseBody"]["accounts"][0]["bankName"] # get bank name
-
-        users.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": {"account_number": reserved_account, "bank_name": bank_name}} # update user profile with bank name
-        )
-    except Exception as e:
-        users.delete_one({"_id": ObjectId(user_id)})
-        raise HTTPException(status_code=500, detail=f"Monnify account creation failed: {str(e)}")
+        await users.insert_one(new_user)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already exists")
+    # A new wallet starts empty, so its whole history is in the ledger from here on.
+    await ledger.open_account(get_db(), ledger.wallet_account(new_user["_id"]))
+    await registration.create_job(new_user, image, profile_image.content_type)
 
     return {
-        "message": "User registered successfully",
-        "account_number": reserved_account,
-        "bank_name": bank_name # return bank name
+        "message": "Registration received",
+        "user_id": str(new_user["_id"]),
+        "status": "pending"
     }
 
 
+@router.get("/registration/")
+async def registration_status(current_user=Depends(get_current_user)):
+    """Provisioning progress for the current user: pending, active or failed."""
+    return registration.job_status(current_user, await registration.get_job(current_user["_id"]))
+
+
+@router.post("/registration/retry")
+async def retry_registration(current_user=Depends(get_current_user)):
+    if not await registration.retry_job(current_user["_id"]):
+        raise HTTPException(status_code=409, detail="Registration has not failed")
+    return {"message": "Registration re-queued", "status": "pending"}
+
+
 @router.post("/login/")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = users.find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user["password"]):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), users=Depends(get_users_collection)):
+    user = await users.find_one({"email": form_data.username}, {"password": 1})
+    if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
+    valid, new_hash = await hasher.verify_and_update(form_data.password, user["password"])
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid credentials")
+    if new_hash:
+        # Stored with an older BCRYPT_ROUNDS; upgrade while we have the plaintext.
+        await users.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
     token = create_access_token(data={"user_id": str(user["_id"])})
     return {"access_token": token, "token_type": "bearer"}
 
 
-@router.get("/users/me/")
+@router.get("/users/me/", response_model=UserOut)
 async def read_users_me(current_user: dict = Depends(get_current_user)):
     """
     Endpoint to get the current authenticated user's profile.
     """
-    # Convert ObjectId to string for JSON serialization
-    current_user["_id"] = str(current_user["_id"])
-    return current_user
\ No newline at end of file
+    return current_user
+
+@router.get("/principals/stats")
+async def principal_cache_stats(current_user=Depends(get_admin_user)):
+    """Hit/miss counters for the per-worker token and principal caches."""
+    return principals.stats()
@@ -1,20 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from models import TransferRequest
-from utils import initiate_deposit, initiate_transfer,verify_deposit, transfer_funds, initiate_monnify_transfer, get_all_banks
-from database import users, transactions
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from models import TransferRequest, ExportRequest, BatchTransferRequest, AccountResolutionRequest
+from models import BalanceOut, TransactionPage, UserOut
+from responses import BSONJSONResponse, projection
+from utils import initiate_deposit, verify_deposit
+from utils import verify_paystack_transfer, monnify_tokens
+from gateway import gateway_stats
+from database import get_db, get_users_collection, get_transactions_collection
 from routes.auth_routes import get_admin_user, get_current_user
 from bson import ObjectId
+import account_resolution
+import bank_directory
+import wallet
+import ledger
+import pagination
+import provider_routing
+import exports
+import idempotency
+import reconciler
+import recipients
+import transfers
+import webhook_archive
+import webhook_inbox
 import logging
+import os
 from datetime import datetime
+from typing import Optional
 
 router = APIRouter()
 
 
-logging.basicConfig(level=logging.INFO)
-
 @router.post("/deposit/")
 async def deposit(amount: float, current_user=Depends(get_current_user)):
-    response = initiate_deposit(current_user["email"], amount)
+    response = await initiate_deposit(current_user["email"], amount)
     if response["status"]:
         return {"message": "Deposit initialized", "payment_url": response["data"]["authorization_url"]}
     raise HTTPException(status_code=400, detail="Deposit failed")
@@ -22,7 +40,7 @@ async def deposit(amount: float, current_user=Depends(get_current_user)):
 
 @router.post("/monnify/deposit/")
 async def monnify_deposit(amount: float = Query(...), current_user: dict = Depends(get_current_user)):
-    logging.info(f"Deposit request received for user: {current_user['_id']}, amount: {amount}")
+    logging.info("Deposit request received for user: %s, amount: %s", current_user["_id"], amount)
 
     if amount <= 0:
         logging.error("Invalid amount: must be greater than zero")
@@ -35,7 +53,7 @@ async def monnify_deposit(amount: float = Query(...), current_user: dict = Depen
     try:
         response = initiate_monnify_deposit(current_user["account_number"], amount)
 
-        logging.info(f"Monnify API Response: {response}")
+        logging.debug("Monnify API Response: %s", response)
 
         if response and response.get("requestSuccessful"): #added response and response.get check.
 
@@ -46,11 +64,11 @@ async def monnify_deposit(amount: float = Query(...), current_user: dict = Depen
                 "amount": amount
             }
         else:
-            logging.error(f"Monnify API call failed: {response}") #added logging
+            logging.error("Monnify API call failed: %s", response)
             raise HTTPException(status_code=400, detail="Deposit initiation failed")
 
     except Exception as e:
-        logging.error(f"Monnify API call failed: {e}")
+        logging.error("Monnify API call failed: %s", e)
         raise HTTPException(status_code=400, detail="Deposit initiation failed")
 
 
@@ -59,29 +77,203 @@ async def verify_deposit_transaction(payment_reference: str, current_user=Depend
     """
     Verify a deposit transaction using Monnify's API.
     """
-    response = verify_deposit(payment_reference)
+    response = await verify_deposit(payment_reference)
     if response["message"] == "Deposit successful":
         return response
     raise HTTPException(status_code=400, detail=response["message"])
 
 
+async def _idempotent(response: Response, idempotency_key, current_user, handler, **params):
+    """
+    Run a transfer handler once per Idempotency-Key; without a key it just runs.
+    A transfer whose outcome is still pending is answered with 202.
+    """
+    if not idempotency_key:
+        body = await handler()
+    else:
+        body, replayed = await idempotency.run(
+            current_user["_id"], idempotency_key, idempotency.fingerprint(**params), handler
+        )
+        if replayed:
+            response.headers[idempotency.REPLAYED_HEADER] = "true"
+    if body.get("status") == "pending":
+        response.status_code = 202
+    return body
+
+
+async def _submit_transfer(db, transactions, current_user, amount, reference, bank_code, account_number,
+                           narration, providers):
+    """
+    Reserve `amount`, send it through `providers` and record the outcome on a transfer row.
+
+    Returns (transaction, details, debited). Raises 400 when no money moved,
+    after refunding the reservation. When the outcome is unknown (a timeout,
+    a crash mid-call, or a failure to record a transfer that went out) the
+    funds stay reserved and the row is left "submitting" or "unknown" for the
+    reconciler, which looks the transfer up by reference.
+    """
+    debited = await wallet.reserve(db, current_user["_id"], amount, reference)
+    if debited is None:
+        logging.error("Insufficient Funds")
+        raise HTTPException(status_code=400, detail="Insufficient Funds")
+
+    # Written before the gateway call, so a transfer interrupted mid-call still has a row to reconcile.
+    transaction = {
+        "user_id": str(current_user["_id"]),
+        "type": "transfer",
+        "provider": providers[0] if len(providers) == 1 else None,
+        "amount": amount,
+        "reference": reference,
+        "recipient_bank_code": bank_code,
+        "recipient_account_number": account_number,
+        "narration": narration,
+        "status": "submitting",
+        "reserved": True,
+        "unresolved": True,
+        "timestamp": datetime.utcnow()
+    }
+    try:
+        await transactions.insert_one(transaction)
+    except Exception:
+        await wallet.refund(db, current_user["_id"], amount, reference)
+        raise
+
+    provider, outcome, details, attempts = transaction["provider"], "unknown", None, []
+    try:
+        provider, outcome, details, attempts = await provider_routing.send(
+            amount, reference, narration, bank_code, account_number, current_user.get("account_number"),
+            providers=providers
+        )
+    except Exception as e:
+        # The provider helpers report gateway failures as outcomes, but this may still be after the request went out.
+        logging.error("Transfer %s failed mid-call: %s", reference, e)
+        details = str(e)
+
+    if outcome == "rejected":
+        await wallet.refund(db, current_user["_id"], amount, reference)
+        await transactions.update_one({"_id": transaction["_id"]}, {
+            "$set": {"status": "failed", "error": str(details)}, "$unset": {"unresolved": ""}})
+        logging.error("Transfer %s rejected: %s", reference, attempts or details)
+        raise HTTPException(status_code=400, detail="Transfer initiation failed")
+
+    if outcome == "unknown":
+        logging.error("Transfer %s via %s has an unknown outcome: %s", reference, provider, details)
+        try:
+            await transactions.update_one({"_id": transaction["_id"]}, {"$set": {
+                "status": "unknown", "provider": provider, "error": str(details)}})
+            transaction.update(status="unknown", provider=provider)
+        except Exception as e:
+            logging.error("Could not mark transfer %s unknown: %s", reference, e)
+        return transaction, details, debited
+
+    update = {"status": "success", "provider": provider, "attempts": attempts}
+    if provider == "paystack":
+        # The reconciler follows Paystack transfers by their transfer code until they settle.
+        update["transfer_code"] = details["data"]["transfer_code"]
+        update["status"] = details["data"]["status"]
+    try:
+        # Settle first: if recording fails after it, the reconciler re-settles (a no-op) and records the row.
+        if update["status"] == "success":
+            await wallet.settle(db, amount, reference, provider)
+        await transactions.update_one({"_id": transaction["_id"]}, {"$set": update, "$unset": {"unresolved": ""}})
+    except Exception as e:
+        # The money has gone; report the transfer as pending and let the reconciler record it.
+        logging.error("Transfer %s sent via %s but not recorded: %s", reference, provider, e)
+        return transaction, details, debited
+    transaction.update(update)
+    transaction.pop("unresolved")
+    return transaction, details, debited
+
+
+def _pending_transfer(transaction, debited):
+    return {
+        "message": "Transfer submitted; its outcome is not confirmed yet",
+        "status": "pending",
+        "reference": transaction["reference"],
+        "amount": transaction["amount"],
+        "new_balance": debited["wallet_balance"],
+    }
+
+
 @router.post("/transfer/")
-async def transfer(transfer_data: TransferRequest, current_user=Depends(get_current_user)):
-    response = initiate_transfer(transfer_data.recipient_account, transfer_data.bank_code, transfer_data.amount)
-    if response["requestSuccessful"]:
-        return {"message": "Transfer successful"}
-    raise HTTPException(status_code=400, detail="Transfer failed")
+async def transfer(
+        transfer_data: TransferRequest,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None),
+        current_user=Depends(get_current_user),
+        users=Depends(get_users_collection),
+        transactions=Depends(get_transactions_collection),
+        db=Depends(get_db)
+):
+    """
+    Send money through whichever provider is currently healthiest and fastest
+    for the destination bank, falling back to the other when the first refuses.
+    Honours `Idempotency-Key` like the provider-specific routes.
+    """
+    async def handler():
+        return await _routed_transfer(transfer_data, current_user, users, transactions, db)
+    return await _idempotent(
+        response, idempotency_key, current_user, handler, endpoint="transfer", amount=transfer_data.amount,
+        bank_code=transfer_data.bank_code, account_number=transfer_data.recipient_account,
+        narration=transfer_data.narration
+    )
+
+
+async def _routed_transfer(transfer_data, current_user, users, transactions, db):
+    amount = transfer_data.amount
+    if amount <= 0:
+        raise HTTPException(status_code=400, detail="Invalid amount")
+
+    reference = f"TRANSFER_{ObjectId()}"
+    transaction, details, debited = await _submit_transfer(
+        db, transactions, current_user, amount, reference,
+        transfer_data.bank_code, transfer_data.recipient_account, transfer_data.narration, provider_routing.PROVIDERS
+    )
+    if transaction["status"] in reconciler.UNRESOLVED_STATUSES:
+        return _pending_transfer(transaction, debited)
+
+    return {
+        "message": "Transfer initiated",
+        "provider": transaction["provider"],
+        "reference": reference,
+        "amount": amount,
+        "new_balance": debited["wallet_balance"],
+        "attempts": transaction["attempts"],
+    }
 
 
 @router.post("/monnify/transfer/")
 async def monnify_transfer(
+        response: Response,
         amount: float = Query(...),
         destination_bank_code: str = Query(...),
         destination_account_number: str = Query(...),
         narration: str = Query(...),
-        current_user: dict = Depends(get_current_user)
+        idempotency_key: Optional[str] = Header(None),
+        current_user: dict = Depends(get_current_user),
+        users=Depends(get_users_collection),
+        transactions=Depends(get_transactions_collection),
+        db=Depends(get_db)
 ):
-    logging.info(f"Transfer request received for user: {str(current_user['_id'])}, amount: {amount}, bank: {destination_bank_code}, account: {destination_account_number}")
+    """
+    Send money through Monnify. Retries carrying the same `Idempotency-Key`
+    header get the first response back and never disburse twice.
+    """
+    async def handler():
+        return await _monnify_transfer(
+            amount, destination_bank_code, destination_account_number, narration,
+            current_user, users, transactions, db
+        )
+    return await _idempotent(
+        response, idempotency_key, current_user, handler, endpoint="monnify_transfer", amount=amount,
+        bank_code=destination_bank_code, account_number=destination_account_number, narration=narration
+    )
+
+
+async def _monnify_transfer(amount, destination_bank_code, destination_account_number, narration,
+                            current_user, users, transactions, db):
+    logging.info("Transfer request received for user: %s, amount: %s, bank: %s, account: %s",
+                 current_user["_id"], amount, destination_bank_code, destination_account_number)
 
     if amount <= 0:
         logging.error("Invalid amount: must be greater than zero")
@@ -91,157 +283,132 @@ async def monnify_transfer(
         logging.error("User does not have a Monnify account number")
         raise HTTPException(status_code=400, detail="User does not have a Monnify account")
 
-    if current_user.get("wallet_balance", 0) < amount:
-        logging.error("Insufficient Funds")
-        raise HTTPException(status_code=400, detail="Insufficient Funds")
-
-    try:
-        transfer_reference = f"TRANSFER_{str(ObjectId())}_{int(datetime.utcnow().timestamp())}"
-        response = initiate_monnify_transfer(
-            amount,
-            transfer_reference,
-            narration,
-            destination_bank_code,
-            destination_account_number,
-            current_user["account_number"]
-        )
-        # Logging the full response for debugging
-        logging.info(f"Full Monnify Transfer Response: {response}")
-
-        if response.get("status", False):
-            new_balance = current_user["wallet_balance"] - amount
-            users.update_one({"_id": ObjectId(current_user["_id"])}, {"$set": {"wallet_balance": new_balance}})
-
-            transaction = {
-                "user_id": str(current_user["_id"]),
-                "type": "transfer",
-                "amount": amount,
-                "reference": transfer_reference,
-                "recipient_bank_code": destination_bank_code,
-                "recipient_account_number": destination_account_number,
-                "narration": narration,
-                "status": "success",
-                "timestamp": datetime.utcnow()
-            }
-            transactions.insert_one(transaction)
-
-            return {
-                "message": "Transfer initiated and recorded",
-                "reference": transfer_reference,
-                "amount": amount,
-                "new_balance": new_balance,
-                "transfer_details": response.get("responseBody", {}),
-                "transaction": {**transaction, "_id": str(transaction.get("_id", ""))}
-            }
-        else:
-            # More informative error logging
-            error_message = response.get('error', 'Transfer initiation failed')
-            logging.error(f"Transfer Failed: {error_message}")
-            raise HTTPException(status_code=400, detail=error_message)
-
-    except Exception as e:
-        logging.error(f"Monnify Transfer API call failed: {e}")
-        raise HTTPException(status_code=400, detail="Transfer initiation failed")
+    transfer_reference = f"TRANSFER_{str(ObjectId())}_{int(datetime.utcnow().timestamp())}"
+    transaction, details, debited = await _submit_transfer(
+        db, transactions, current_user, amount, transfer_reference,
+        destination_bank_code, destination_account_number, narration, ("monnify",)
+    )
+    if transaction["status"] in reconciler.UNRESOLVED_STATUSES:
+        return _pending_transfer(transaction, debited)
+
+    return {
+        "message": "Transfer initiated and recorded",
+        "reference": transfer_reference,
+        "amount": amount,
+        "new_balance": debited["wallet_balance"],
+        "transfer_details": details.get("data", {}).get("responseBody", {}),
+        "transaction": {**transaction, "_id": str(transaction["_id"])}
+    }
+
+
+@router.post("/monnify/transfer/batch/", status_code=202)
+async def monnify_batch_transfer(
+        batch_request: BatchTransferRequest,
+        response: Response,
+        idempotency_key: Optional[str] = Header(None),
+        current_user: dict = Depends(get_current_user),
+        users=Depends(get_users_collection)
+):
+    """
+    Send up to TRANSFER_BATCH_MAX_ITEMS Monnify transfers in one call.
+    The total is reserved up front; poll the returned batch for per-item status.
+    """
+    items = [item.dict() for item in batch_request.transfers]
+    if not items or len(items) > transfers.TRANSFER_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch must have 1 to {transfers.TRANSFER_BATCH_MAX_ITEMS} transfers")
+    if any(item["amount"] <= 0 for item in items):
+        raise HTTPException(status_code=400, detail="Invalid amount")
+    if not current_user.get("account_number"):
+        raise HTTPException(status_code=400, detail="User does not have a Monnify account")
 
+    async def handler():
+        batch = await transfers.create_batch(users, current_user, items)
+        logging.info("Transfer batch %s queued for user %s: %d transfers, total %s",
+                     batch["_id"], current_user["_id"], len(items), batch["total"])
+        return transfers.batch_status(batch)
+    return await _idempotent(response, idempotency_key, current_user, handler,
+                             endpoint="monnify_batch_transfer", transfers=items)
 
 
+@router.get("/monnify/transfer/batch/{batch_id}")
+async def get_batch_transfer(batch_id: str, current_user=Depends(get_current_user)):
+    batch = await transfers.get_batch(batch_id)
+    if not batch or (batch["user_id"] != str(current_user["_id"]) and not current_user.get("is_admin", False)):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return transfers.batch_status(batch)
 
 
 @router.post("/paystack/transfer/")
 async def paystack_transfer(
+        response: Response,
         amount: float = Query(...),
         destination_bank_code: str = Query(...),
         destination_account_number: str = Query(...),
         narration: str = Query(...),
-        current_user: dict = Depends(get_current_user)
+        idempotency_key: Optional[str] = Header(None),
+        current_user: dict = Depends(get_current_user),
+        users=Depends(get_users_collection),
+        transactions=Depends(get_transactions_collection),
+        db=Depends(get_db)
 ):
-    """Endpoint to handle Paystack transfers"""
-    logging.info(f"Transfer request received for user: {current_user['_id']}, amount: {amount}")
+    """Endpoint to handle Paystack transfers. Honours the `Idempotency-Key` header like the Monnify route."""
+    async def handler():
+        return await _paystack_transfer(
+            amount, destination_bank_code, destination_account_number, narration,
+            current_user, users, transactions, db
+        )
+    return await _idempotent(
+        response, idempotency_key, current_user, handler, endpoint="paystack_transfer", amount=amount,
+        bank_code=destination_bank_code, account_number=destination_account_number, narration=narration
+    )
+
+
+async def _paystack_transfer(amount, destination_bank_code, destination_account_number, narration,
+                             current_user, users, transactions, db):
+    logging.info("Transfer request received for user: %s, amount: %s", current_user["_id"], amount)
 
     # Validate amount
     if amount <= 0:
         logging.error("Invalid amount: must be greater than zero")
         raise HTTPException(status_code=400, detail="Invalid amount")
 
-    # Check if user has sufficient balance
-    if current_user["wallet_balance"] < amount:
-        logging.error("Insufficient Funds")
-        raise HTTPException(status_code=400, detail="Insufficient Funds")
-
-    try:
-        # Create transfer recipient
-        recipient_response = create_transfer_recipient(
-            destination_account_number,
-            destination_bank_code
-        )
-
-        if "error" in recipient_response or not recipient_response.get("status"):
-            logging.error(f"Failed to create transfer recipient: {recipient_response}")
-            raise HTTPException(status_code=400, detail="Failed to create transfer recipient")
-
-        recipient_code = recipient_response["data"]["recipient_code"]
+    reference = f"TRANSFER_{ObjectId()}"
+    transaction, details, debited = await _submit_transfer(
+        db, transactions, current_user, amount, reference,
+        destination_bank_code, destination_account_number, narration, ("paystack",)
+    )
+    if transaction["status"] in reconciler.UNRESOLVED_STATUSES:
+        return _pending_transfer(transaction, debited)
 
-        # Initiate transfer
-        transfer_response = initiate_paystack_transfer(
-            amount,
-            recipient_code,
-            narration
-        )
-
-        if "error" in transfer_response or not transfer_response.get("status"):
-            logging.error(f"Failed to initiate transfer: {transfer_response}")
-            raise HTTPException(status_code=400, detail="Failed to initiate transfer")
-
-        # Update user's wallet balance
-        new_balance = current_user["wallet_balance"] - amount
-        users.update_one(
-            {"_id": ObjectId(current_user["_id"])},
-            {"$set": {"wallet_balance": new_balance}}
-        )
-
-        # Record the transaction
-        transaction_data = {
-            "user_id": str(current_user["_id"]),
-            "type": "transfer",
-            "amount": amount,
-            "recipient_account": destination_account_number,
-            "recipient_bank_code": destination_bank_code,
-            "transfer_code": transfer_response["data"]["transfer_code"],
-            "status": transfer_response["data"]["status"],
-            "created_at": datetime.datetime.utcnow()
-        }
-        transactions.insert_one(transaction_data)
-
-        return {
-            "message": "Transfer initiated",
-            "reference": transfer_response["data"]["transfer_code"],
-            "amount": amount,
-            "new_balance": new_balance,
-            "transfer_details": transfer_response.get("data")
-        }
-
-    except Exception as e:
-        logging.error(f"Transfer failed: {str(e)}")
-        raise HTTPException(status_code=400, detail="Transfer initiation failed")
+    return {
+        "message": "Transfer initiated",
+        "reference": transaction["transfer_code"],
+        "amount": amount,
+        "new_balance": debited["wallet_balance"],
+        "transfer_details": details.get("data")
+    }
 
 
 @router.get("/paystack/transfer/{transfer_code}/verify")
 async def verify_transfer(
         transfer_code: str,
-        current_user: dict = Depends(get_current_user)
+        current_user: dict = Depends(get_current_user),
+        transactions=Depends(get_transactions_collection),
+        db=Depends(get_db)
 ):
     """Verify a Paystack transfer status"""
     try:
-        verification = verify_paystack_transfer(transfer_code)
+        verification = await verify_paystack_transfer(transfer_code)
 
         if "error" in verification or not verification.get("status"):
             raise HTTPException(status_code=400, detail="Transfer verification failed")
 
-        # Update transaction status in database
-        transactions.update_one(
-            {"transfer_code": transfer_code},
-            {"$set": {"status": verification["data"]["status"]}}
+        # Update transaction status in database (refunding the wallet if the transfer failed)
+        transaction = await transactions.find_one(
+            {"transfer_code": transfer_code}, reconciler.TRANSFER_PROJECTION
         )
+        if transaction:
+            await reconciler.apply_statuses(db, [(transaction, verification["data"]["status"])])
 
         return {
             "message": "Transfer verified",
@@ -250,219 +417,284 @@ async def verify_transfer(
         }
 
     except Exception as e:
-        logging.error(f"Transfer verification failed: {str(e)}")
+        logging.error("Transfer verification failed: %s", e)
         raise HTTPException(status_code=500, detail="Transfer verification failed")
 
 
-@router.get("/balance/")
-async def get_balance(account_number: str = None, current_user=Depends(get_current_user)):
-    """Users get their own balance. Admins can check any user's balance by account number."""
+@router.get("/paystack/recipients/stats")
+async def paystack_recipient_stats(current_user=Depends(get_admin_user)):
+    """Hit/miss counters for the Paystack recipient registry."""
+    return recipients.stats()
+
+
+@router.get("/transfer/routing/stats")
+async def transfer_routing_stats(current_user=Depends(get_admin_user)):
+    """Rolling success rate and latency per provider and destination bank, as used by the transfer router."""
+    return provider_routing.provider_router.stats()
+
+
+@router.get("/paystack/reconciler/stats")
+async def paystack_reconciler_stats(current_user=Depends(get_admin_user)):
+    """Backlog and lag of Paystack transfers awaiting a final status."""
+    return await reconciler.reconciler.stats()
+
+
+@router.get("/balance/", response_model=BalanceOut)
+async def get_balance(
+        account_number: str = None,
+        at: datetime = None,
+        current_user=Depends(get_current_user),
+        users=Depends(get_users_collection),
+        db=Depends(get_db)
+):
+    """
+    Users get their own balance. Admins can check any user's balance by account number.
+    Pass `at` to get the ledger balance as of a point in time.
+    """
+    user = current_user
     if account_number:
-        admin_user = get_admin_user(current_user)
-        user = users.find_one({"account_number": account_number})
+        await get_admin_user(current_user)
+        user = await users.find_one({"account_number": account_number}, {"_id": 1})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        return {"balance": user["wallet_balance"]}
-    return {"balance": current_user["wallet_balance"]}
-
-
-@router.get("/transactions/")
-async def get_transactions(account_number: str = None, current_user=Depends(get_current_user)):
-    """Users get their own transactions. Admins can check any user's transactions by account number."""
+    account = ledger.wallet_account(user["_id"])
+    if not await ledger.is_open(db, account):
+        # History not backfilled into the ledger yet; the wallet itself is the only complete figure.
+        if at is not None:
+            raise HTTPException(status_code=409, detail="Balance history is not available for this account yet")
+        wallet_doc = await users.find_one({"_id": ObjectId(user["_id"])}, wallet.BALANCE_PROJECTION)
+        return {"balance": wallet_doc["wallet_balance"]}
+    balance = await ledger.balance_at(db, account, at)
+    return {"balance": ledger.to_naira(balance)}
+
+
+@router.get("/transactions/", response_model=TransactionPage)
+async def get_transactions(
+        account_number: str = None,
+        cursor: str = None,
+        limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        stream: bool = False,
+        current_user=Depends(get_current_user),
+        users=Depends(get_users_collection),
+        transactions=Depends(get_transactions_collection)
+):
+    """
+    Users get their own transactions. Admins can check any user's transactions by account number.
+    Results are newest first; pass the returned `next_cursor` to get the next page,
+    or `stream=true` to receive the whole history as NDJSON.
+    """
+    user = current_user
     if account_number:
-        admin_user = get_admin_user(current_user)
-        user = users.find_one({"account_number": account_number})
+        await get_admin_user(current_user)
+        user = await users.find_one({"account_number": account_number}, {"_id": 1})
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        return list(transactions.find({"user_id": str(user["_id"])}))
 
-    return list(transactions.find({"user_id": str(current_user["_id"])}))
+    if stream:
+        return StreamingResponse(
+            pagination.stream_transactions(transactions, str(user["_id"]), cursor),
+            media_type="application/x-ndjson"
+        )
+    # Returned as a response so FastAPI doesn't run jsonable_encoder over the page.
+    return BSONJSONResponse(await pagination.transaction_page(transactions, str(user["_id"]), cursor, limit))
+
+
+@router.post("/transactions/exports/", status_code=202)
+async def create_statement_export(
+        export_request: ExportRequest,
+        current_user=Depends(get_current_user),
+        users=Depends(get_users_collection)
+):
+    """
+    Queue a CSV or Parquet statement export for a date range.
+    Admins may export several accounts at once by account number.
+    """
+    if export_request.format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of {', '.join(exports.FORMATS)}")
+    if export_request.format == "parquet" and not exports.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export is not available on this server")
+    if export_request.start >= export_request.end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    user_ids = [str(current_user["_id"])]
+    if export_request.account_numbers:
+        await get_admin_user(current_user)
+        found = await users.find(
+            {"account_number": {"$in": export_request.account_numbers}}, {"_id": 1}
+        ).to_list(len(export_request.account_numbers))
+        if not found:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_ids = [str(user["_id"]) for user in found]
+
+    job = await exports.create_job(
+        current_user["_id"], user_ids, export_request.start, export_request.end, export_request.format
+    )
+    return exports.job_status(job)
 
 
-@router.get("/users/{account_number}/")
-async def get_user_by_account(account_number: str, current_user=Depends(get_admin_user)):
-    user = users.find_one({"account_number": account_number})
+async def _get_export_job(job_id: str, current_user):
+    job = await exports.get_job(job_id)
+    if not job or (job["requested_by"] != str(current_user["_id"]) and not current_user.get("is_admin", False)):
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+
+@router.get("/transactions/exports/{job_id}")
+async def get_statement_export(job_id: str, current_user=Depends(get_current_user)):
+    """Poll the status of a statement export."""
+    return exports.job_status(await _get_export_job(job_id, current_user))
+
+
+@router.get("/transactions/exports/{job_id}/download")
+async def download_statement_export(job_id: str, current_user=Depends(get_current_user)):
+    job = await _get_export_job(job_id, current_user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    if not os.path.exists(job["path"]):
+        # EXPORT_DIR isn't shared with the host that wrote the file (see exports.py).
+        raise HTTPException(status_code=410, detail="Export file is not available on this server")
+    media_type = "text/csv" if job["format"] == "csv" else "application/vnd.apache.parquet"
+    return FileResponse(job["path"], media_type=media_type, filename=f"statement-{job_id}.{job['format']}")
+
+
+@router.get("/users/{account_number}/", response_model=UserOut)
+async def get_user_by_account(account_number: str, current_user=Depends(get_admin_user), users=Depends(get_users_collection)):
+    user = await users.find_one({"account_number": account_number}, projection(UserOut))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
-# @router.post("/monnify/webhook/")
-# async def monnify_webhook(request: Request):
-#     try:
-#         data = await request.json()
-#         logging.info(f"Webhook received: {data}")
-#
-#         event_type = data.get("eventType")
-#         transaction_reference = data.get("transactionReference")
-#         payment_status = data.get("paymentStatus")
-#         amount = float(data.get("amountPaid", 0))
-#         account_number = data.get("destinationAccountNumber")
-#         source_account = data.get("sourceAccountNumber")
-#         transaction_type = data.get("paymentMethod")
-#
-#         if event_type == "SUCCESSFUL_TRANSACTION" and payment_status == "PAID":
-#             # Check if it's an incoming transfer
-#             if source_account: #if source account exist, it is a transfer.
-#                 user = users.find_one({"account_number": account_number})
-#                 if not user:
-#                     logging.error(f"No user found for account {account_number}")
-#                     raise HTTPException(status_code=400, detail="User not found")
-#
-#                 new_balance = user.get("wallet_balance", 0) + amount
-#                 users.update_one({"_id": user["_id"]}, {"$set": {"wallet_balance": new_balance}})
-#
-#                 transaction = {
-#                     "user_id": str(user["_id"]),
-#                     "type": "deposit",
-#                     "amount": amount,
-#                     "reference": transaction_reference,
-#                     "method": transaction_type.lower(),
-#                     "status": "success",
-#                     "timestamp": datetime.utcnow(),
-#                 }
-#                 transactions.insert_one(transaction)
-#
-#                 return {"message": "Deposit recorded", "transaction": transaction}
-#             else: #if source account does not exist, it is a direct deposit.
-#                 user = users.find_one({"account_number": account_number})
-#                 if not user:
-#                     logging.error(f"No user found for account {account_number}")
-#                     raise HTTPException(status_code=400, detail="User not found")
-#
-#                 new_balance = user.get("wallet_balance", 0) + amount
-#                 users.update_one({"_id": user["_id"]}, {"$set": {"wallet_balance": new_balance}})
-#
-#                 transaction = {
-#                     "user_id": str(user["_id"]),
-#                     "type": "deposit",
-#                     "amount": amount,
-#                     "reference": transaction_reference,
-#                     "method": transaction_type.lower(),
-#                     "status": "success",
-#                     "timestamp": datetime.utcnow(),
-#                 }
-#                 transactions.insert_one(transaction)
-#
-#                 return {"message": "Deposit recorded", "transaction": transaction}
-#
-#         elif event_type == "TRANSFER_SUCCESS":
-#             sender = users.find_one({"account_number": source_account})
-#             if not sender:
-#                 logging.error(f"No sender found for account {source_account}")
-#                 raise HTTPException(status_code=400, detail="Sender not found")
-#
-#             new_balance = sender.get("wallet_balance", 0) - amount
-#             users.update_one({"_id": sender["_id"]}, {"$set": {"wallet_balance": new_balance}})
-#
-#             transaction = {
-#                 "user_id": str(sender["_id"]),
-#                 "type": "transfer",
-#                 "amount": amount,
-#                 "reference": transaction_reference,
-#                 "recipient_account": account_number,
-#                 "status": "success",
-#                 "timestamp": datetime.utcnow(),
-#             }
-#             transactions.insert_one(transaction)
-#
-#             return {"message": "Transfer recorded", "transaction": transaction}
-#
-#         return {"message": "Unhandled event type"}
-#
-#     except KeyError as e:
-#         logging.error(f"Webhook processing failed due to missing key: {e}")
-#         raise HTTPException(status_code=400, detail=f"Webhook processing failed: Missing key {e}")
-#     except Exception as e:
-#         logging.error(f"Webhook processing failed: {e}")
-#         raise HTTPException(status_code=400, detail="Webhook processing failed")
-
-
 @router.post("/monnify/webhook/")
 async def monnify_webhook(request: Request):
+    """
+    Persist the raw event to the webhook inbox and acknowledge straight away.
+    Crediting happens in the inbox workers; provider retries are dropped by reference.
+    """
     try:
         data = await request.json()
-        logging.info(f"Full webhook data: {data}")
+        logging.debug("Monnify webhook received", extra={"event": "webhook.payload", "payload": data})
+
+        if not await webhook_inbox.ingest("monnify", data):
+            return {"message": "Event already received", "status": "duplicate"}
+        return {"message": "Event accepted", "status": "accepted"}
+
+    except Exception as e:
+        logging.error("Webhook processing failed: %s", e)
+        return {"message": f"Webhook processing failed: {str(e)}", "status": "error"}
+
 
-        # Extract event data and event type
-        event_data = data.get('eventData', data)
-        event_type = data.get('eventType')  # Get event type from the root level
+@router.get("/monnify/webhook/inbox/stats")
+async def webhook_inbox_stats(current_user=Depends(get_admin_user)):
+    """Webhook inbox depth and lag."""
+    return await webhook_inbox.stats()
 
-        logging.info(f"Event Type: {event_type}")
 
-        payment_status = event_data.get("paymentStatus")
+@router.get("/monnify/webhook/archive/stats")
+async def webhook_archive_stats(current_user=Depends(get_admin_user)):
+    """Archived webhook payloads and how well they compress."""
+    return await webhook_archive.stats()
 
-        # Use payment source information from the nested structure
-        payment_sources = event_data.get('paymentSourceInformation', [])
 
-        # Prefer the first payment source if multiple exist
-        source_info = payment_sources[0] if payment_sources else {}
+@router.get("/monnify/webhook/archive/{reference}")
+async def get_archived_webhook(reference: str, current_user=Depends(get_admin_user)):
+    """The raw Monnify webhook payload for a deposit, from the compressed archive."""
+    archived = await webhook_archive.load("monnify", reference)
+    if archived is None:
+        raise HTTPException(status_code=404, detail="No archived webhook for this reference")
+    return archived
 
-        amount = float(source_info.get('amountPaid', event_data.get('amountPaid', 0)))
-        account_number = event_data.get('destinationAccountInformation', {}).get('accountNumber')
-        source_account = source_info.get('accountNumber')
-        transaction_type = event_data.get('paymentMethod', 'ACCOUNT_TRANSFER')
-        transaction_reference = event_data.get('transactionReference')
 
-        logging.info(f"Parsed webhook data: event_type={event_type}, amount={amount}, account_number={account_number}")
+@router.get("/transactions/{user_id}", response_model=TransactionPage)
+async def get_transactions(
+        user_id: str,
+        cursor: str = None,
+        limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+        stream: bool = False,
+        current_user=Depends(get_current_user),
+        transactions=Depends(get_transactions_collection)
+):
+    """A user's transactions by user id; users may only read their own, admins anyone's."""
+    if user_id != str(current_user["_id"]) and not current_user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Not allowed to view these transactions")
+    if stream:
+        return StreamingResponse(
+            pagination.stream_transactions(transactions, user_id, cursor),
+            media_type="application/x-ndjson"
+        )
+    return BSONJSONResponse(await pagination.transaction_page(transactions, user_id, cursor, limit))
+
 
-        if event_type == "SUCCESSFUL_TRANSACTION" and payment_status == "PAID":
-            user = users.find_one({"account_number": account_number})
-            if not user:
-                logging.error(f"No user found for account {account_number}")
-                return {"message": "No user found", "status": "ignored"}
 
-            try:
-                current_balance = float(user.get("wallet_balance", 0))
-                new_balance = current_balance + amount
+@router.get("/banks/")
+async def get_banks_endpoint(if_none_match: Optional[str] = Header(None)):
+    """
+    Endpoint to get all banks and their codes.
+    Served from the bank directory cache; send `If-None-Match` to get a 304 when unchanged.
+    """
+    try:
+        entry = await bank_directory.directory.get()
+    except Exception as e:
+        logging.error("Failed to fetch banks: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to fetch banks")
 
-                logging.info(
-                    f"Updating balance for user {user['_id']}. Current balance: {current_balance}, amount: {amount}, new balance: {new_balance}")
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if if_none_match and entry["etag"] in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
 
-                result = users.update_one(
-                    {"_id": user["_id"]},
-                    {"$set": {"wallet_balance": float(new_balance)}}  # Explicitly convert to float
-                )
 
-                transaction = {
-                    "user_id": str(user["_id"]),
-                    "type": "deposit",
-                    "amount": amount,
-                    "reference": transaction_reference,
-                    "method": transaction_type.lower(),
-                    "status": "success",
-                    "timestamp": datetime.utcnow(),
-                    "source_account": source_account,
-                    "raw_webhook_data": event_data  # Store full webhook data for reference
-                }
-                transactions.insert_one(transaction)
+@router.get("/resolve-account")
+async def resolve_account(
+        account_number: str = Query(...),
+        bank_code: str = Query(...),
+        current_user=Depends(get_current_user)
+):
+    """
+    Name enquiry: confirm who holds an account before sending money to it.
+    Answers are cached, so repeat lookups don't reach the provider.
+    """
+    try:
+        return await account_resolution.resolve(bank_code, account_number)
+    except account_resolution.ResolutionError as e:
+        logging.error("Account resolution failed for %s/%s: %s", bank_code, account_number, e)
+        raise HTTPException(status_code=502, detail="Account resolution is temporarily unavailable")
 
-                logging.info(f"Transaction recorded: {transaction}")
-                return {"message": "Deposit recorded", "status": "success"}
 
-            except Exception as db_error:
-                logging.error(f"Error updating database: {db_error}")
-                return {"message": "Database update failed", "status": "error"}
+@router.post("/resolve-account/batch/")
+async def resolve_accounts(lookup: AccountResolutionRequest, current_user=Depends(get_current_user)):
+    """
+    Resolve up to RESOLVE_BATCH_MAX accounts at once, e.g. to validate a bulk transfer.
+    Results are in request order; an item the provider could not answer has `valid: null` and an `error`.
+    """
+    if not lookup.accounts or len(lookup.accounts) > account_resolution.RESOLVE_BATCH_MAX:
+        raise HTTPException(status_code=400,
+                            detail=f"Send 1 to {account_resolution.RESOLVE_BATCH_MAX} accounts")
+    results = await account_resolution.resolve_many(
+        [(account.bank_code, account.account_number) for account in lookup.accounts]
+    )
+    return {"results": results}
 
-        return {"message": "Unhandled event type", "status": "ignored"}
 
-    except Exception as e:
-        logging.error(f"Webhook processing failed: {e}")
-        return {"message": f"Webhook processing failed: {str(e)}", "status": "error"}
+@router.get("/resolve-account/stats")
+async def account_resolution_stats(current_user=Depends(get_admin_user)):
+    """Hit/miss counters and size of the account-name cache."""
+    return account_resolution.stats()
 
-@router.get("/transactions/{user_id}")
-async def get_transactions(user_id: str):
-    user_transactions = list(transactions.find({"user_id": user_id}, {"_id": 0}))
-    return {"transactions": user_transactions}
 
+@router.get("/banks/stats")
+async def bank_directory_stats(current_user=Depends(get_admin_user)):
+    """Hit/refresh counters and age of the cached bank directory."""
+    return bank_directory.directory.stats()
 
 
-@router.get("/banks/")
-async def get_banks_endpoint():
-    """Endpoint to get all banks and their codes."""
-    banks = get_all_banks()
+@router.get("/monnify/token/stats")
+async def monnify_token_stats(current_user=Depends(get_admin_user)):
+    """Hit/miss/refresh counters for the cached Monnify access token."""
+    return monnify_tokens.stats()
 
-    if "error" in banks:
-        raise HTTPException(status_code=500, detail="Failed to fetch banks")
 
-    return banks
+@router.get("/gateways/stats")
+async def gateways_stats(current_user=Depends(get_admin_user)):
+    """Circuit breaker state, bulkhead occupancy and retry counts per payment provider."""
+    return gateway_stats()
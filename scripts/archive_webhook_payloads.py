@@ -0,0 +1,67 @@
+"""
+Move legacy `raw_webhook_data` blobs from `transactions` into the compressed webhook archive.
+
+Walks the deposit rows that still carry a raw payload in `_id` order,
+archives each batch with `webhook_archive.migrate` and then unsets the blobs,
+so it can be stopped and re-run at any point. Prints the size of
+`transactions` before and after.
+
+Unsetting fields shrinks the data (and so what the cache has to hold) at
+once, but WiredTiger keeps the freed file space for reuse; pass `--compact`
+to release it, preferably on a secondary first.
+
+Usage:
+    MONGO_URI=... python scripts/archive_webhook_payloads.py --batch-size 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+import webhook_archive  # noqa: E402
+
+
+async def collection_size(db, name):
+    stats = await db.command("collStats", name)
+    return {key: stats.get(key, 0) for key in ("count", "size", "avgObjSize", "storageSize", "totalIndexSize")}
+
+
+def report(label, stats):
+    print(f"{label:<7} {stats['count']:>10} docs  data {stats['size'] / 2 ** 20:9.1f} MiB  "
+          f"avg {stats['avgObjSize']:7.0f} B  storage {stats['storageSize'] / 2 ** 20:9.1f} MiB  "
+          f"indexes {stats['totalIndexSize'] / 2 ** 20:8.1f} MiB")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=webhook_archive.WEBHOOK_ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--compact", action="store_true", help="run compact on transactions afterwards")
+    args = parser.parse_args()
+
+    db = database.get_db()
+    try:
+        await indexes.ensure_indexes(db, webhook_archive.INDEXES)
+        before = await collection_size(db, "transactions")
+        report("before", before)
+
+        moved = await webhook_archive.migrate(
+            db, args.batch_size, progress=lambda n: print(f"moved {n} payloads", end="\r", flush=True))
+        print(f"moved {moved} payloads ({webhook_archive.CODEC}, "
+              f"{webhook_archive.raw_bytes / 2 ** 20:.1f} MiB -> {webhook_archive.stored_bytes / 2 ** 20:.1f} MiB)")
+
+        if args.compact:
+            await db.command("compact", "transactions")
+        after = await collection_size(db, "transactions")
+        report("after", after)
+        if before["size"]:
+            print(f"transactions data size {1 - after['size'] / before['size']:.1%} smaller")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+"""
+Dev-mode check that every known query shape is served by an index.
+
+Ensures the indexes, then runs explain() on each shape in
+`indexes.query_shapes()` and exits non-zero if any winning plan contains a
+COLLSCAN. Run it against a development database after adding a new query.
+
+Usage:
+    MONGO_URI=mongodb://localhost:27017 python scripts/audit_query_plans.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+
+
+async def main():
+    db = database.get_db()
+    try:
+        await indexes.ensure_indexes(db)
+        failures = await indexes.audit_query_shapes(db)
+    finally:
+        database.close()
+
+    for collection, query, sort, stages in failures:
+        print(f"COLLSCAN: {collection}.find({query}) sort={sort} plan={' -> '.join(stages)}")
+    if failures:
+        return 1
+    print(f"OK: all {len(indexes.query_shapes())} query shapes use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,96 @@
+"""
+Backfill the double-entry ledger from the legacy `transactions` collection.
+
+Walks `transactions` in `_id` order in batches and journals each row with
+`ledger.insert_entries`, so the script can be stopped and re-run safely:
+already-journalled rows are skipped by the unique (txn_id, account) index.
+
+Legacy rows are inconsistent (`timestamp` vs `created_at`, `reference` vs
+`transfer_code`); both spellings are accepted. Once the history is in, each
+wallet gets an opening adjustment for any difference between its
+`wallet_balance` and the journalled total, followed by a snapshot, and is
+marked open so the balance endpoint starts reading it from the ledger.
+
+Usage:
+    MONGO_URI=... python scripts/backfill_ledger.py --batch-size 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import indexes  # noqa: E402
+import ledger  # noqa: E402
+
+OPENING_ACCOUNT = "equity:opening_balances"
+
+
+def entries_for(txn):
+    amount = ledger.to_kobo(txn.get("amount", 0))
+    if amount <= 0 or not txn.get("user_id") or txn.get("reserved") or txn.get("batch_id"):
+        # Reserved transfers (batch items included) were journalled live, through the in-flight account.
+        return []
+
+    reference = txn.get("reference") or txn.get("transfer_code")
+    txn_id = reference or f"legacy:{txn['_id']}"
+    created_at = txn.get("timestamp") or txn.get("created_at") or txn["_id"].generation_time.replace(tzinfo=None)
+    wallet = ledger.wallet_account(txn["user_id"])
+    provider = ledger.provider_account("paystack" if txn.get("transfer_code") else "monnify")
+
+    if txn.get("type") == "deposit":
+        return ledger.journal_entries(txn_id, provider, wallet, amount, "deposit", reference, created_at)
+    if txn.get("type") == "transfer":
+        return ledger.journal_entries(txn_id, wallet, provider, amount, "transfer", reference, created_at)
+    return []
+
+
+async def backfill_transactions(db, batch_size):
+    last_id = None
+    total = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id else {}
+        batch = await db["transactions"].find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return total
+
+        entries = [entry for txn in batch for entry in entries_for(txn)]
+        await ledger.insert_entries(db, entries)
+        last_id = batch[-1]["_id"]
+        total += len(batch)
+        print(f"journalled {total} transactions (last _id {last_id})")
+
+
+async def reconcile_wallets(db, batch_size):
+    adjusted = 0
+    cursor = db["users"].find({}, {"wallet_balance": 1}).batch_size(batch_size)
+    async for user in cursor:
+        account = ledger.wallet_account(user["_id"])
+        difference = ledger.to_kobo(user.get("wallet_balance") or 0) - await ledger.balance_at(db, account)
+        if difference:
+            await ledger.post(db, f"opening:{user['_id']}", OPENING_ACCOUNT, account, difference, "opening_balance")
+            adjusted += 1
+        await ledger.snapshot(db, account)
+        await ledger.open_account(db, account)
+    return adjusted
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = database.get_db()
+    try:
+        await indexes.ensure_indexes(db, ledger.INDEXES)
+        total = await backfill_transactions(db, args.batch_size)
+        adjusted = await reconcile_wallets(db, args.batch_size)
+        print(f"done: {total} transactions journalled, {adjusted} wallets given an opening adjustment")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
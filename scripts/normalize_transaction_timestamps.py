@@ -0,0 +1,31 @@
+"""
+Rename `created_at` to `timestamp` on legacy Paystack transaction rows.
+
+The (user_id, timestamp) index and history queries assume every row has a
+`timestamp`; Paystack transfers used to be written with `created_at` instead.
+
+Usage:
+    MONGO_URI=... python scripts/normalize_transaction_timestamps.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+async def main():
+    try:
+        result = await database.get_db()["transactions"].update_many(
+            {"timestamp": {"$exists": False}, "created_at": {"$exists": True}},
+            {"$rename": {"created_at": "timestamp"}},
+        )
+        print(f"normalized {result.modified_count} transactions")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,339 @@
+"""
+Batch (payroll-style) Monnify disbursements.
+
+A batch reserves its whole total against the wallet with one atomic debit
+(journalled into the ledger's in-flight account), is persisted in `transfer_batches`, and is then fanned out as single
+disbursements by an in-process runner. Fan-out is bounded twice: at most
+`TRANSFER_BATCH_CONCURRENCY` transfers in flight per batch, and one
+process-wide token bucket of `MONNIFY_TRANSFER_RATE` calls per second shared
+by all batches, so a large batch cannot trip the gateway's rate limit.
+
+Each item carries a deterministic reference (`BATCH_<batch id>_<index>`).
+An item whose outcome is unknown (timeout, or a crash mid-call) is looked up
+by that reference before anything is refunded; only transfers Monnify
+definitely rejected, or still has no record of `RECONCILE_UNRESOLVED_MIN_AGE`
+after they were sent, are refunded. Successes are settled and
+failures refunded out of the in-flight account per item reference, so each
+happens at most once however often a batch is finalized.
+
+Failures are refunded as soon as they are known; only items still unknown
+keep their share reserved, with the batch left in "needs_review".
+`review_batches`, run by the reconciler, looks those items up again until
+every one is settled or refunded.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import BulkWriteError
+
+import ledger
+import wallet
+from database import get_db
+from utils import get_monnify_transfer_status, initiate_monnify_transfer
+
+TRANSFER_BATCH_MAX_ITEMS = int(os.getenv("TRANSFER_BATCH_MAX_ITEMS", "1000"))
+TRANSFER_BATCH_CONCURRENCY = int(os.getenv("TRANSFER_BATCH_CONCURRENCY", "10"))
+MONNIFY_TRANSFER_RATE = float(os.getenv("MONNIFY_TRANSFER_RATE", "20"))
+TRANSFER_BATCH_RATE_LIMIT_RETRIES = int(os.getenv("TRANSFER_BATCH_RATE_LIMIT_RETRIES", "5"))
+# A batch still "running" after this long belonged to a worker that died.
+TRANSFER_BATCH_STALE_AFTER = timedelta(seconds=int(os.getenv("TRANSFER_BATCH_STALE_AFTER_SECONDS", "900")))
+# A provider may not list a transfer straight away; wait this long before taking "not found" as final.
+RECONCILE_UNRESOLVED_MIN_AGE = timedelta(seconds=int(os.getenv("RECONCILE_UNRESOLVED_MIN_AGE_SECONDS", "300")))
+
+DUPLICATE_KEY = 11000
+
+INDEXES = {
+    "transfer_batches": [
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+}
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, with bursts of up to `burst` (default: none)."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self._rate = rate
+        self._burst = burst or 1.0
+        self._clock = clock
+        self._tokens = self._burst
+        self._updated = clock()
+
+    async def acquire(self):
+        while True:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+monnify_limiter = RateLimiter(MONNIFY_TRANSFER_RATE)
+
+
+async def create_batch(users, current_user, items):
+    """Reserve the batch total against the wallet and queue the batch. Raises 400 on insufficient funds."""
+    db = get_db()
+    total_kobo = sum(ledger.to_kobo(item["amount"]) for item in items)
+    batch_id = ObjectId()
+    debited = await wallet.reserve(db, current_user["_id"], ledger.to_naira(total_kobo), f"BATCH_{batch_id}")
+    if debited is None:
+        raise HTTPException(status_code=400, detail="Insufficient Funds")
+
+    batch = {
+        "_id": batch_id,
+        "user_id": str(current_user["_id"]),
+        "source_account_number": current_user["account_number"],
+        "status": "queued",
+        "total": ledger.to_naira(total_kobo),
+        "items": [
+            {**item, "index": i, "reference": f"BATCH_{batch_id}_{i}", "status": "pending"}
+            for i, item in enumerate(items)
+        ],
+        "created_at": datetime.utcnow(),
+    }
+    try:
+        await db["transfer_batches"].insert_one(batch)
+    except Exception:
+        await wallet.refund(db, current_user["_id"], ledger.to_naira(total_kobo), f"BATCH_{batch_id}")
+        raise
+    runner.enqueue(batch_id)
+    return batch
+
+
+async def get_batch(batch_id):
+    try:
+        return await get_db()["transfer_batches"].find_one({"_id": ObjectId(batch_id)})
+    except InvalidId:
+        return None
+
+
+def batch_status(batch):
+    counts = {}
+    for item in batch["items"]:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {
+        "batch_id": str(batch["_id"]),
+        "status": batch["status"],
+        "total": batch["total"],
+        "counts": counts,
+        "items": [
+            {key: item.get(key) for key in (
+                "index", "reference", "amount", "destination_bank_code", "destination_account_number",
+                "status", "error")}
+            for item in batch["items"]
+        ],
+        "created_at": batch["created_at"],
+        "finished_at": batch.get("finished_at"),
+    }
+
+
+async def _set_item(batches, batch_id, index, status, error=None, **fields):
+    await batches.update_one({"_id": batch_id}, {"$set": {
+        f"items.{index}.status": status, f"items.{index}.error": error,
+        **{f"items.{index}.{key}": value for key, value in fields.items()},
+    }})
+
+
+async def _send_item(batches, batch, item, semaphore):
+    async with semaphore:
+        item["sent_at"] = datetime.utcnow()
+        await _set_item(batches, batch["_id"], item["index"], "submitting", sent_at=item["sent_at"])
+        for attempt in range(TRANSFER_BATCH_RATE_LIMIT_RETRIES + 1):
+            await monnify_limiter.acquire()
+            response = await initiate_monnify_transfer(
+                item["amount"], item["reference"], item["narration"],
+                item["destination_bank_code"], item["destination_account_number"],
+                batch["source_account_number"],
+            )
+            if response.get("error_code") != 429:
+                break
+            # Rate limited: nothing was sent, so the same reference is safe to resend.
+            await asyncio.sleep(0.5 * 2 ** attempt)
+    if response.get("status"):
+        status, error = "success", None
+    elif response.get("error_code") and response["error_code"] < 500:
+        # Monnify answered and rejected the transfer, so no money moved.
+        status, error = "failed", response.get("message")
+    else:
+        # No usable answer (timeout, 5xx): the transfer may or may not exist.
+        status, error = "unknown", response.get("error")
+    await _set_item(batches, batch["_id"], item["index"], status, error)
+    item["status"], item["error"] = status, error
+
+
+async def _resolve_unknown(batches, batch, item):
+    await monnify_limiter.acquire()
+    status = await get_monnify_transfer_status(item["reference"])
+    sent_at = item.get("sent_at") or batch.get("started_at") or batch["created_at"]
+    if status is None and datetime.utcnow() - sent_at >= RECONCILE_UNRESOLVED_MIN_AGE:
+        item["status"] = "failed"  # Monnify still has no record of it, so it was never received.
+    elif status == "SUCCESS":
+        item["status"] = "success"
+    elif status == "FAILED":
+        item["status"] = "failed"
+    else:
+        return  # Pending, not listed yet, or the lookup failed; leave for review.
+    await _set_item(batches, batch["_id"], item["index"], item["status"], item.get("error"))
+
+
+async def _record_successes(db, batch, items):
+    if not items:
+        return
+    now = datetime.utcnow()
+    docs = [{
+        "user_id": batch["user_id"],
+        "type": "transfer",
+        "amount": item["amount"],
+        "reference": item["reference"],
+        "recipient_bank_code": item["destination_bank_code"],
+        "recipient_account_number": item["destination_account_number"],
+        "narration": item["narration"],
+        "batch_id": str(batch["_id"]),
+        "status": "success",
+        "reserved": True,
+        "timestamp": now,
+    } for item in items]
+    try:
+        await db["transactions"].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Rows already written by an earlier, interrupted finalize.
+        if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+            raise
+    entries = []
+    for item in items:
+        entries += ledger.journal_entries(
+            item["reference"], ledger.IN_FLIGHT_ACCOUNT, ledger.provider_account("monnify"),
+            ledger.to_kobo(item["amount"]), "transfer", reference=item["reference"], created_at=now,
+        )
+    await ledger.post_entries(db, entries)
+
+
+async def _refund_failures(db, batch, items):
+    # Keyed by item reference in the ledger, so a re-run of finalize can never refund an item twice.
+    refunded = 0
+    for item in items:
+        if await wallet.refund(db, batch["user_id"], item["amount"], item["reference"]) is not None:
+            refunded += ledger.to_kobo(item["amount"])
+    if refunded:
+        await db["transfer_batches"].update_one(
+            {"_id": batch["_id"]}, {"$inc": {"refunded": ledger.to_naira(refunded)}}
+        )
+
+
+async def _finalize(db, batch):
+    """Look up unknown items, then settle successes and refund failures. Returns the batch's new status."""
+    batches = db["transfer_batches"]
+    for item in batch["items"]:
+        if item["status"] == "submitting":
+            # Interrupted mid-call by a crash: find out what happened before deciding.
+            item["status"] = "unknown"
+    await asyncio.gather(*(
+        _resolve_unknown(batches, batch, item) for item in batch["items"] if item["status"] == "unknown"
+    ))
+
+    await _record_successes(db, batch, [item for item in batch["items"] if item["status"] == "success"])
+    await _refund_failures(db, batch, [item for item in batch["items"] if item["status"] == "failed"])
+    return "needs_review" if any(item["status"] == "unknown" for item in batch["items"]) else "completed"
+
+
+async def run_batch(batch):
+    db = get_db()
+    semaphore = asyncio.Semaphore(TRANSFER_BATCH_CONCURRENCY)
+    await asyncio.gather(*(
+        _send_item(db["transfer_batches"], batch, item, semaphore)
+        for item in batch["items"] if item["status"] == "pending"
+    ))
+    return await _finalize(db, batch)
+
+
+async def review_batches(db):
+    """Finalize batches left in "needs_review" again. Returns how many completed."""
+    batches = db["transfer_batches"]
+    completed = 0
+    async for batch in batches.find({"status": "needs_review"}):
+        for item in batch["items"]:
+            if item["status"] == "pending":
+                # The batch stopped (see BatchRunner._process) before this item was sent.
+                item["status"], item["error"] = "failed", "Not sent"
+                await _set_item(batches, batch["_id"], item["index"], "failed", "Not sent")
+        try:
+            status = await _finalize(db, batch)
+        except Exception as e:
+            logging.error("Review of transfer batch %s failed: %s", batch["_id"], e)
+            continue
+        if status == "completed":
+            await batches.update_one({"_id": batch["_id"], "status": "needs_review"}, {"$set": {
+                "status": "completed", "finished_at": datetime.utcnow()}})
+            completed += 1
+    return completed
+
+
+class BatchRunner:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._tasks = set()
+        self._dispatcher = None
+
+    def enqueue(self, batch_id):
+        self._queue.put_nowait(batch_id)
+
+    async def start(self):
+        # Batches that were queued or interrupted by a restart are picked up again.
+        batches = get_db()["transfer_batches"]
+        await batches.update_many(
+            {"status": "running", "started_at": {"$lt": datetime.utcnow() - TRANSFER_BATCH_STALE_AFTER}},
+            {"$set": {"status": "queued"}},
+        )
+        async for batch in batches.find({"status": "queued"}, {"_id": 1}).sort("created_at", ASCENDING):
+            self.enqueue(batch["_id"])
+        self._dispatcher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = set()
+
+    async def _run(self):
+        batches = get_db()["transfer_batches"]
+        while True:
+            batch_id = await self._queue.get()
+            batch = await batches.find_one_and_update(
+                {"_id": batch_id, "status": "queued"},
+                {"$set": {"status": "running", "started_at": datetime.utcnow()}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if batch is None:
+                continue
+            # Batches run side by side; the shared rate limiter keeps the total call rate bounded.
+            task = asyncio.create_task(self._process(batches, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batches, batch):
+        try:
+            status = await run_batch(batch)
+            await batches.update_one({"_id": batch["_id"]}, {"$set": {
+                "status": status, "finished_at": datetime.utcnow()}})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Transfer batch %s failed: %s", batch["_id"], e)
+            await batches.update_one({"_id": batch["_id"]}, {"$set": {
+                "status": "needs_review", "error": str(e), "finished_at": datetime.utcnow()}})
+
+
+runner = BatchRunner()
@@ -9,13 +9,18 @@ import cloudinary
 import cloudinary.uploader
 import os
 from dotenv import load_dotenv
-import requests
+import httpx
+import asyncio
 import base64
+import io
 import time
-from database import users
-from bson import ObjectId
+from database import get_db
+from monnify_auth import MonnifyTokenManager
+from gateway import monnify, paystack
+from metrics import gateway_operation
+from resilience import ResilienceError, was_sent
+import wallet
 import logging
-import json
 
 load_dotenv()
 
@@ -27,7 +32,10 @@ cloudinary.config(
 
 # load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor. Raising it re-hashes existing passwords on their next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
@@ -41,8 +49,8 @@ MONNIFY_SECRET = os.getenv("MONNIFY_SECRET")
 MONNIFY_API_KEY = os.getenv("MONNIFY_API_KEY")
 MONNIFY_WALLET_ACCOUNT = os.getenv("MONNIFY_WALLET_ACCOUNT")
 MONNIFY_BASE_URL_3 = "https://api.monnify.com/api/v2/disbursements/single"
-monnify_token = None
-token_expiry = 0
+# Monnify's name enquiry answers a 400/404 with one of these messages when the account doesn't exist.
+MONNIFY_ACCOUNT_NOT_FOUND_MESSAGES = ("invalid account", "account not found", "could not find", "does not exist")
 
 
 def create_access_token(data: dict):
@@ -72,17 +80,19 @@ def verify_password(password: str, hashed_password: str):
 
 # Payment setup
 
-def initiate_deposit(email: str, amount: float):
-    url = "https://api.paystack.co/transaction/initialize"
+@gateway_operation("initialize_transaction")
+async def initiate_deposit(email: str, amount: float):
+    url = "/transaction/initialize"
     headers = {"Authorization": f"Bearer {PAYSTACK_SECRET}"}
     data = {"email": email, "amount": int(amount * 100)}
-    response = requests.post(url, json=data, headers=headers)
+    response = await paystack.post(url, json=data, headers=headers)
     return response.json()
 
 
 
-def initiate_transfer(recipient_account: str, bank_code: str, amount: float):
-    url = "https://api.monnify.com/api/v2/disbursements/single"
+@gateway_operation("legacy_disbursement")
+async def initiate_transfer(recipient_account: str, bank_code: str, amount: float):
+    url = "/api/v2/disbursements/single"
     headers = {"Authorization": f"Bearer {MONNIFY_API_KEY}"}
     data = {
         "amount": amount,
@@ -90,12 +100,13 @@ def initiate_transfer(recipient_account: str, bank_code: str, amount: float):
         "destinationAccountNumber": recipient_account,
         "narration": "Bank Transfer"
     }
-    response = requests.post(url, json=data, headers=headers)
+    response = await monnify.post(url, json=data, headers=headers)
     return response.json()
 
 # cloudinary setup
-def upload_image(image):
-    result = cloudinary.uploader.upload(image.file)
+async def upload_image(data: bytes):
+    """Upload image bytes to Cloudinary on a worker thread (the SDK is blocking)."""
+    result = await asyncio.to_thread(cloudinary.uploader.upload, io.BytesIO(data))
     return result.get("secure_url")
 
 # monnify setup
@@ -117,7 +128,8 @@ def upload_image(image):
 
 
 
-def get_monnify_token():
+@gateway_operation("login")
+async def _fetch_monnify_token():
     """
     Fetch Monnify authentication token with enhanced error handling
     Ref: https://docs.monnify.com/v1.0/reference/authentication
@@ -134,15 +146,15 @@ def get_monnify_token():
         }
 
         # Authentication endpoint
-        auth_url = "https://api.monnify.com/api/v1/auth/login"
+        auth_url = "/api/v1/auth/login"
 
         # Make authentication request
-        response = requests.post(auth_url, headers=headers)
+        # Logging in again is harmless, so let the gateway retry it like a read.
+        response = await monnify.post(auth_url, headers=headers, idempotent=True)
 
-        # Log full response for debugging
-        logging.info(f"Monnify Auth Response Status: {response.status_code}")
-        logging.info(f"Monnify Auth Response Headers: {response.headers}")
-        logging.info(f"Monnify Auth Response Body: {response.text}")
+        # Status only: the body carries the access token.
+        logging.debug("Monnify auth response status %s", response.status_code,
+                      extra={"event": "monnify.auth.response"})
 
         # Check response status
         if response.status_code == 200:
@@ -150,17 +162,17 @@ def get_monnify_token():
             data = response.json()
 
             # Extract and return access token
-            access_token = data.get('responseBody', {}).get('accessToken')
+            response_body = data.get('responseBody', {})
+            access_token = response_body.get('accessToken')
 
             if not access_token:
                 logging.error("No access token found in Monnify response")
                 raise Exception("Failed to retrieve Monnify access token")
 
-            return access_token
+            return access_token, response_body.get('expiresIn', 0)
         else:
             # Detailed error logging
-            logging.error(f"Monnify Authentication Failed: {response.status_code}")
-            logging.error(f"Response Body: {response.text}")
+            logging.error("Monnify Authentication Failed: %s %s", response.status_code, response.text)
 
             # Raise specific exceptions based on response
             if response.status_code == 401:
@@ -170,14 +182,51 @@ def get_monnify_token():
             else:
                 raise Exception(f"Monnify Authentication Failed: {response.text}")
 
-    except requests.exceptions.RequestException as req_error:
-        logging.error(f"Monnify Request Error: {req_error}")
+    except httpx.HTTPError as req_error:
+        logging.error("Monnify Request Error: %s", req_error)
         raise Exception(f"Network Error: {req_error}")
     except Exception as e:
-        logging.error(f"Unexpected Monnify Authentication Error: {e}")
+        logging.error("Unexpected Monnify Authentication Error: %s", e)
         raise Exception("Failed to authenticate with Monnify")
 
 
+monnify_tokens = MonnifyTokenManager(_fetch_monnify_token)
+
+
+class MonnifyAuthError(ResilienceError):
+    """No Monnify access token could be obtained, so the call was never made."""
+
+
+async def get_monnify_token():
+    """Return a cached Monnify access token, refreshing it only when needed."""
+    return await monnify_tokens.get_token()
+
+
+async def monnify_request(send):
+    """
+    Call `send(token)` with a cached Monnify token.
+
+    A 401 means the cached token was revoked early, so force one refresh and
+    retry once with the new token.
+    """
+    try:
+        token = await get_monnify_token()
+    except Exception as e:
+        raise MonnifyAuthError(str(e)) from e
+    response = await send(token)
+    if response.status_code == 401:
+        token = await monnify_tokens.force_refresh(token)
+        response = await send(token)
+    return response
+
+
+def monnify_headers(token):
+    return {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json",
+    }
+
+
 
 # def create_reserved_account(user_id: str):
 #     """Create a Monnify Reserved Account for a user."""
@@ -211,15 +260,9 @@ def get_monnify_token():
 #     raise Exception("Failed to create reserved account")
 
 
-def create_reserved_account(account_reference, account_name, customer_email, bvn, customer_name=None):
+@gateway_operation("create_reserved_account")
+async def create_reserved_account(account_reference, account_name, customer_email, bvn, customer_name=None):
     """Create a general reserved account."""
-    token = get_monnify_token()
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-
     data = {
         "accountReference": account_reference,
         "accountName": account_name,
@@ -230,86 +273,70 @@ def create_reserved_account(account_reference, account_name, customer_email, bvn
         "getAllAvailableBanks": True,
     }
 
-    print("Monnify Request Data:", data)
+    logging.debug("Monnify reserved account request", extra={"event": "monnify.reserved_account.request", "payload": data})
 
     if customer_name:
         data["customerName"] = customer_name
 
     try:
-        response = requests.post(
-            "https://api.monnify.com/api/v2/bank-transfer/reserved-accounts",
+        response = await monnify_request(lambda token: monnify.post(
+            "/api/v2/bank-transfer/reserved-accounts",
             json=data,
-            headers=headers,
-        )
+            headers=monnify_headers(token),
+        ))
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": str(e)}
 
 
-def verify_deposit(payment_reference: str):
-    """Verify a deposit transaction from Monnify."""
-    token = get_monnify_token()
+@gateway_operation("get_reserved_account")
+async def get_reserved_account(account_reference):
+    """Fetch a reserved account by reference; returns None if Monnify has no such account."""
+    try:
+        response = await monnify_request(lambda token: monnify.get(
+            f"/api/v2/bank-transfer/reserved-accounts/{account_reference}",
+            headers=monnify_headers(token),
+        ))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        return {"error": str(e)}
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
 
-    response = requests.get(f"{MONNIFY_BASE_URL}/transactions/{payment_reference}", headers=headers)
+@gateway_operation("get_transaction")
+async def verify_deposit(payment_reference: str):
+    """Verify a deposit transaction from Monnify."""
+    response = await monnify_request(
+        lambda token: monnify.get(f"/api/v1/transactions/{payment_reference}", headers=monnify_headers(token))
+    )
 
     if response.status_code == 200:
         transaction = response.json()["responseBody"]
 
         if transaction["paymentStatus"] == "PAID":
-            user = users.find_one({"account_number": transaction["accountNumber"]})
+            users = get_db()["users"]
+            user = await users.find_one({"account_number": transaction["accountNumber"]}, {"_id": 1})
             if user:
-                new_balance = user["wallet_balance"] + float(transaction["amountPaid"])
-                users.update_one({"_id": user["_id"]}, {"$set": {"wallet_balance": new_balance}})
-
-                return {"message": "Deposit successful", "new_balance": new_balance}
+                # Same key as the webhook, so a deposit is credited once however it is confirmed.
+                reference = transaction.get("transactionReference") or payment_reference
+                credited = await wallet.credit_deposits(get_db(), [{
+                    "user_id": str(user["_id"]), "amount": float(transaction["amountPaid"]), "reference": reference,
+                }], "monnify")
+                balance = await users.find_one({"_id": user["_id"]}, wallet.BALANCE_PROJECTION)
+                return {
+                    "message": "Deposit successful",
+                    "credited": reference in credited,
+                    "new_balance": balance["wallet_balance"],
+                }
 
         return {"message": "Deposit pending or failed"}
 
     raise HTTPException(status_code=500, detail="Failed to verify deposit")
 
 
-def transfer_funds(user_id: str, amount: float, recipient_bank: str, recipient_account: str):
-    """Transfer funds from a Monnify Reserved Account to another bank."""
-    user = users.find_one({"_id": ObjectId(user_id)})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if user["wallet_balance"] < amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    token = get_monnify_token()
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-
-    data = {
-        "amount": amount,
-        "reference": f"TRANSFER_{ObjectId()}",
-        "narration": "Bank Transfer",
-        "destinationAccountNumber": recipient_account,
-        "destinationBankCode": recipient_bank,
-        "sourceAccountNumber": user["account_number"],
-        "currency": "NGN"
-    }
-
-    response = requests.post(f"{MONNIFY_BASE_URL}/transfer", json=data, headers=headers)
-
-    if response.status_code == 200:
-        new_balance = user["wallet_balance"] - amount
-        users.update_one({"_id": ObjectId(user_id)}, {"$set": {"wallet_balance": new_balance}})
-        return {"message": "Transfer successful", "new_balance": new_balance}
-
-    raise HTTPException(status_code=500, detail="Transfer failed")
-
-
 # def initiate_monnify_deposit(account_number: str, amount: float):
 #     """Initiate a deposit using Monnify Reserved Account"""
 #     token = get_monnify_token()
@@ -331,21 +358,17 @@ def transfer_funds(user_id: str, amount: float, recipient_bank: str, recipient_a
 #     return response.json()
 
 
-def get_all_banks():
+@gateway_operation("list_banks")
+async def get_all_banks():
     """Fetch all banks and their codes from Monnify."""
-    token = get_monnify_token()
-
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-
     try:
-        response = requests.get("https://api.monnify.com/api/v1/banks", headers=headers)
+        response = await monnify_request(
+            lambda token: monnify.get("/api/v1/banks", headers=monnify_headers(token))
+        )
         response.raise_for_status()
         return response.json()["responseBody"]
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to fetch banks from Monnify: {e}")
+    except httpx.HTTPError as e:
+        logging.error("Failed to fetch banks from Monnify: %s", e)
         return {"error": str(e)}
 
 
@@ -378,22 +401,14 @@ def get_all_banks():
 #         logging.error(f"Monnify Transfer Request Exception: {e}") #add logging
 #         return {"error": str(e)}
 
-def initiate_monnify_transfer(amount, reference, narration, destination_bank_code, destination_account_number,
-                              source_account_number):
+@gateway_operation("single_disbursement")
+async def initiate_monnify_transfer(amount, reference, narration, destination_bank_code, destination_account_number,
+                                    source_account_number):
     """
     Initiate a single transfer using Monnify API v2 disbursement endpoint
     Ref: https://docs.monnify.com/v1.0/reference/single-disbursement
     """
     try:
-        # Get authentication token
-        token = get_monnify_token()
-
-        # Prepare headers
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
-
         # Prepare request payload
         # Note: Carefully follow Monnify's documented payload structure
         payload = {
@@ -407,35 +422,28 @@ def initiate_monnify_transfer(amount, reference, narration, destination_bank_cod
             "sourceAccountNumber": MONNIFY_WALLET_ACCOUNT,  # Use the configured wallet account
         }
 
-        # Log detailed request information
-        logging.info("Monnify Transfer Request Payload:")
-        logging.info(json.dumps(payload, indent=2))
+        logging.debug("Monnify transfer request", extra={"event": "monnify.transfer.request", "payload": payload})
 
         # Make the API call
-        url = "https://api.monnify.com/api/v2/disbursements/single"
-        response = requests.post(url, json=payload, headers=headers)
-
-        # Log full response details
-        logging.info(f"Response Status Code: {response.status_code}")
-        logging.info(f"Response Headers: {response.headers}")
-
-        # Log full response text
-        full_response_text = response.text
-        logging.info(f"Full Response Text: {full_response_text}")
+        url = "/api/v2/disbursements/single"
+        response = await monnify_request(
+            lambda token: monnify.post(url, json=payload, headers=monnify_headers(token))
+        )
 
         # Try to parse JSON response
         try:
             response_data = response.json()
         except ValueError as json_error:
-            logging.error(f"JSON Parsing Error: {json_error}")
+            logging.error("JSON Parsing Error: %s (status %s)", json_error, response.status_code)
             return {
                 "status": False,
                 "error": "Unable to parse JSON response",
-                "raw_response": full_response_text
+                "raw_response": response.text
             }
 
-        # Comprehensive response handling
-        logging.info(f"Parsed Response Data: {response_data}")
+        logging.debug("Monnify transfer response", extra={
+            "event": "monnify.transfer.response", "status_code": response.status_code, "response": response_data,
+        })
 
         # Monnify's response structure might differ from our initial assumptions
         # Check the actual response structure
@@ -456,27 +464,85 @@ def initiate_monnify_transfer(amount, reference, narration, destination_bank_cod
                 "details": response_data
             }
 
-    except requests.exceptions.RequestException as req_error:
-        logging.error(f"Request Exception: {req_error}")
+    except httpx.HTTPError as req_error:
+        logging.error("Request Exception: %s", req_error)
         return {
             "status": False,
             "error": str(req_error),
-            "type": "request_exception"
+            "type": "request_exception",
+            "sent": was_sent(req_error),
         }
     except Exception as unexpected_error:
-        logging.error(f"Unexpected Error: {unexpected_error}")
+        logging.error("Unexpected Error: %s", unexpected_error)
         return {
             "status": False,
             "error": str(unexpected_error),
             "type": "unexpected_error"
         }
 
+
+def _monnify_account_not_found(response) -> bool:
+    """True when a name enquiry failed because the account doesn't exist (not auth, allow-list or a bad request)."""
+    if response.status_code not in (400, 404):
+        return False
+    try:
+        message = (response.json().get("responseMessage") or "").lower()
+    except ValueError:
+        return False
+    return any(phrase in message for phrase in MONNIFY_ACCOUNT_NOT_FOUND_MESSAGES)
+
+
+@gateway_operation("validate_account")
+async def resolve_monnify_account(account_number: str, bank_code: str):
+    """
+    Name enquiry: look up the holder of a bank account.
+
+    Returns the account name, None when the bank reports no such account, or
+    {"error": ...} when Monnify could not give an answer (including any other
+    4xx, so a credentials or allow-list problem is never cached as "invalid").
+    """
+    try:
+        response = await monnify_request(lambda token: monnify.get(
+            "/api/v1/disbursements/account/validate",
+            params={"accountNumber": account_number, "bankCode": bank_code},
+            headers=monnify_headers(token),
+        ))
+        if _monnify_account_not_found(response):
+            return None
+        response.raise_for_status()
+        return response.json()["responseBody"]["accountName"]
+    except httpx.HTTPError as e:
+        return {"error": str(e)}
+
+
+@gateway_operation("disbursement_summary")
+async def get_monnify_transfer_status(reference):
+    """
+    Look up a single disbursement by our reference.
+
+    Returns the transfer status string (e.g. "SUCCESS", "FAILED", "PENDING"),
+    None when Monnify has no transfer with that reference, or {"error": ...}.
+    """
+    try:
+        response = await monnify_request(lambda token: monnify.get(
+            "/api/v2/disbursements/single/summary",
+            params={"reference": reference},
+            headers=monnify_headers(token),
+        ))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["responseBody"]["status"]
+    except httpx.HTTPError as e:
+        return {"error": str(e)}
+
 # paystack transfer setup
 
 
-def create_transfer_recipient(account_number: str, bank_code: str):
+@gateway_operation("create_transfer_recipient")
+async def create_transfer_recipient(account_number: str, bank_code: str):
     """Create a transfer recipient on Paystack"""
-    url = "https://api.paystack.co/transferrecipient"
+    url = "/transferrecipient"
     headers = {
         "Authorization": f"Bearer {PAYSTACK_SECRET}",
         "Content-Type": "application/json"
@@ -491,19 +557,21 @@ def create_transfer_recipient(account_number: str, bank_code: str):
     }
 
     try:
-        response = requests.post(url, json=data, headers=headers)
+        # Paystack returns the existing recipient for an account it already knows, so this is safe to retry.
+        response = await paystack.post(url, json=data, headers=headers, idempotent=True)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Paystack Create Recipient Error: {str(e)}")
-        if hasattr(e, 'response'):
-            logging.error(f"Response content: {e.response.content}")
+    except httpx.HTTPError as e:
+        logging.error("Paystack Create Recipient Error: %s", e)
+        if isinstance(e, httpx.HTTPStatusError):
+            logging.debug("Paystack error response", extra={"event": "paystack.error.response", "body": e.response.text})
         return {"error": str(e)}
 
 
-def initiate_paystack_transfer(amount: float, recipient_code: str, reason: str = "Transfer"):
+@gateway_operation("transfer")
+async def initiate_paystack_transfer(amount: float, recipient_code: str, reason: str = "Transfer", reference=None):
     """Initiate a transfer using Paystack"""
-    url = "https://api.paystack.co/transfer"
+    url = "/transfer"
     headers = {
         "Authorization": f"Bearer {PAYSTACK_SECRET}",
         "Content-Type": "application/json"
@@ -517,32 +585,59 @@ def initiate_paystack_transfer(amount: float, recipient_code: str, reason: str =
         "recipient": recipient_code,
         "reason": reason
     }
+    if reference:
+        data["reference"] = reference
 
     try:
-        response = requests.post(url, json=data, headers=headers)
+        response = await paystack.post(url, json=data, headers=headers)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Paystack Transfer Error: {str(e)}")
-        if hasattr(e, 'response'):
-            logging.error(f"Response content: {e.response.content}")
+    except httpx.HTTPStatusError as e:
+        logging.error("Paystack Transfer Error: %s", e)
+        logging.debug("Paystack error response", extra={"event": "paystack.error.response", "body": e.response.text})
+        return {"error": str(e), "error_code": e.response.status_code}
+    except httpx.HTTPError as e:
+        logging.error("Paystack Transfer Error: %s", e)
+        return {"error": str(e), "sent": was_sent(e)}
+
+
+@gateway_operation("find_transfer")
+async def find_paystack_transfer(reference):
+    """
+    Look up a transfer by our reference.
+
+    Returns Paystack's transfer data (with `status` and `transfer_code`), None
+    when Paystack has no transfer with that reference, or {"error": ...}.
+    """
+    headers = {
+        "Authorization": f"Bearer {PAYSTACK_SECRET}",
+        "Content-Type": "application/json"
+    }
+    try:
+        response = await paystack.get(f"/transfer/verify/{reference}", headers=headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()["data"]
+    except httpx.HTTPError as e:
         return {"error": str(e)}
 
 
-def verify_paystack_transfer(transfer_code: str):
+@gateway_operation("verify_transfer")
+async def verify_paystack_transfer(transfer_code: str):
     """Verify a Paystack transfer status"""
-    url = f"https://api.paystack.co/transfer/verify/{transfer_code}"
+    url = f"/transfer/verify/{transfer_code}"
     headers = {
         "Authorization": f"Bearer {PAYSTACK_SECRET}",
         "Content-Type": "application/json"
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        response = await paystack.get(url, headers=headers)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Paystack Transfer Verification Error: {str(e)}")
-        if hasattr(e, 'response'):
-            logging.error(f"Response content: {e.response.content}")
+    except httpx.HTTPError as e:
+        logging.error("Paystack Transfer Verification Error: %s", e)
+        if isinstance(e, httpx.HTTPStatusError):
+            logging.debug("Paystack error response", extra={"event": "paystack.error.response", "body": e.response.text})
         return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,175 @@
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+import ledger
+import principals
+
+BALANCE_PROJECTION = {"wallet_balance": 1, "account_number": 1}
+# Journalled wallet credits still unapplied after this long are retried (see `apply_pending_credits`).
+WALLET_CREDIT_RETRY_AFTER = timedelta(seconds=int(os.getenv("WALLET_CREDIT_RETRY_AFTER_SECONDS", "60")))
+# How many recent credit txn_ids each wallet keeps, so applying the same credit again is a no-op.
+WALLET_RECENT_CREDITS = int(os.getenv("WALLET_RECENT_CREDITS", "100"))
+WALLET_CREDIT_PAGE_SIZE = 500
+
+
+async def debit(users, query: dict, amount: float):
+    """
+    Atomically take `amount` from the wallet matched by `query`.
+
+    The `wallet_balance >= amount` guard and the `$inc` happen in one
+    `find_one_and_update`, so concurrent debits can never overdraw the wallet
+    or overwrite each other. Returns the post-image, or None when the wallet
+    does not exist or has insufficient funds.
+    """
+    wallet = await users.find_one_and_update(
+        {**query, "wallet_balance": {"$gte": amount}},
+        {"$inc": {"wallet_balance": -amount}},
+        projection=BALANCE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if wallet is not None:
+        principals.invalidate(wallet["_id"])
+    return wallet
+
+
+async def credit(users, query: dict, amount: float):
+    """Atomically add `amount` to the wallet matched by `query`; returns the post-image or None."""
+    wallet = await users.find_one_and_update(
+        query,
+        {"$inc": {"wallet_balance": amount}},
+        projection=BALANCE_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if wallet is not None:
+        principals.invalidate(wallet["_id"])
+    return wallet
+
+
+def _user_id(entry):
+    return entry["account"].split(":", 1)[1]
+
+
+def _credit_update(entry):
+    """
+    (filter, update) applying wallet-side ledger `entry` to `wallet_balance`.
+
+    The filter skips wallets that already list the entry's txn_id in
+    `recent_credits`, so a credit retried after a failure is applied once.
+    """
+    return (
+        {"_id": ObjectId(_user_id(entry)), "recent_credits": {"$ne": entry["txn_id"]}},
+        {"$inc": {"wallet_balance": ledger.to_naira(entry["amount"])},
+         "$push": {"recent_credits": {"$each": [entry["txn_id"]], "$slice": -WALLET_RECENT_CREDITS}}},
+    )
+
+
+def _wallet_credits(entries):
+    """Flag the wallet-side entries among `entries` as not yet applied to `wallet_balance`."""
+    for entry in entries:
+        if entry["account"].startswith("wallet:"):
+            entry["applied"] = False
+    return entries
+
+
+async def apply_credits(db, entries):
+    """Apply journalled wallet credits to their wallets, each at most once, and mark them applied."""
+    if not entries:
+        return 0
+    result = await db["users"].bulk_write([UpdateOne(*_credit_update(entry)) for entry in entries], ordered=False)
+    await ledger.mark_applied(db, entries)
+    for entry in entries:
+        principals.invalidate(_user_id(entry))
+    return result.modified_count
+
+
+async def apply_pending_credits(db):
+    """
+    Apply wallet credits whose ledger entry is still unapplied: the credit
+    raised (a network error, a stepdown) or its worker died after journalling.
+    Returns how many wallets were credited.
+    """
+    applied = 0
+    query = ledger.unapplied_filter(datetime.utcnow() - WALLET_CREDIT_RETRY_AFTER)
+    while True:
+        entries = await db["ledger_entries"].find(query).limit(WALLET_CREDIT_PAGE_SIZE) \
+            .to_list(WALLET_CREDIT_PAGE_SIZE)
+        if not entries:
+            return applied
+        applied += await apply_credits(db, entries)
+
+
+async def credit_deposits(db, deposits, provider):
+    """
+    Journal and credit incoming deposits, each exactly once per reference.
+
+    `deposits` is a list of {"user_id", "amount", "reference"}. The ledger
+    entry is written first and its unique (txn_id, account) key decides which
+    caller credits the wallet, so concurrent or repeated processing of the same
+    deposit (a re-claimed webhook, a client re-verifying) credits it once. The
+    wallet-side entry stays flagged unapplied until the credit is made, so a
+    credit that fails is retried by `apply_pending_credits`. Returns the
+    references that were credited by this call.
+    """
+    entries = []
+    for deposit in deposits:
+        entries += ledger.journal_entries(
+            deposit["reference"], ledger.provider_account(provider), ledger.wallet_account(deposit["user_id"]),
+            ledger.to_kobo(deposit["amount"]), "deposit", reference=deposit["reference"],
+        )
+    inserted = await ledger.post_entries(db, _wallet_credits(entries))
+    credits = [entry for entry in inserted if entry["account"].startswith("wallet:")]
+    await apply_credits(db, credits)
+    return {entry["txn_id"] for entry in credits}
+
+
+async def reserve(db, user_id, amount: float, reference):
+    """
+    Debit `amount` for outgoing transfer `reference` and journal it into the in-flight account.
+
+    The transfer then leaves through `settle` or `refund`. Returns the
+    post-image, or None on insufficient funds.
+    """
+    wallet = await debit(db["users"], {"_id": ObjectId(user_id)}, amount)
+    if wallet is not None:
+        await ledger.post(
+            db, f"{reference}:reserve", ledger.wallet_account(user_id), ledger.IN_FLIGHT_ACCOUNT,
+            ledger.to_kobo(amount), "reserve", reference=reference,
+        )
+    return wallet
+
+
+async def settle(db, amount: float, reference, provider):
+    """Journal reserved transfer `reference` as paid out through `provider`. Re-settling is a no-op."""
+    await ledger.post(
+        db, reference, ledger.IN_FLIGHT_ACCOUNT, ledger.provider_account(provider),
+        ledger.to_kobo(amount), "transfer", reference=reference,
+    )
+
+
+async def refund(db, user_id, amount: float, reference, from_account=ledger.IN_FLIGHT_ACCOUNT):
+    """
+    Return `amount` for transfer `reference` to the wallet, at most once.
+
+    The refund is journalled first and the wallet credited only if that
+    journal entry is new, so repeated or concurrent refunds of one transfer
+    credit it once; a credit that fails is retried by `apply_pending_credits`.
+    Returns the post-image, or None if it was already refunded.
+    """
+    entries = ledger.journal_entries(
+        f"{reference}:refund", from_account, ledger.wallet_account(user_id),
+        ledger.to_kobo(amount), "refund", reference=reference,
+    )
+    credits = [entry for entry in await ledger.post_entries(db, _wallet_credits(entries))
+               if entry["account"].startswith("wallet:")]
+    if not credits:
+        return None
+    query, update = _credit_update(credits[0])
+    wallet = await db["users"].find_one_and_update(
+        query, update, projection=BALANCE_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    await ledger.mark_applied(db, credits)
+    principals.invalidate(user_id)
+    return wallet
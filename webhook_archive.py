@@ -0,0 +1,164 @@
+"""
+Compressed archive of raw provider webhook payloads.
+
+Deposit rows in `transactions` used to embed the whole Monnify `eventData` as
+`raw_webhook_data`, which made each deposit row several times larger and
+bloated the working set every history query and index scan pages through.
+The payload is only needed for disputes, so it now lives in
+`webhook_archive`, one document per event:
+
+    {_id: "<provider>:<reference>", provider, reference, codec, size, payload, archived_at}
+
+`payload` is the event BSON-encoded and compressed with zstd (zlib when the
+`zstandard` package isn't installed); `codec` records which, so archives
+written either way stay readable. Keying on `_id` makes a lookup a single
+primary-key hit and makes archiving idempotent: re-archiving an event (a
+reprocessed inbox batch, a re-run migration) is a no-op upsert.
+
+`migrate` moves legacy `raw_webhook_data` blobs out in batches; see
+`scripts/archive_webhook_payloads.py`.
+"""
+import os
+import zlib
+from datetime import datetime
+
+import bson
+from bson import Binary
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from database import get_db
+
+WEBHOOK_ARCHIVE_LEVEL = int(os.getenv("WEBHOOK_ARCHIVE_LEVEL", "3"))
+# Drop archived payloads after this long; 0 keeps them forever.
+WEBHOOK_ARCHIVE_RETENTION_SECONDS = int(os.getenv("WEBHOOK_ARCHIVE_RETENTION_SECONDS", "0"))
+WEBHOOK_ARCHIVE_BATCH_SIZE = int(os.getenv("WEBHOOK_ARCHIVE_BATCH_SIZE", "1000"))
+
+INDEXES = {
+    "webhook_archive": [
+        IndexModel([("archived_at", ASCENDING)], expireAfterSeconds=WEBHOOK_ARCHIVE_RETENTION_SECONDS),
+    ] if WEBHOOK_ARCHIVE_RETENTION_SECONDS else [],
+}
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC = "zstd" if zstandard else "zlib"
+_compressor = zstandard.ZstdCompressor(level=WEBHOOK_ARCHIVE_LEVEL) if zstandard else None
+
+archived = 0
+raw_bytes = 0
+stored_bytes = 0
+
+
+def compress(payload: dict):
+    """(BSON size, compressed BSON) of `payload`."""
+    data = bson.encode(payload)
+    compressed = _compressor.compress(data) if zstandard else zlib.compress(data, WEBHOOK_ARCHIVE_LEVEL)
+    return len(data), Binary(compressed)
+
+
+def decompress(codec: str, data: bytes) -> dict:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archived payload is zstd-compressed; install zstandard to read it")
+        return bson.decode(zstandard.ZstdDecompressor().decompress(data))
+    if codec == "zlib":
+        return bson.decode(zlib.decompress(data))
+    raise ValueError(f"Unknown archive codec {codec!r}")
+
+
+def archive_id(provider: str, reference: str) -> str:
+    return f"{provider}:{reference}"
+
+
+def archive_ops(provider: str, payloads: dict):
+    """
+    UpdateOne upserts archiving {reference: payload}; existing archives are left as they are.
+    Returns the ops and, per op, the (raw, stored) sizes of its payload.
+    """
+    now = datetime.utcnow()
+    ops, sizes = [], []
+    for reference, payload in payloads.items():
+        size, compressed = compress(payload)
+        sizes.append((size, len(compressed)))
+        ops.append(UpdateOne({"_id": archive_id(provider, reference)}, {"$setOnInsert": {
+            "provider": provider,
+            "reference": reference,
+            "codec": CODEC,
+            "size": size,
+            "payload": compressed,
+            "archived_at": now,
+        }}, upsert=True))
+    return ops, sizes
+
+
+async def archive(db, provider: str, payloads: dict):
+    """Archive {reference: payload}. Returns how many were new; only those count towards `stats`."""
+    global archived, raw_bytes, stored_bytes
+    ops, sizes = archive_ops(provider, payloads)
+    if not ops:
+        return 0
+    result = await db["webhook_archive"].bulk_write(ops, ordered=False)
+    # upserted_ids maps op index to _id, for the ops that inserted rather than matched an existing archive.
+    for index in result.upserted_ids:
+        archived += 1
+        raw_bytes += sizes[index][0]
+        stored_bytes += sizes[index][1]
+    return len(result.upserted_ids)
+
+
+async def load(provider: str, reference: str):
+    """The archived payload for an event, or None if it was never archived (or has expired)."""
+    doc = await get_db()["webhook_archive"].find_one({"_id": archive_id(provider, reference)})
+    if doc is None:
+        return None
+    return {
+        "provider": doc["provider"],
+        "reference": doc["reference"],
+        "archived_at": doc["archived_at"],
+        "payload": decompress(doc["codec"], doc["payload"]),
+    }
+
+
+async def migrate(db, batch_size=WEBHOOK_ARCHIVE_BATCH_SIZE, provider="monnify", progress=None):
+    """
+    Move `raw_webhook_data` out of `transactions` into the archive, `batch_size` rows at a time.
+
+    Each batch is archived before the blobs are unset, so a crash loses nothing
+    and a re-run picks up where it stopped. Returns the number of rows moved.
+    """
+    transactions = db["transactions"]
+    moved = 0
+    last_id = None
+    while True:
+        query = {"raw_webhook_data": {"$exists": True}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        rows = await transactions.find(query, {"reference": 1, "raw_webhook_data": 1}) \
+            .sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        if not rows:
+            return moved
+
+        # Rows without a reference can't be looked up later; key those by their transaction id.
+        await archive(db, provider, {
+            row.get("reference") or f"transaction:{row['_id']}": row["raw_webhook_data"] for row in rows
+        })
+        await transactions.update_many({"_id": {"$in": [row["_id"] for row in rows]}},
+                                       {"$unset": {"raw_webhook_data": ""}})
+        moved += len(rows)
+        last_id = rows[-1]["_id"]
+        if progress:
+            progress(moved)
+
+
+async def stats():
+    return {
+        "codec": CODEC,
+        "documents": await get_db()["webhook_archive"].estimated_document_count(),
+        "archived": archived,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "compression_ratio": raw_bytes / stored_bytes if stored_bytes else None,
+    }
@@ -0,0 +1,247 @@
+"""
+Durable inbox for provider webhooks.
+
+The webhook route only persists the raw event and acknowledges; worker tasks
+drain `webhook_inbox` in batches. Idempotency is enforced twice: a unique
+(provider, reference) key on the inbox drops provider retries at ingest, and
+the ledger's unique (txn_id, account) key decides which processing of an
+event credits the wallet, so a deposit is credited once even if its event is
+processed again (a re-claimed batch, a crash mid-batch) or the client also
+verifies it through `/verify-deposit/`.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import wallet
+import webhook_archive
+from database import get_db
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "200"))
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "0.5"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+# A batch still "processing" after this long belonged to a worker that died.
+WEBHOOK_CLAIM_TIMEOUT = timedelta(seconds=int(os.getenv("WEBHOOK_CLAIM_TIMEOUT_SECONDS", "60")))
+WEBHOOK_RETENTION_SECONDS = int(os.getenv("WEBHOOK_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+DUPLICATE_KEY = 11000
+
+INDEXES = {
+    "webhook_inbox": [
+        IndexModel([("provider", ASCENDING), ("reference", ASCENDING)], unique=True,
+                   partialFilterExpression={"reference": {"$gt": ""}}),
+        IndexModel([("status", ASCENDING), ("received_at", ASCENDING)]),
+        IndexModel([("claimed_by", ASCENDING)], sparse=True),
+        IndexModel([("processed_at", ASCENDING)], expireAfterSeconds=WEBHOOK_RETENTION_SECONDS),
+    ],
+}
+
+
+def parse_monnify_event(data: dict) -> dict:
+    """Flatten a Monnify webhook body into the fields the processor needs."""
+    # Extract event data and event type
+    event_data = data.get('eventData', data)
+
+    # Prefer the first payment source if multiple exist
+    payment_sources = event_data.get('paymentSourceInformation', [])
+    source_info = payment_sources[0] if payment_sources else {}
+
+    return {
+        "event_type": data.get('eventType'),
+        "payment_status": event_data.get("paymentStatus"),
+        "amount": float(source_info.get('amountPaid', event_data.get('amountPaid', 0))),
+        "account_number": event_data.get('destinationAccountInformation', {}).get('accountNumber'),
+        "source_account": source_info.get('accountNumber'),
+        "method": event_data.get('paymentMethod', 'ACCOUNT_TRANSFER'),
+        "reference": event_data.get('transactionReference'),
+        "event_data": event_data,
+    }
+
+
+async def ingest(provider: str, data: dict):
+    """Persist a raw webhook. Returns False when the event was already received."""
+    event_data = data.get('eventData', data)
+    try:
+        await get_db()["webhook_inbox"].insert_one({
+            "provider": provider,
+            "reference": event_data.get('transactionReference'),
+            "payload": data,
+            "status": "pending",
+            "attempts": 0,
+            "received_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return False
+    worker.wake()
+    return True
+
+
+async def stats():
+    """Inbox depth (events not yet processed) and lag (age of the oldest pending event)."""
+    inbox = get_db()["webhook_inbox"]
+    pending = await inbox.count_documents({"status": "pending"})
+    processing = await inbox.count_documents({"status": "processing"})
+    oldest = await inbox.find_one({"status": "pending"}, {"received_at": 1}, sort=[("received_at", ASCENDING)])
+    lag = (datetime.utcnow() - oldest["received_at"]).total_seconds() if oldest else 0.0
+    return {"pending": pending, "processing": processing, "depth": pending + processing, "lag_seconds": lag}
+
+
+async def _insert_transactions(transactions, docs):
+    """Insert deposit rows, skipping references that already exist."""
+    if not docs:
+        return
+    try:
+        await transactions.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+
+
+async def process_batch(db, events):
+    """
+    Apply a batch of claimed inbox events.
+
+    Returns {inbox _id: (status, message)} for every event in the batch.
+    """
+    users, transactions = db["users"], db["transactions"]
+    results = {}
+    parsed = {}
+    for event in events:
+        fields = parse_monnify_event(event["payload"])
+        if fields["event_type"] == "SUCCESSFUL_TRANSACTION" and fields["payment_status"] == "PAID":
+            parsed[event["_id"]] = fields
+        else:
+            results[event["_id"]] = ("ignored", "Unhandled event type")
+
+    account_numbers = list({fields["account_number"] for fields in parsed.values() if fields["account_number"]})
+    owners = {
+        user["account_number"]: user["_id"]
+        async for user in users.find({"account_number": {"$in": account_numbers}}, {"account_number": 1})
+    }
+
+    now = datetime.utcnow()
+    docs = []
+    payloads = {}
+    for event_id, fields in parsed.items():
+        user_id = owners.get(fields["account_number"])
+        if not fields["reference"]:
+            logging.error("Deposit webhook without a transaction reference for account %s", fields["account_number"])
+            results[event_id] = ("ignored", "Missing reference")
+            continue
+        if user_id is None:
+            logging.error("No user found for account %s", fields["account_number"])
+            results[event_id] = ("ignored", "No user found")
+            continue
+        payloads[fields["reference"]] = fields["event_data"]
+        docs.append({
+            "user_id": str(user_id),
+            "type": "deposit",
+            "amount": fields["amount"],
+            "reference": fields["reference"],
+            "method": fields["method"].lower(),
+            "status": "success",
+            "timestamp": now,
+            "source_account": fields["source_account"],
+        })
+
+    # The raw payload goes to the compressed archive, not the deposit row.
+    await webhook_archive.archive(db, "monnify", payloads)
+    await _insert_transactions(transactions, docs)
+    # Rows that already existed are journalled again too; the ledger credits each reference once.
+    applied = await wallet.credit_deposits(db, docs, "monnify")
+
+    for event_id, fields in parsed.items():
+        if event_id in results:
+            continue
+        if fields["reference"] in applied:
+            results[event_id] = ("done", "Deposit recorded")
+        else:
+            results[event_id] = ("done", "Deposit already recorded")
+    return results
+
+
+class InboxWorker:
+    def __init__(self):
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def start(self, workers=WEBHOOK_WORKERS):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            try:
+                drained = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Webhook inbox worker error: %s", e)
+                drained = 0
+            if drained < WEBHOOK_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), WEBHOOK_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self):
+        """Claim and process one batch. Returns the number of events processed."""
+        db = get_db()
+        inbox = db["webhook_inbox"]
+        now = datetime.utcnow()
+
+        await inbox.update_many(
+            {"status": "processing", "claimed_at": {"$lt": now - WEBHOOK_CLAIM_TIMEOUT}},
+            {"$set": {"status": "pending"}},
+        )
+
+        candidates = await inbox.find({"status": "pending"}, {"_id": 1}) \
+            .sort("received_at", ASCENDING).limit(WEBHOOK_BATCH_SIZE).to_list(WEBHOOK_BATCH_SIZE)
+        if not candidates:
+            return 0
+
+        claim = uuid.uuid4().hex
+        await inbox.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in candidates]}, "status": "pending"},
+            {"$set": {"status": "processing", "claimed_by": claim, "claimed_at": now}, "$inc": {"attempts": 1}},
+        )
+        events = await inbox.find({"claimed_by": claim, "status": "processing"}).to_list(None)
+        if not events:
+            return 0
+
+        try:
+            results = await process_batch(db, events)
+        except Exception as e:
+            logging.error("Webhook batch failed: %s", e)
+            await inbox.bulk_write([
+                UpdateOne({"_id": event["_id"]}, {"$set": {
+                    "status": "failed", "error": str(e), "processed_at": datetime.utcnow(),
+                } if event["attempts"] >= WEBHOOK_MAX_ATTEMPTS else {"status": "pending", "error": str(e)}})
+                for event in events
+            ], ordered=False)
+            return len(events)
+
+        processed_at = datetime.utcnow()
+        await inbox.bulk_write([
+            UpdateOne({"_id": event_id}, {"$set": {"status": status, "result": message, "processed_at": processed_at}})
+            for event_id, (status, message) in results.items()
+        ], ordered=False)
+        return len(events)
+
+
+worker = InboxWorker()